@@ -4,7 +4,8 @@ from flask_login import LoginManager, login_required, current_user
 import os
 
 # Import db from models
-from models import db
+from models import db, LOG_BIND
+from utils.database import log_database_url
 
 # Initialize extensions
 migrate = Migrate()
@@ -31,6 +32,29 @@ def create_app():
     
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     
+    # Audit, email and backup logs are kept in a separate database, so log writes
+    # never wait for the circulation write lock (see log_database_url for the default)
+    app.config['SQLALCHEMY_BINDS'] = {
+        LOG_BIND: os.environ.get('LOG_DATABASE_URL') or log_database_url(app.config['SQLALCHEMY_DATABASE_URI'])
+    }
+    
+    # Report cache shared by all worker processes on this host
+    app.config['REPORT_CACHE_PATH'] = os.environ.get('REPORT_CACHE_PATH') or os.path.join(app.instance_path, 'report_cache.db')
+    os.makedirs(os.path.dirname(os.path.abspath(app.config['REPORT_CACHE_PATH'])), exist_ok=True)
+    
+    # Files written by background report jobs
+    app.config['REPORT_JOB_DIR'] = os.environ.get('REPORT_JOB_DIR') or os.path.join(app.instance_path, 'report_jobs')
+    os.makedirs(app.config['REPORT_JOB_DIR'], exist_ok=True)
+    
+    # Compressed monthly segments written by archive_audit_log.py
+    app.config['AUDIT_ARCHIVE_DIR'] = os.environ.get('AUDIT_ARCHIVE_DIR') or os.path.join(app.instance_path, 'audit_archive')
+    os.makedirs(app.config['AUDIT_ARCHIVE_DIR'], exist_ok=True)
+    
+    # Audit entries are written by a background thread ('async') or as they are logged ('sync');
+    # AUDIT_QUEUE_FULL_POLICY is 'block', 'drop' or 'sync' for when the queue is full
+    app.config['AUDIT_WRITER_MODE'] = os.environ.get('AUDIT_WRITER_MODE', 'async')
+    app.config['AUDIT_QUEUE_FULL_POLICY'] = os.environ.get('AUDIT_QUEUE_FULL_POLICY', 'block')
+    
     # Initialize extensions with app
     db.init_app(app)
     migrate.init_app(app, db)
@@ -78,12 +102,48 @@ def create_app():
     
     # Create database tables and seed data
     with app.app_context():
+        from utils.database import configure_engine
+        for engine in db.engines.values():
+            configure_engine(engine)
+        
+        # Commit-time hooks that keep cached summaries in step with writes
+        from utils.write_tracking import init_write_tracking
+        from utils.dashboard_summary import init_dashboard_cache
+        from utils.report_cache import init_report_cache
+        init_write_tracking()
+        init_dashboard_cache()
+        init_report_cache(app)
+        
+        # Background writer for log_action()
+        from utils.audit_logger import init_audit_writer
+        init_audit_writer(app)
+        
         db.create_all()
         
         # Check if we need to seed initial data
         if not User.query.first():
             from utils.seed_data import seed_initial_data
             seed_initial_data()
+        
+        # Full-text index for catalogue search (FTS5 / tsvector)
+        from utils.catalogue_search import init_search_index
+        init_search_index(app)
+        
+        # Full-text index over audit details (FTS5 / tsvector)
+        from utils.audit_search import init_audit_search_index
+        init_audit_search_index(app)
+        
+        # Exact-match lookup table for student and staff ID numbers
+        from utils.borrower_lookup import init_identifier_index
+        init_identifier_index(app)
+        
+        # Daily circulation rollups read by reports and charts
+        from utils.rollups import init_rollups
+        init_rollups(app)
+        
+        # Distinct actions and entity types for the audit log filters
+        from utils.audit_logger import init_audit_log_values
+        init_audit_log_values(app)
     
     return app
 
@@ -0,0 +1,48 @@
+#!/usr/bin/env python3
+"""
+Audit Log Archival Script
+
+Moves audit entries older than the retention horizon out of the audit_log
+table into compressed monthly segment files (gzip NDJSON) in
+AUDIT_ARCHIVE_DIR, indexed by the audit_archive_segment table. Only whole
+months are archived; running it again merges late entries into the
+month's existing segment. Archived months stay searchable from the audit
+browser and entity history with "Include archived months".
+
+Usage:
+    python archive_audit_log.py              # Archive months older than 365 days
+    python archive_audit_log.py --days 180   # Use a different horizon
+"""
+
+import argparse
+import sys
+from datetime import datetime, timedelta
+from main import app
+from models import db
+from utils.audit_archive import AUDIT_RETENTION_DAYS, archive_audit_log
+
+def main():
+    parser = argparse.ArgumentParser(description='Move old audit entries into compressed monthly segments')
+    parser.add_argument('--days', type=int, default=AUDIT_RETENTION_DAYS,
+                        help=f'Keep entries newer than this many days in audit_log (default {AUDIT_RETENTION_DAYS})')
+
+    args = parser.parse_args()
+
+    if args.days < 1:
+        print(f"✗ Invalid number of days: {args.days}")
+        sys.exit(1)
+
+    cutoff = datetime.utcnow() - timedelta(days=args.days)
+
+    def progress(month, moved):
+        print(f"  {month}: {moved} entries archived")
+
+    # Use Flask app context
+    with app.app_context():
+        total = archive_audit_log(cutoff, progress=progress)
+        db.session.remove()
+
+        print(f"✓ Archived {total} audit entries older than {cutoff.strftime('%Y-%m-%d')}")
+
+if __name__ == '__main__':
+    main()
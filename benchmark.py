@@ -0,0 +1,306 @@
+#!/usr/bin/env python3
+"""
+Performance Benchmark for Library System
+
+Builds a large synthetic library in a throwaway SQLite database and times
+the busiest pages through the Flask test client.
+
+Scenarios:
+    indexes    Dashboard, overdue report and audit list with the query
+               indexes dropped ("before") and then recreated ("after")
+    audit      Commits (main and log database) and SQL statements per
+               request on the write pages that are audited (add/edit,
+               borrow, fines)
+    search     Audit detail search with substring matching ("before") and
+               the full-text index ("after")
+
+Usage:
+    python benchmark.py                                  # Default sizes
+    python benchmark.py --books 20000 --students 20000 --loans 500000 --audit 500000
+    python benchmark.py --scenario audit --loans 20000 --repeat 20
+"""
+
+import argparse
+import os
+import random
+import statistics
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+def build_dataset(db, args):
+    """Bulk insert synthetic books, members, loans, fines, emails and audit rows"""
+    from models import Book, Category, Student, Staff, BorrowRecord, Fine, AuditLog, EmailLog
+
+    rng = random.Random(42)
+    now = datetime.utcnow()
+    categories = [c.id for c in Category.query.all()]
+
+    db.session.execute(db.insert(Book), [
+        {'title': f'Synthetic Title {i}', 'author': f'Author {i % 500}', 'unique_id': f'SYN-{i:06d}',
+         'category_id': rng.choice(categories), 'total_copies': rng.randint(1, 5), 'borrowed_count': 0}
+        for i in range(args.books)
+    ])
+    db.session.execute(db.insert(Student), [
+        {'name': f'Student {i}', 'registration_number': f'SYN/{i:06d}', 'email': f'student{i}@example.com'}
+        for i in range(args.students)
+    ])
+    db.session.execute(db.insert(Staff), [
+        {'name': f'Staff {i}', 'staff_type': 'teacher'} for i in range(max(args.students // 100, 1))
+    ])
+    db.session.commit()
+
+    book_ids = [row[0] for row in db.session.query(Book.id)]
+    student_ids = [row[0] for row in db.session.query(Student.id)]
+    staff_ids = [row[0] for row in db.session.query(Staff.id)]
+
+    # Mostly returned history, with a tail of open and overdue loans
+    loans = []
+    for i in range(args.loans):
+        borrowed_at = now - timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60))
+        is_student = rng.random() < 0.9
+        due_date = borrowed_at + timedelta(days=3 if is_student else 30)
+        returned_at = None if rng.random() < 0.02 else borrowed_at + timedelta(days=rng.randint(0, 6))
+        loans.append({
+            'book_id': rng.choice(book_ids),
+            'student_id': rng.choice(student_ids) if is_student else None,
+            'staff_id': None if is_student else rng.choice(staff_ids),
+            'borrowed_at': borrowed_at,
+            'due_date': due_date,
+            'returned_at': returned_at
+        })
+    db.session.execute(db.insert(BorrowRecord), loans)
+
+    db.session.execute(db.insert(Fine), [
+        {'student_id': rng.choice(student_ids), 'borrow_record_id': rng.randint(1, args.loans),
+         'amount': 20.0 * rng.randint(1, 10), 'original_amount': 20.0, 'paid': rng.random() < 0.7,
+         'waived': False, 'created_at': now - timedelta(days=rng.randint(0, 730))}
+        for _ in range(args.loans // 20)
+    ])
+    db.session.execute(db.insert(EmailLog), [
+        {'recipient_email': 'reader@example.com', 'subject': 'Reminder', 'body': '...',
+         'email_type': rng.choice(['due_reminder', 'overdue_notice']),
+         'status': 'sent' if rng.random() < 0.95 else 'failed', 'sent_at': now - timedelta(days=rng.randint(0, 730))}
+        for _ in range(args.loans // 10)
+    ])
+    db.session.execute(db.insert(AuditLog), [
+        {'user_id': 1, 'action': rng.choice(['BORROW_BOOK', 'RETURN_BOOK', 'PAY_FINE', 'SEND_EMAIL', 'UPDATE_BOOK']),
+         'entity_type': rng.choice(['BorrowRecord', 'Fine', 'Email', 'Book']), 'entity_id': rng.randint(1, args.loans),
+         'details': f'{{"registration_number": "P15/{rng.randint(1, args.students)}/2023"}}', 'timestamp': now - timedelta(minutes=rng.randint(0, 2 * 365 * 24 * 60))}
+        for _ in range(args.audit)
+    ])
+    db.session.commit()
+
+    from utils.circulation import repair_borrowed_counts
+    from utils.rollups import rebuild_rollups
+    from utils.audit_logger import rebuild_audit_log_values
+    repair_borrowed_counts()
+    rebuild_rollups()
+    rebuild_audit_log_values()
+    db.session.commit()
+
+def time_page(client, url, repeat):
+    """Return the median latency of a page in milliseconds"""
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        response = client.get(url)
+        timings.append((time.perf_counter() - start) * 1000)
+        assert response.status_code == 200, f'{url} returned {response.status_code}'
+    return statistics.median(timings)
+
+def analyze(db):
+    """Refresh planner statistics in every database"""
+    for engine in db.engines.values():
+        with engine.begin() as connection:
+            connection.exec_driver_sql('ANALYZE')
+
+def run_indexes(app, db, args):
+    """Time the hot pages without and with the declared query indexes"""
+    pages = [
+        ('Dashboard', '/dashboard/'),
+        ('Overdue report', '/reports/overdue-items'),
+        ('Audit list', '/audit/'),
+        ('Audit by action', '/audit/?action=PAY_FINE&user_id=1'),
+    ]
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'admin123'})
+
+    results = {}
+    with app.app_context():
+        # (index, engine of the database holding its table)
+        indexes = [(index, db.engines[key]) for key, metadata in db.metadatas.items()
+                   for table in metadata.tables.values() for index in table.indexes]
+        for index, engine in indexes:
+            index.drop(engine, checkfirst=True)
+        analyze(db)
+    results['before'] = {name: time_page(client, url, args.repeat) for name, url in pages}
+
+    with app.app_context():
+        for index, engine in indexes:
+            index.create(engine, checkfirst=True)
+        analyze(db)
+    results['after'] = {name: time_page(client, url, args.repeat) for name, url in pages}
+
+    print(f"{'Page':<20}{'Before (ms)':>14}{'After (ms)':>14}{'Speed-up':>10}")
+    for name, _ in pages:
+        before, after = results['before'][name], results['after'][name]
+        print(f"{name:<20}{before:>14.1f}{after:>14.1f}{before / after:>9.1f}x")
+
+def run_audit(app, db, args):
+    """Count database round trips per request on the audited write pages"""
+    from sqlalchemy import event
+    from models import Book, Fine, Student
+    from utils.audit_logger import flush_audit_log
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'admin123'})
+
+    with app.app_context():
+        books = [row[0] for row in db.session.query(Book.id).filter(
+            Book.total_copies - Book.borrowed_count > 0
+        ).limit(args.repeat)]
+        fines = [row[0] for row in db.session.query(Fine.id).filter(
+            Fine.paid == False, Fine.waived == False
+        ).limit(2 * args.repeat)]
+        student = db.session.query(Student.id, Student.registration_number, Student.email).filter(
+            Student.registration_number.isnot(None)
+        ).first()
+
+    # Each borrow goes to a student added by the benchmark, below the loan limit
+    new_students = []
+
+    def add_student(i):
+        response = client.post('/students/add', data={
+            'name': f'Benchmark Student {i}', 'registration_number': f'BENCH/{i:06d}', 'email': f'bench{i}@example.com'
+        })
+        new_students.append(i)
+        return response
+
+    def borrow_book(i):
+        with app.app_context():
+            student_id = db.session.query(Student.id).filter(
+                Student.registration_number == f'BENCH/{new_students[i]:06d}'
+            ).scalar()
+        return client.post('/borrowing/borrow', data={
+            'book_id': books[i], 'borrower_type': 'student', 'student_id': student_id
+        })
+
+    requests = [
+        ('Add student', add_student),
+        ('Edit student', lambda i: client.post(f'/students/{student.id}/edit', data={
+            'name': f'Edited Student {i}', 'registration_number': student.registration_number, 'email': student.email
+        })),
+        ('Add book', lambda i: client.post('/books/add', data={
+            'title': f'Benchmark Title {i}', 'unique_id': f'BENCH-{i:06d}', 'isbn': f'BENCH-{i:06d}', 'total_copies': 2
+        })),
+        ('Borrow book', borrow_book),
+        ('Pay fine', lambda i: client.post(f'/fines/{fines[i]}/pay')),
+        ('Adjust fine', lambda i: client.post(f'/fines/{fines[args.repeat + i]}/adjust', data={
+            'action_type': 'adjust', 'new_amount': 10, 'reason': 'Benchmark'
+        })),
+    ]
+
+    # Commits are counted per database: main and log (models.LOG_BIND)
+    counts = {'commits': 0, 'log_commits': 0, 'statements': 0}
+    with app.app_context():
+        engines = dict(db.engines)
+
+    def count_commit(conn):
+        counts['commits' if conn.engine is engines[None] else 'log_commits'] += 1
+
+    def count_statement(conn, cursor, statement, parameters, context, executemany):
+        counts['statements'] += 1
+
+    for engine in engines.values():
+        event.listen(engine, 'commit', count_commit)
+        event.listen(engine, 'before_cursor_execute', count_statement)
+    try:
+        print(f"{'Request':<16}{'Commits':>10}{'Log commits':>13}{'Statements':>12}{'Median (ms)':>14}")
+        for name, send in requests:
+            commits, log_commits, statements, timings = [], [], [], []
+            for i in range(min(args.repeat, len(books), len(fines) // 2)):
+                counts.update(commits=0, log_commits=0, statements=0)
+                start = time.perf_counter()
+                response = send(i)
+                timings.append((time.perf_counter() - start) * 1000)
+                assert response.status_code == 302, f'{name} returned {response.status_code}'
+                # Copying entries from the outbox to the log database counts towards the request
+                with app.app_context():
+                    flush_audit_log()
+                commits.append(counts['commits'])
+                log_commits.append(counts['log_commits'])
+                statements.append(counts['statements'])
+            print(f"{name:<16}{statistics.median(commits):>10.0f}{statistics.median(log_commits):>13.0f}"
+                  f"{statistics.median(statements):>12.0f}{statistics.median(timings):>14.1f}")
+    finally:
+        for engine in engines.values():
+            event.remove(engine, 'commit', count_commit)
+            event.remove(engine, 'before_cursor_execute', count_statement)
+
+def run_search(app, db, args):
+    """Time audit detail searches with substring matching and with the full-text index"""
+    searches = [
+        ('Registration no.', '/audit/?q=P15/1234/2023'),
+        ('Two words', '/audit/?q=registration 2023'),
+        ('No match', '/audit/?q=nonexistent'),
+    ]
+
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'admin123'})
+
+    backend = app.config['AUDIT_SEARCH_BACKEND']
+    results = {}
+    app.config['AUDIT_SEARCH_BACKEND'] = 'like'
+    results['before'] = {name: time_page(client, url, args.repeat) for name, url in searches}
+    app.config['AUDIT_SEARCH_BACKEND'] = backend
+    results['after'] = {name: time_page(client, url, args.repeat) for name, url in searches}
+
+    print(f"{'Search':<20}{'Before (ms)':>14}{'After (ms)':>14}{'Speed-up':>10}")
+    for name, _ in searches:
+        before, after = results['before'][name], results['after'][name]
+        print(f"{name:<20}{before:>14.1f}{after:>14.1f}{before / after:>9.1f}x")
+
+SCENARIOS = {
+    'indexes': run_indexes,
+    'audit': run_audit,
+    'search': run_search,
+}
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark library pages on a large synthetic dataset')
+    parser.add_argument('--scenario', choices=sorted(SCENARIOS), default='indexes', help='What to benchmark')
+    parser.add_argument('--books', type=int, default=10000, help='Number of titles')
+    parser.add_argument('--students', type=int, default=10000, help='Number of students')
+    parser.add_argument('--loans', type=int, default=200000, help='Number of borrow records')
+    parser.add_argument('--audit', type=int, default=200000, help='Number of audit log rows')
+    parser.add_argument('--repeat', type=int, default=5, help='Requests per page (median is reported)')
+
+    args = parser.parse_args()
+
+    # Point the application at a throwaway database before it is imported
+    db_dir = tempfile.mkdtemp(prefix='library_benchmark_')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(db_dir, 'benchmark.db')
+    os.environ['LOG_DATABASE_URL'] = 'sqlite:///' + os.path.join(db_dir, 'benchmark_logs.db')
+    # Nothing may be left in (or served from) the real instance's cache and files
+    os.environ['REPORT_CACHE_PATH'] = os.path.join(db_dir, 'report_cache.db')
+    os.environ['REPORT_JOB_DIR'] = os.path.join(db_dir, 'report_jobs')
+    os.environ['AUDIT_ARCHIVE_DIR'] = os.path.join(db_dir, 'audit_archive')
+    os.environ.setdefault('SESSION_SECRET', 'benchmark')
+
+    from app import create_app
+    from models import db
+
+    app = create_app()
+
+    print("Building synthetic dataset...")
+    start = time.perf_counter()
+    with app.app_context():
+        build_dataset(db, args)
+    print(f"✓ Built in {time.perf_counter() - start:.1f}s "
+          f"({args.books} books, {args.students} students, {args.loans} loans, {args.audit} audit rows)")
+
+    SCENARIOS[args.scenario](app, db, args)
+
+if __name__ == '__main__':
+    main()
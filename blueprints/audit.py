@@ -1,7 +1,13 @@
 from flask import Blueprint, render_template, request, jsonify, flash, redirect, url_for
 from flask_login import login_required, current_user
 from models import AuditLog, User, db
-from utils.audit_logger import get_audit_logs, get_entity_history
+from sqlalchemy.orm import selectinload
+from utils.audit_archive import archived_entries
+from utils.audit_logger import get_audit_logs, get_entity_history, flush_audit_log, audit_log_values
+from utils.audit_search import search_audit_query
+from utils.pagination import keyset_page, decode_cursor, encode_cursor
+from utils.report_cache import cached_report
+from itertools import islice
 import json
 
 audit_bp = Blueprint('audit', __name__)
@@ -13,14 +19,22 @@ def list_audit_logs():
         flash('Access denied. Admin privileges required.', 'error')
         return redirect(url_for('dashboard.index'))
     
+    # Include entries still queued by this process
+    flush_audit_log()
+    
     # Get filters from request
     entity_type = request.args.get('entity_type', '')
     action = request.args.get('action', '')
-    user_id = request.args.get('user_id', '')
-    limit = int(request.args.get('limit', 100))
+    user_id = request.args.get('user_id', type=int)
+    limit = request.args.get('limit', 100, type=int)
+    cursor = request.args.get('cursor')
+    archived = request.args.get('archived') == '1'
+    search = request.args.get('q', '').strip()
+    page = request.args.get('page', 1, type=int)
     
-    # Apply filters
-    query = AuditLog.query
+    # Apply filters; each combination has an index ending in (timestamp, id).
+    # Users are in the main database, so they are loaded in a second query
+    query = AuditLog.query.options(selectinload(AuditLog.user))
     
     if entity_type:
         query = query.filter(AuditLog.entity_type == entity_type)
@@ -29,27 +43,44 @@ def list_audit_logs():
         query = query.filter(AuditLog.action == action)
     
     if user_id:
-        query = query.filter(AuditLog.user_id == int(user_id))
-    
-    # Get paginated results
-    page = request.args.get('page', 1, type=int)
-    per_page = min(limit, 100)  # Maximum 100 per page
-    
-    audit_logs = query.order_by(AuditLog.timestamp.desc()).paginate(
-        page=page, per_page=per_page, error_out=False
-    )
-    
-    # Get unique entity types and actions for filter dropdowns
-    entity_types = db.session.query(AuditLog.entity_type.distinct()).all()
-    entity_types = [et[0] for et in entity_types]
-    
-    actions = db.session.query(AuditLog.action.distinct()).all()
-    actions = [a[0] for a in actions]
-    
-    users = User.query.all()
+        query = query.filter(AuditLog.user_id == user_id)
+    
+    per_page = max(1, min(limit, 100))  # Maximum 100 per page
+    pagination = None
+    
+    if search:
+        # Ranked matches from the full-text index over details, by page
+        pagination = search_audit_query(search, query).paginate(page=page, per_page=per_page, error_out=False)
+        logs, next_cursor = pagination.items, None
+    else:
+        # Newest first, seeking past the last entry of the previous page
+        logs, next_cursor = keyset_page(query, AuditLog.timestamp, AuditLog.id,
+                                        cursor=cursor, per_page=per_page, descending=True)
+    
+    # Past the oldest entry in audit_log, continue into the archived months
+    if archived and not search and not next_cursor:
+        before = (logs[-1].timestamp, logs[-1].id) if logs else decode_cursor(cursor)
+        if before and before[0] is None:
+            # Nothing dated is left below an undated last entry, so every
+            # archived month follows it
+            before = None
+        wanted = per_page - len(logs)
+        older = list(islice(archived_entries(entity_type=entity_type, action=action, user_id=user_id,
+                                             before=before), wanted + 1))
+        logs = logs + older[:wanted]
+        if len(older) > wanted:
+            next_cursor = encode_cursor(logs[-1].timestamp, logs[-1].id)
+
+    # Filter dropdowns, from the maintained lookup table
+    entity_types = audit_log_values('entity_type')
+    actions = audit_log_values('action')
+    users = db.session.query(User.id, User.username).order_by(User.username).all()
     
     return render_template('audit/list.html', 
-                         audit_logs=audit_logs,
+                         logs=logs,
+                         cursor=cursor,
+                         next_cursor=next_cursor,
+                         pagination=pagination,
                          entity_types=entity_types,
                          actions=actions,
                          users=users,
@@ -57,7 +88,9 @@ def list_audit_logs():
                              'entity_type': entity_type,
                              'action': action,
                              'user_id': user_id,
-                             'limit': limit
+                             'limit': limit,
+                             'archived': archived,
+                             'q': search
                          })
 
 @audit_bp.route('/entity/<entity_type>/<int:entity_id>')
@@ -68,10 +101,13 @@ def entity_history(entity_type, entity_id):
         return redirect(url_for('dashboard.index'))
     
     # Get entity history
-    history = get_entity_history(entity_type, entity_id)
+    flush_audit_log()
+    archived = request.args.get('archived') == '1'
+    logs = get_entity_history(entity_type, entity_id, include_archived=archived)
     
     return render_template('audit/entity_history.html', 
-                         history=history,
+                         logs=logs,
+                         archived=archived,
                          entity_type=entity_type,
                          entity_id=entity_id)
 
@@ -104,6 +140,7 @@ def log_details(log_id):
 
 @audit_bp.route('/statistics')
 @login_required
+@cached_report('audit_statistics', {'audit_log', 'user'})
 def audit_statistics():
     if current_user.role != 'admin':
         flash('Access denied. Admin privileges required.', 'error')
@@ -124,20 +161,32 @@ def audit_statistics():
         db.func.count(AuditLog.id).label('count')
     ).group_by(AuditLog.entity_type).order_by(db.func.count(AuditLog.id).desc()).all()
     
-    # User activity
-    user_stats = db.session.query(
-        User.username,
+    # User activity, counted in the log database and named from the main one
+    user_counts = db.session.query(
+        AuditLog.user_id,
         db.func.count(AuditLog.id).label('count')
-    ).join(AuditLog).group_by(User.id).order_by(db.func.count(AuditLog.id).desc()).limit(10).all()
-    
-    # Recent activity (last 24 hours)
+    ).group_by(AuditLog.user_id).order_by(db.func.count(AuditLog.id).desc()).all()
+    usernames = dict(db.session.query(User.id, User.username).filter(
+        User.id.in_([row.user_id for row in user_counts[:10]])
+    ))
+    top_users = [
+        {'username': usernames.get(row.user_id, f'User #{row.user_id}'), 'action_count': row.count}
+        for row in user_counts[:10]
+    ]
+    
+    # Recent activity (today, and the last 7 days)
     from datetime import datetime, timedelta
-    yesterday = datetime.utcnow() - timedelta(days=1)
-    recent_activity = AuditLog.query.filter(AuditLog.timestamp >= yesterday).count()
+    now = datetime.utcnow()
+    todays_actions = AuditLog.query.filter(
+        AuditLog.timestamp >= now.replace(hour=0, minute=0, second=0, microsecond=0)
+    ).count()
+    weekly_actions = AuditLog.query.filter(AuditLog.timestamp >= now - timedelta(days=7)).count()
     
     return render_template('audit/statistics.html',
-                         total_logs=total_logs,
-                         action_stats=action_stats,
+                         total_actions=total_logs,
+                         active_users=len(user_counts),
+                         todays_actions=todays_actions,
+                         weekly_actions=weekly_actions,
+                         action_types=action_stats,
                          entity_stats=entity_stats,
-                         user_stats=user_stats,
-                         recent_activity=recent_activity)
\ No newline at end of file
+                         top_users=top_users)
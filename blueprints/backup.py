@@ -4,8 +4,10 @@ import shutil
 from datetime import datetime
 from flask import Blueprint, render_template, request, redirect, url_for, flash, send_file
 from flask_login import login_required, current_user
-from models import BackupLog, db
+from sqlalchemy.orm import selectinload
+from models import BackupLog, LOG_BIND, db
 from utils.audit_logger import log_action
+from utils.database import begin_write_transaction
 
 backup_bp = Blueprint('backup', __name__)
 
@@ -16,7 +18,8 @@ def list_backups():
         flash('Access denied. Admin privileges required.', 'error')
         return redirect(url_for('dashboard.index'))
     
-    backups = BackupLog.query.order_by(BackupLog.created_at.desc()).all()
+    # Users are in the main database, so they are loaded in a second query
+    backups = BackupLog.query.options(selectinload(BackupLog.created_by_user)).order_by(BackupLog.created_at.desc()).all()
     
     # Check if backup directory exists
     backup_dir = 'backups'
@@ -47,7 +50,8 @@ def create_backup():
         source_db = 'confucius_library.db'
         
         if os.path.exists(source_db):
-            # Use SQLite backup API for consistency
+            # Use SQLite backup API for consistency; audit, email and backup
+            # logs are in the log database, which backups leave alone
             source_conn = sqlite3.connect(source_db)
             backup_conn = sqlite3.connect(backup_path)
             
@@ -62,6 +66,7 @@ def create_backup():
             # Create backup log entry
             description = request.form.get('description', f'Manual backup created by {current_user.username}')
             
+            begin_write_transaction(LOG_BIND)
             backup_log = BackupLog(
                 filename=backup_filename,
                 created_by=current_user.id,
@@ -71,9 +76,9 @@ def create_backup():
             )
             
             db.session.add(backup_log)
-            db.session.commit()
+            db.session.flush()
             
-            # Log the action
+            # Log the action in the same transaction
             log_action(
                 action='CREATE_BACKUP',
                 entity_type='Backup',
@@ -84,6 +89,7 @@ def create_backup():
                     'description': description
                 }
             )
+            db.session.commit()
             
             flash(f'Backup created successfully: {backup_filename}', 'success')
             
@@ -192,7 +198,9 @@ def delete_backup(backup_id):
         if os.path.exists(backup_path):
             os.remove(backup_path)
         
-        # Log the deletion
+        # Remove from database, logging the deletion in the same transaction
+        begin_write_transaction(LOG_BIND)
+        db.session.delete(backup_log)
         log_action(
             action='DELETE_BACKUP',
             entity_type='Backup',
@@ -201,9 +209,6 @@ def delete_backup(backup_id):
                 'filename': backup_log.filename
             }
         )
-        
-        # Remove from database
-        db.session.delete(backup_log)
         db.session.commit()
         
         flash(f'Backup {backup_log.filename} deleted successfully', 'success')
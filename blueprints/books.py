@@ -1,8 +1,10 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
-from flask_login import login_required
+from flask_login import login_required, current_user
 from models import Book, Category, BorrowRecord, db
-from sqlalchemy import or_
 from utils.audit_logger import log_action
+from utils.catalogue_search import search_books_query, index_book
+from utils.catalogue_import import import_catalogue, detect_format, CatalogueImportError
+from utils.database import begin_write_transaction
 
 books_bp = Blueprint('books', __name__)
 
@@ -11,27 +13,25 @@ books_bp = Blueprint('books', __name__)
 def list_books():
     search = request.args.get('search', '')
     category_id = request.args.get('category_id', '')
+    page = request.args.get('page', 1, type=int)
     
     query = Book.query
     
-    if search:
-        query = query.filter(
-            or_(
-                Book.title.contains(search),
-                Book.author.contains(search),
-                Book.isbn.contains(search),
-                Book.unique_id.contains(search)
-            )
-        )
-    
     if category_id:
         query = query.filter_by(category_id=category_id)
     
-    books = query.all()
+    if search:
+        # Relevance-ranked full-text match
+        query = search_books_query(search, query)
+    else:
+        query = query.order_by(Book.title)
+    
+    pagination = query.paginate(page=page, per_page=50, error_out=False)
     categories = Category.query.all()
     
     return render_template('books/list.html', 
-                         books=books, 
+                         books=pagination.items, 
+                         pagination=pagination,
                          categories=categories, 
                          search=search, 
                          selected_category=category_id)
@@ -56,10 +56,12 @@ def add_book():
         )
         
         try:
+            begin_write_transaction()
             db.session.add(book)
-            db.session.commit()
+            db.session.flush()
+            index_book(book)
             
-            # Log the action
+            # Log the action in the same transaction
             log_action(
                 action='CREATE_BOOK',
                 entity_type='Book',
@@ -72,6 +74,7 @@ def add_book():
                     'total_copies': book.total_copies
                 }
             )
+            db.session.commit()
             
             flash(f'Book "{book.title}" added successfully', 'success')
             return redirect(url_for('books.list_books'))
@@ -103,7 +106,8 @@ def edit_book(book_id):
         category_id = request.form.get('category_id')
         if category_id == '':
             category_id = None
-            
+        
+        begin_write_transaction()
         book.title = request.form['title']
         book.author = request.form.get('author', '')
         book.publisher = request.form.get('publisher', '')
@@ -114,9 +118,10 @@ def edit_book(book_id):
         book.shelf_location = request.form.get('shelf_location', '')
         
         try:
-            db.session.commit()
+            db.session.flush()
+            index_book(book)
             
-            # Log the action
+            # Log the action in the same transaction
             log_action(
                 action='UPDATE_BOOK',
                 entity_type='Book',
@@ -129,6 +134,7 @@ def edit_book(book_id):
                     'total_copies': book.total_copies
                 }
             )
+            db.session.commit()
             
             flash(f'Book "{book.title}" updated successfully', 'success')
             return redirect(url_for('books.view_book', book_id=book.id))
@@ -155,10 +161,11 @@ def add_category():
         )
         
         try:
+            begin_write_transaction()
             db.session.add(category)
-            db.session.commit()
+            db.session.flush()
             
-            # Log the action
+            # Log the action in the same transaction
             log_action(
                 action='CREATE_CATEGORY',
                 entity_type='Category',
@@ -168,6 +175,7 @@ def add_category():
                     'description': category.description
                 }
             )
+            db.session.commit()
             
             flash(f'Category "{category.name}" added successfully', 'success')
             return redirect(url_for('books.list_categories'))
@@ -177,19 +185,56 @@ def add_category():
     
     return render_template('books/category_form.html')
 
+@books_bp.route('/import', methods=['GET', 'POST'])
+@login_required
+def import_books():
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'error')
+        return redirect(url_for('books.list_books'))
+    
+    if request.method == 'POST':
+        upload = request.files.get('file')
+        if not upload or not upload.filename:
+            flash('Please choose a file to import', 'error')
+            return render_template('books/import.html')
+        
+        file_format = request.form.get('file_format') or detect_format(upload.filename)
+        add_copies = request.form.get('add_copies') == 'on'
+        
+        try:
+            # The upload is read record by record, so memory use does not grow with file size
+            stats, errors = import_catalogue(upload.stream, file_format=file_format, add_copies=add_copies)
+        except (CatalogueImportError, UnicodeDecodeError) as e:
+            db.session.rollback()
+            flash(f'Import failed: {e}', 'error')
+            return render_template('books/import.html')
+        
+        # One summary entry for the whole file
+        log_action(
+            action='IMPORT_BOOKS',
+            entity_type='Book',
+            details={
+                'filename': upload.filename,
+                'format': file_format,
+                'add_copies': add_copies,
+                **stats
+            }
+        )
+        
+        flash(f"Imported {upload.filename}: {stats['created']} added, {stats['updated']} updated, "
+              f"{stats['duplicates']} duplicates merged, {stats['skipped']} skipped", 'success')
+        return render_template('books/import.html', stats=stats, errors=errors)
+    
+    return render_template('books/import.html')
+
 @books_bp.route('/api/search')
 @login_required
 def api_search():
     """API endpoint for book search in borrowing forms"""
     query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
     if query:
-        books = Book.query.filter(
-            or_(
-                Book.title.contains(query),
-                Book.author.contains(query),
-                Book.unique_id.contains(query)
-            )
-        ).filter(Book.available_copies > 0).limit(10).all()
+        books = search_books_query(query, Book.query.filter(Book.available_copies > 0)).limit(limit).all()
         
         return jsonify([{
             'id': b.id,
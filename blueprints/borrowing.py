@@ -1,29 +1,58 @@
-from flask import Blueprint, render_template, request, redirect, url_for, flash
+from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required
 from models import Book, Student, Staff, BorrowRecord, Fine, db
-from datetime import datetime, timedelta
+from datetime import datetime
 from utils.audit_logger import log_action
+from utils.circulation import (checkout_book, mark_returned, assess_late_fine, mark_fine_paid, checkout_batch,
+                               return_batch, CheckoutError, MAX_BATCH_SIZE)
+from utils.database import begin_write_transaction
+from utils.pagination import keyset_page
+from sqlalchemy.orm import joinedload
 
 borrowing_bp = Blueprint('borrowing', __name__)
 
+def _invalid_items(items, field, valid=None):
+    """Per-item results for batch elements that are not a string or integer, or that valid() rejects"""
+    return [
+        {'index': index, 'status': 'invalid', 'message': f'Not a valid item of {field}'}
+        for index, item in enumerate(items)
+        if not isinstance(item, (str, int)) or isinstance(item, bool) or (valid and not valid(item))
+    ]
+
 @borrowing_bp.route('/')
 @login_required
 def list_borrows():
     status = request.args.get('status', 'active')
+    cursor = request.args.get('cursor')
+    
+    # Book and borrower are loaded in the same query as the records
+    query = BorrowRecord.query.options(
+        joinedload(BorrowRecord.book_ref),
+        joinedload(BorrowRecord.student_ref),
+        joinedload(BorrowRecord.staff_ref)
+    )
     
     if status == 'active':
-        borrows = BorrowRecord.query.filter_by(returned_at=None).order_by(BorrowRecord.borrowed_at.desc()).all()
+        query = query.filter(BorrowRecord.returned_at.is_(None))
+        sort_column, descending = BorrowRecord.borrowed_at, True
     elif status == 'returned':
-        borrows = BorrowRecord.query.filter(BorrowRecord.returned_at.isnot(None)).order_by(BorrowRecord.returned_at.desc()).all()
+        query = query.filter(BorrowRecord.returned_at.isnot(None))
+        sort_column, descending = BorrowRecord.returned_at, True
     elif status == 'overdue':
-        borrows = BorrowRecord.query.filter(
+        query = query.filter(
             BorrowRecord.returned_at.is_(None),
             BorrowRecord.due_date < datetime.utcnow()
-        ).all()
+        )
+        # Most overdue first
+        sort_column, descending = BorrowRecord.due_date, False
     else:
-        borrows = BorrowRecord.query.order_by(BorrowRecord.borrowed_at.desc()).all()
+        sort_column, descending = BorrowRecord.borrowed_at, True
     
-    return render_template('borrowing/list.html', borrows=borrows, status=status)
+    borrows, next_cursor = keyset_page(query, sort_column, BorrowRecord.id,
+                                       cursor=cursor, per_page=50, descending=descending)
+    
+    return render_template('borrowing/list.html', borrows=borrows, status=status,
+                         cursor=cursor, next_cursor=next_cursor)
 
 @borrowing_bp.route('/borrow', methods=['GET', 'POST'])
 @login_required
@@ -35,70 +64,55 @@ def borrow_book():
         staff_id = request.form.get('staff_id') if borrower_type == 'staff' else None
         
         book = Book.query.get_or_404(book_id)
+        borrower = Student.query.get_or_404(student_id) if student_id else Staff.query.get_or_404(staff_id)
+        borrower_name = borrower.name
+        book_title = book.title
         
-        # Check availability
+        # Refuse early without taking the write lock; the reservation below
+        # is still the authoritative check
         if book.available_copies <= 0:
             flash('This book is not available for borrowing', 'error')
-            students = Student.query.order_by(Student.name).all()
-            staff = Staff.query.order_by(Staff.name).all()
-            all_books = Book.query.order_by(Book.title).all()
-            books = [book for book in all_books if book.available_copies > 0]
-            return render_template('borrowing/borrow_form.html', students=students, staff=staff, books=books)
-        
-        # Check student borrowing limits
-        if student_id:
-            student = Student.query.get_or_404(student_id)
-            if student.current_borrowed_count >= 3:
-                flash('Student has reached the maximum borrowing limit of 3 books', 'error')
-                students = Student.query.order_by(Student.name).all()
-                staff = Staff.query.order_by(Student.name).all()
-                all_books = Book.query.order_by(Book.title).all()
-                books = [book for book in all_books if book.available_copies > 0]
-                return render_template('borrowing/borrow_form.html', students=students, staff=staff, books=books)
-        
-        # Create borrow record
-        borrow_record = BorrowRecord(
-            book_id=book_id,
-            student_id=student_id,
-            staff_id=staff_id,
-            notes=request.form.get('notes', '')
-        )
+            return render_template('borrowing/borrow_form.html')
         
+        # Reserve a copy and create the borrow record atomically
         try:
-            db.session.add(borrow_record)
-            db.session.commit()
-            
-            borrower_name = student.name if student_id else Staff.query.get(staff_id).name
+            begin_write_transaction()
+            borrow_record = checkout_book(
+                book.id,
+                student_id=student_id,
+                staff_id=staff_id,
+                notes=request.form.get('notes', '')
+            )
             
-            # Log the action
+            # Log the action in the same transaction
             log_action(
                 action='BORROW_BOOK',
                 entity_type='BorrowRecord',
                 entity_id=borrow_record.id,
                 details={
                     'book_id': book_id,
-                    'book_title': book.title,
+                    'book_title': book_title,
                     'borrower_type': 'Student' if student_id else 'Staff',
                     'borrower_id': student_id or staff_id,
                     'borrower_name': borrower_name,
                     'due_date': borrow_record.due_date.isoformat()
                 }
             )
+            db.session.commit()
             
-            flash(f'Book "{book.title}" successfully borrowed by {borrower_name}', 'success')
+            flash(f'Book "{book_title}" successfully borrowed by {borrower_name}', 'success')
             return redirect(url_for('borrowing.list_borrows'))
+        except CheckoutError as e:
+            # Lost the race for the last copy, or the student is at the limit
+            db.session.rollback()
+            flash(str(e), 'error')
         except Exception as e:
             db.session.rollback()
             flash('Error processing borrow request', 'error')
     
-    # GET request - load data for dropdowns
-    students = Student.query.order_by(Student.name).all()
-    staff = Staff.query.order_by(Staff.name).all()
-    # Get all books and filter by available copies in Python since it's a property
-    all_books = Book.query.order_by(Book.title).all()
-    books = [book for book in all_books if book.available_copies > 0]
-    
-    return render_template('borrowing/borrow_form.html', students=students, staff=staff, books=books)
+    # GET request - borrowers and books are looked up by the form's typeahead
+    # fields through the students/staff/books search APIs
+    return render_template('borrowing/borrow_form.html')
 
 @borrowing_bp.route('/return/<int:borrow_id>', methods=['GET', 'POST'])
 @login_required
@@ -110,29 +124,22 @@ def return_book(borrow_id):
         return redirect(url_for('borrowing.list_borrows'))
     
     if request.method == 'POST':
-        borrow_record.returned_at = datetime.utcnow()
+        begin_write_transaction()
+        if not mark_returned(borrow_record):
+            db.session.rollback()
+            flash('This book has already been returned', 'error')
+            return redirect(url_for('borrowing.list_borrows'))
         borrow_record.notes = request.form.get('notes', borrow_record.notes)
         
-        # Calculate fine for students if overdue
-        if borrow_record.student_id and borrow_record.is_overdue:
-            days_overdue = borrow_record.days_overdue
-            fine_amount = days_overdue * 20  # 20 KES per day
-            
-            fine = Fine(
-                student_id=borrow_record.student_id,
-                borrow_record_id=borrow_record.id,
-                amount=fine_amount,
-                original_amount=fine_amount,
-                reason=f'Late return - {days_overdue} days overdue'
-            )
-            db.session.add(fine)
+        # Fine students for late returns
+        fine = assess_late_fine(borrow_record)
         
         try:
             db.session.commit()
             flash(f'Book "{borrow_record.book_ref.title}" returned successfully', 'success')
             
-            if borrow_record.student_id and borrow_record.is_overdue:
-                flash(f'Fine of {fine_amount} KES applied for late return', 'warning')
+            if fine:
+                flash(f'Fine of {fine.amount} KES applied for late return', 'warning')
                 
             return redirect(url_for('borrowing.list_borrows'))
         except Exception as e:
@@ -150,17 +157,94 @@ def list_fines():
 @borrowing_bp.route('/fines/<int:fine_id>/pay', methods=['POST'])
 @login_required
 def pay_fine(fine_id):
+    begin_write_transaction()
     fine = Fine.query.get_or_404(fine_id)
     
-    if not fine.paid:
-        fine.paid = True
-        fine.paid_at = datetime.utcnow()
-        
+    if mark_fine_paid(fine):
         try:
             db.session.commit()
             flash(f'Fine of {fine.amount} KES marked as paid', 'success')
         except Exception as e:
             db.session.rollback()
             flash('Error processing fine payment', 'error')
+    else:
+        db.session.rollback()
+        flash('Fine has already been paid or waived', 'warning')
+    
+    return redirect(url_for('borrowing.list_fines'))
+
+
+@borrowing_bp.route('/api/batch-borrow', methods=['POST'])
+@login_required
+def api_batch_borrow():
+    """API endpoint for scanner-driven desks: lend several books to one borrower
+    
+    JSON body: {"unique_ids": [...], "student_id": 1} or {"unique_ids": [...], "staff_id": 1},
+    with optional "notes". All records are written in one transaction.
+    """
+    data = request.get_json(silent=True) or {}
+    unique_ids = data.get('unique_ids') or []
+    student_id = data.get('student_id')
+    staff_id = data.get('staff_id')
+    
+    if not isinstance(unique_ids, list) or not unique_ids:
+        return jsonify({'error': 'unique_ids must be a non-empty list'}), 400
+    if len(unique_ids) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} items per batch'}), 400
+    invalid = _invalid_items(unique_ids, 'unique_ids')
+    if invalid:
+        return jsonify({'error': 'Invalid items in unique_ids', 'results': invalid}), 400
+    unique_ids = [str(unique_id) for unique_id in unique_ids]
+    if bool(student_id) == bool(staff_id):
+        return jsonify({'error': 'Provide exactly one of student_id or staff_id'}), 400
+    
+    borrower = db.session.get(Student, student_id) if student_id else db.session.get(Staff, staff_id)
+    if borrower is None:
+        return jsonify({'error': 'Borrower not found'}), 404
+    
+    try:
+        begin_write_transaction()
+        results = checkout_batch(unique_ids, borrower, notes=data.get('notes', ''))
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Error processing batch checkout'}), 500
+    
+    return jsonify({
+        'borrowed': sum(1 for r in results if r['status'] == 'borrowed'),
+        'results': results
+    })
+
+@borrowing_bp.route('/api/batch-return', methods=['POST'])
+@login_required
+def api_batch_return():
+    """API endpoint for scanner-driven desks: return several loans at once
+    
+    JSON body: {"borrow_ids": [...]}. Returns, fines and audit entries are
+    written in one transaction.
+    """
+    data = request.get_json(silent=True) or {}
+    borrow_ids = data.get('borrow_ids') or []
+    
+    if not isinstance(borrow_ids, list) or not borrow_ids:
+        return jsonify({'error': 'borrow_ids must be a non-empty list'}), 400
+    if len(borrow_ids) > MAX_BATCH_SIZE:
+        return jsonify({'error': f'At most {MAX_BATCH_SIZE} items per batch'}), 400
+    invalid = _invalid_items(borrow_ids, 'borrow_ids',
+                             lambda borrow_id: isinstance(borrow_id, int) or borrow_id.strip().isdigit())
+    if invalid:
+        return jsonify({'error': 'Invalid items in borrow_ids', 'results': invalid}), 400
+    borrow_ids = [int(borrow_id) for borrow_id in borrow_ids]
+    
+    try:
+        begin_write_transaction()
+        results = return_batch(borrow_ids)
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'error': 'Error processing batch return'}), 500
     
-    return redirect(url_for('borrowing.list_fines'))
\ No newline at end of file
+    return jsonify({
+        'returned': sum(1 for r in results if r['status'] == 'returned'),
+        'results': results
+    })
@@ -2,6 +2,9 @@ from flask import Blueprint, render_template, request, redirect, url_for, flash,
 from flask_login import login_required, current_user
 from models import Fine, Student, BorrowRecord, db
 from utils.audit_logger import log_action
+from utils.database import begin_write_transaction
+from utils.circulation import mark_fine_paid
+from utils.report_cache import cached_report
 from datetime import datetime
 
 fines_bp = Blueprint('fines', __name__)
@@ -33,6 +36,7 @@ def adjust_fine(fine_id):
         action_type = request.form['action_type']
         reason = request.form['reason']
         
+        begin_write_transaction()
         original_amount = fine.amount
         
         if action_type == 'waive':
@@ -104,6 +108,8 @@ def adjust_fine(fine_id):
 @fines_bp.route('/<int:fine_id>/pay', methods=['POST'])
 @login_required
 def pay_fine(fine_id):
+    # Read the fine under the write lock, so its state cannot change before it is marked
+    begin_write_transaction()
     fine = Fine.query.get_or_404(fine_id)
     
     if fine.paid:
@@ -114,19 +120,10 @@ def pay_fine(fine_id):
         flash('Fine has been waived and cannot be paid', 'warning')
         return redirect(url_for('fines.list_fines'))
     
-    fine.paid = True
-    fine.paid_at = datetime.utcnow()
-    
-    log_action(
-        action='PAY_FINE',
-        entity_type='Fine',
-        entity_id=fine.id,
-        details={
-            'amount': fine.amount,
-            'student_id': fine.student_id,
-            'borrow_record_id': fine.borrow_record_id
-        }
-    )
+    if not mark_fine_paid(fine):
+        db.session.rollback()
+        flash('Fine has already been paid or waived', 'warning')
+        return redirect(url_for('fines.list_fines'))
     
     try:
         db.session.commit()
@@ -139,6 +136,7 @@ def pay_fine(fine_id):
 
 @fines_bp.route('/statistics')
 @login_required
+@cached_report('fine_statistics', {'fine', 'student'})
 def fine_statistics():
     if current_user.role != 'admin':
         flash('Access denied. Admin privileges required.', 'error')
@@ -1,11 +1,67 @@
-from flask import Blueprint, render_template, request, flash, redirect, url_for, jsonify
+from flask import (Blueprint, render_template, request, flash, redirect, url_for, jsonify, Response, stream_with_context,
+                   abort, send_file)
 from flask_login import login_required, current_user
-from models import Book, Student, Staff, BorrowRecord, Fine, Category, db
-from sqlalchemy import func, desc
+from models import (Book, Student, Staff, BorrowRecord, Fine, Category, BookDailyBorrows, CategoryDailyBorrows,
+                    BorrowerDailyBorrows, StudentDailyBorrows, FineDailyCollections, ReportJob, db)
+from sqlalchemy import func, desc, or_
 from datetime import datetime, timedelta
+from sqlalchemy.orm import joinedload, contains_eager
+from utils.circulation import overdue_loans
+from utils.rollups import UNCATEGORIZED
+from utils.time_buckets import GRANULARITIES, bucketed_series
+from utils.report_cache import cached_report, report_cache_stats
+from utils.audit_logger import log_action
+from utils.export import EXPORT_DATASETS, EXPORT_FORMATS, stream_export, export_filename
+from utils.report_jobs import (REPORT_JOBS, REPORT_JOB_FORMATS, MAX_INACTIVE_MONTHS, parse_job_parameters,
+                               submit_report_job, report_job_status, report_job_path, report_job_filename)
 
 reports_bp = Blueprint('reports', __name__)
 
+# Range shown by the charts when no start date is given
+CHART_DEFAULT_RANGE = {
+    'day': timedelta(days=30),
+    'week': timedelta(weeks=12),
+    'month': timedelta(days=365),
+}
+
+def rollup_totals(model, owner_column, days=None):
+    """
+    Subquery summing a daily rollup per owner (book, student or category)
+
+    Args:
+        model: Rollup model with day and borrows columns
+        owner_column: Column to group by, labelled owner_id
+        days (int): Only count the last N days; None for all history
+
+    Returns:
+        Subquery with columns ``owner_id`` and ``borrow_count``
+    """
+    query = db.session.query(
+        owner_column.label('owner_id'),
+        func.sum(model.borrows).label('borrow_count')
+    )
+    if days:
+        query = query.filter(model.day >= (datetime.utcnow() - timedelta(days=days)).date())
+    return query.group_by(owner_column).subquery()
+
+def stock_levels_query():
+    """
+    One row per book with its category and copy counts, as a single query
+
+    Copies on loan come from the borrowed_count kept by every borrow and
+    return, so no per-book COUNT or category lazy load is needed.
+    """
+    return db.session.query(
+        Book.id,
+        Book.title,
+        Book.author,
+        Book.unique_id,
+        func.coalesce(Category.name, 'Uncategorized').label('category'),
+        Book.total_copies,
+        Book.available_copies.label('available_copies'),
+        Book.borrowed_count.label('borrowed_copies')
+    ).outerjoin(Category, Book.category_id == Category.id)
+
 @reports_bp.route('/')
 @login_required
 def index():
@@ -18,109 +74,121 @@ def index():
 
 @reports_bp.route('/most-borrowed')
 @login_required
+@cached_report('most_borrowed', {'book', 'book_daily_borrows'})
 def most_borrowed_books():
     if current_user.role != 'admin':
         flash('Access denied. Admin privileges required.', 'error')
         return redirect(url_for('dashboard.index'))
     
-    # Get most borrowed books with borrow count
-    subquery = db.session.query(
-        BorrowRecord.book_id,
-        func.count(BorrowRecord.id).label('borrow_count')
-    ).group_by(BorrowRecord.book_id).subquery()
+    # Totals come from the daily rollup, so the cost follows the number of days, not loans
+    days = request.args.get('days', type=int)
+    totals = rollup_totals(BookDailyBorrows, BookDailyBorrows.book_id, days)
     
     most_borrowed = db.session.query(
         Book,
-        subquery.c.borrow_count
-    ).join(subquery, Book.id == subquery.c.book_id).order_by(desc(subquery.c.borrow_count)).limit(20).all()
+        totals.c.borrow_count
+    ).join(totals, Book.id == totals.c.owner_id).order_by(desc(totals.c.borrow_count), Book.title).limit(20).all()
     
-    return render_template('reports/most_borrowed.html', books=most_borrowed)
+    return render_template('reports/most_borrowed.html', books=most_borrowed, days=days)
 
 @reports_bp.route('/active-students')
 @login_required
+@cached_report('active_students', {'student', 'student_daily_borrows'})
 def active_students():
     if current_user.role != 'admin':
         flash('Access denied. Admin privileges required.', 'error')
         return redirect(url_for('dashboard.index'))
     
-    # Get most active students with borrow count
-    subquery = db.session.query(
-        BorrowRecord.student_id,
-        func.count(BorrowRecord.id).label('borrow_count')
-    ).filter(BorrowRecord.student_id.isnot(None)).group_by(BorrowRecord.student_id).subquery()
+    days = request.args.get('days', type=int)
+    totals = rollup_totals(StudentDailyBorrows, StudentDailyBorrows.student_id, days)
     
     active_students = db.session.query(
         Student,
-        subquery.c.borrow_count
-    ).join(subquery, Student.id == subquery.c.student_id).order_by(desc(subquery.c.borrow_count)).limit(20).all()
+        totals.c.borrow_count
+    ).join(totals, Student.id == totals.c.owner_id).order_by(desc(totals.c.borrow_count), Student.name).limit(20).all()
     
-    return render_template('reports/active_students.html', students=active_students)
+    return render_template('reports/active_students.html', students=active_students, days=days)
 
 @reports_bp.route('/category-trends')
 @login_required
+@cached_report('category_trends', {'book', 'category', 'category_daily_borrows'})
 def category_trends():
     if current_user.role != 'admin':
         flash('Access denied. Admin privileges required.', 'error')
         return redirect(url_for('dashboard.index'))
     
-    # Get borrowing trends by category
-    category_stats = db.session.query(
-        Category.name,
-        func.count(func.distinct(BorrowRecord.id)).label('borrow_count'),
-        func.count(func.distinct(Book.id)).label('total_books')
-    ).select_from(Category).join(Book, Book.category_id == Category.id).outerjoin(BorrowRecord, BorrowRecord.book_id == Book.id).group_by(Category.id, Category.name).all()
-    
-    # Include uncategorized books
-    uncategorized_books = Book.query.filter_by(category_id=None).count()
-    uncategorized_borrows = db.session.query(func.count(BorrowRecord.id)).join(Book).filter(Book.category_id.is_(None)).scalar()
-    
-    if uncategorized_books > 0:
-        category_stats = list(category_stats)
-        category_stats.append(('Uncategorized', uncategorized_borrows or 0, uncategorized_books))
-    
-    return render_template('reports/category_trends.html', categories=category_stats)
+    days = request.args.get('days', type=int)
+    totals = rollup_totals(CategoryDailyBorrows, CategoryDailyBorrows.category_id, days)
+    borrows = dict(db.session.query(totals.c.owner_id, totals.c.borrow_count))
+    
+    # Every category that has books, with uncategorized books last
+    book_counts = db.session.query(
+        Book.category_id,
+        func.count(Book.id)
+    ).group_by(Book.category_id).all()
+    names = dict(db.session.query(Category.id, Category.name))
+    
+    category_stats = sorted(
+        [{
+            'name': names.get(category_id, 'Uncategorized'),
+            'borrow_count': borrows.get(category_id or UNCATEGORIZED, 0),
+            'book_count': book_count
+        } for category_id, book_count in book_counts],
+        key=lambda category: (category['name'] == 'Uncategorized', category['name'])
+    )
+    
+    return render_template('reports/category_trends.html', categories=category_stats, days=days)
 
 @reports_bp.route('/stock-status')
 @login_required
+@cached_report('stock_status', {'book', 'category'})
 def stock_status():
     if current_user.role != 'admin':
         flash('Access denied. Admin privileges required.', 'error')
         return redirect(url_for('dashboard.index'))
     
-    # Get stock information for all books
-    books = Book.query.all()
-    stock_data = []
+    page = request.args.get('page', 1, type=int)
+    pagination = stock_levels_query().order_by(Book.title, Book.id).paginate(page=page, per_page=50, error_out=False)
     
-    for book in books:
-        stock_data.append({
-            'title': book.title,
-            'author': book.author,
-            'unique_id': book.unique_id,
-            'category': book.category_name,
-            'total_copies': book.total_copies,
-            'available_copies': book.available_copies,
-            'borrowed_copies': book.total_copies - book.available_copies
-        })
-    
-    return render_template('reports/stock_status.html', books=stock_data)
+    return render_template('reports/stock_status.html', books=pagination.items, pagination=pagination)
 
 @reports_bp.route('/overdue-items')
 @login_required
+@cached_report('overdue_items', {'borrow_record', 'book', 'student', 'staff'}, ttl=60)
 def overdue_items():
     if current_user.role != 'admin':
         flash('Access denied. Admin privileges required.', 'error')
         return redirect(url_for('dashboard.index'))
     
-    # Get overdue items (students only have fines)
-    overdue_borrows = BorrowRecord.query.filter(
-        BorrowRecord.returned_at.is_(None),
-        BorrowRecord.due_date < func.now()
-    ).all()
-    
-    return render_template('reports/overdue_items.html', overdue_borrows=overdue_borrows)
+    sort = request.args.get('sort', 'days')
+    page = request.args.get('page', 1, type=int)
+    
+    # One indexed query on open loans past due, with book and borrower joined in
+    query = overdue_loans().outerjoin(Student, BorrowRecord.student_id == Student.id).outerjoin(
+        Staff, BorrowRecord.staff_id == Staff.id
+    ).options(
+        joinedload(BorrowRecord.book_ref),
+        contains_eager(BorrowRecord.student_ref),
+        contains_eager(BorrowRecord.staff_ref)
+    )
+    
+    if sort == 'borrower':
+        query = query.order_by(func.coalesce(Student.name, Staff.name), BorrowRecord.due_date, BorrowRecord.id)
+    else:
+        # Most days overdue first
+        sort = 'days'
+        query = query.order_by(BorrowRecord.due_date, BorrowRecord.id)
+    
+    pagination = query.paginate(page=page, per_page=50, error_out=False)
+    
+    return render_template('reports/overdue_items.html',
+                         overdue_borrows=pagination.items,
+                         pagination=pagination,
+                         sort=sort)
 
 @reports_bp.route('/staff-borrows')
 @login_required
+@cached_report('staff_borrows', {'borrow_record', 'staff'})
 def staff_borrows():
     if current_user.role != 'admin':
         flash('Access denied. Admin privileges required.', 'error')
@@ -133,97 +201,101 @@ def staff_borrows():
 
 @reports_bp.route('/stock-depletion')
 @login_required
+@cached_report('stock_depletion', {'book', 'category'})
 def stock_depletion():
     if current_user.role != 'admin':
         flash('Access denied. Admin privileges required.', 'error')
         return redirect(url_for('dashboard.index'))
     
-    # Get books with low stock (less than 2 available copies)
-    low_stock_books = []
-    books = Book.query.all()
-    
-    for book in books:
-        if book.available_copies <= 1:
-            low_stock_books.append({
-                'title': book.title,
-                'author': book.author,
-                'unique_id': book.unique_id,
-                'category': book.category_name,
-                'total_copies': book.total_copies,
-                'available_copies': book.available_copies,
-                'borrowed_copies': book.total_copies - book.available_copies
-            })
+    # Books with at most one copy left, filtered in SQL
+    page = request.args.get('page', 1, type=int)
+    pagination = stock_levels_query().filter(Book.available_copies <= 1).order_by(
+        Book.available_copies, Book.title, Book.id
+    ).paginate(page=page, per_page=50, error_out=False)
     
-    return render_template('reports/stock_depletion.html', low_stock_books=low_stock_books)
+    return render_template('reports/stock_depletion.html', low_stock_books=pagination.items, pagination=pagination)
 
 @reports_bp.route('/inactive-students')
 @login_required
+@cached_report('inactive_students', {'student'})
 def inactive_students():
     if current_user.role != 'admin':
         flash('Access denied. Admin privileges required.', 'error')
         return redirect(url_for('dashboard.index'))
     
-    # Students with no borrowing activity in the last 6 months
-    six_months_ago = datetime.utcnow() - timedelta(days=180)
+    # Students who have not borrowed for the chosen number of months, or never have;
+    # a range scan of the last_borrowed_at index kept up to date by every checkout.
+    # The same range as the background job of this report
+    months = min(max(request.args.get('months', 6, type=int), 1), MAX_INACTIVE_MONTHS)
+    cutoff = datetime.utcnow() - timedelta(days=30 * months)
+    page = request.args.get('page', 1, type=int)
     
-    # Get students who have never borrowed or haven't borrowed in 6 months
-    from sqlalchemy import or_
-    inactive_students = db.session.query(Student).outerjoin(BorrowRecord).group_by(Student.id).having(
-        or_(
-            func.max(BorrowRecord.borrowed_at) < six_months_ago,
-            func.max(BorrowRecord.borrowed_at).is_(None)
-        )
-    ).all()
+    pagination = Student.query.filter(
+        or_(Student.last_borrowed_at < cutoff, Student.last_borrowed_at.is_(None))
+    ).order_by(Student.last_borrowed_at.asc().nullsfirst(), Student.id).paginate(page=page, per_page=50, error_out=False)
     
     return render_template('reports/inactive_students.html', 
-                         inactive_students=inactive_students,
-                         months_threshold=6)
+                         inactive_students=pagination.items,
+                         pagination=pagination,
+                         months_threshold=months)
 
 @reports_bp.route('/charts-data')
 @login_required
+@cached_report('charts_data', {'category', 'category_daily_borrows', 'borrower_daily_borrows', 'fine_daily_collections'})
 def charts_data():
     if current_user.role != 'admin':
         return jsonify({'error': 'Access denied'}), 403
     
-    # Borrowing trends by month (last 12 months) - PostgreSQL compatible
-    one_year_ago = datetime.utcnow() - timedelta(days=365)
-    monthly_borrows = db.session.query(
-        func.to_char(BorrowRecord.borrowed_at, 'YYYY-MM').label('month'),
-        func.count(BorrowRecord.id).label('count')
-    ).filter(BorrowRecord.borrowed_at >= one_year_ago).group_by(func.to_char(BorrowRecord.borrowed_at, 'YYYY-MM')).all()
+    granularity = request.args.get('granularity', 'month')
+    if granularity not in GRANULARITIES:
+        return jsonify({'error': f"granularity must be one of {', '.join(GRANULARITIES)}"}), 400
+    
+    try:
+        end = datetime.strptime(request.args['end'], '%Y-%m-%d').date() if request.args.get('end') else datetime.utcnow().date()
+        start = (datetime.strptime(request.args['start'], '%Y-%m-%d').date() if request.args.get('start')
+                 else end - CHART_DEFAULT_RANGE[granularity])
+    except ValueError:
+        return jsonify({'error': 'start and end must be dates (YYYY-MM-DD)'}), 400
+    if start > end:
+        return jsonify({'error': 'start must not be after end'}), 400
+    
+    # Everything below reads the daily rollups; closed months come from the summary cache
+    borrow_trends = bucketed_series('borrows', BorrowerDailyBorrows, [BorrowerDailyBorrows.borrows], start, end, granularity)
+    
+    # Fine collection trends, by the day fines were paid
+    fine_trends = bucketed_series('fines', FineDailyCollections,
+                                  [FineDailyCollections.amount_paid, FineDailyCollections.fines_paid],
+                                  start, end, granularity)
     
     # Category distribution
-    category_distribution = db.session.query(
-        Category.name,
-        func.count(BorrowRecord.id).label('borrow_count')
-    ).select_from(Category).join(Book, Book.category_id == Category.id).join(BorrowRecord, BorrowRecord.book_id == Book.id).group_by(Category.id, Category.name).all()
-    
-    # Include uncategorized books
-    uncategorized_borrows = db.session.query(
-        func.count(BorrowRecord.id)
-    ).join(Book).filter(Book.category_id.is_(None)).scalar() or 0
-    
-    if uncategorized_borrows > 0:
-        category_distribution = list(category_distribution) + [('Uncategorized', uncategorized_borrows)]
-    
-    # Fine collection trends (last 12 months) - PostgreSQL compatible
-    fine_trends = db.session.query(
-        func.to_char(Fine.created_at, 'YYYY-MM').label('month'),
-        func.sum(Fine.amount).label('total_amount'),
-        func.count(Fine.id).label('fine_count')
-    ).filter(
-        Fine.created_at >= one_year_ago,
-        Fine.paid == True
-    ).group_by(func.to_char(Fine.created_at, 'YYYY-MM')).all()
+    names = dict(db.session.query(Category.id, Category.name))
+    category_distribution = [
+        (names.get(category_id, 'Uncategorized'), count)
+        for category_id, count in db.session.query(
+            CategoryDailyBorrows.category_id,
+            func.sum(CategoryDailyBorrows.borrows)
+        ).filter(
+            CategoryDailyBorrows.day >= start, CategoryDailyBorrows.day <= end
+        ).group_by(CategoryDailyBorrows.category_id).all()
+    ]
     
     # Student vs Staff borrowing ratio
-    student_borrows = BorrowRecord.query.filter(BorrowRecord.student_id.isnot(None)).count()
-    staff_borrows = BorrowRecord.query.filter(BorrowRecord.staff_id.isnot(None)).count()
+    borrower_totals = dict(db.session.query(
+        BorrowerDailyBorrows.borrower_type,
+        func.sum(BorrowerDailyBorrows.borrows)
+    ).filter(
+        BorrowerDailyBorrows.day >= start, BorrowerDailyBorrows.day <= end
+    ).group_by(BorrowerDailyBorrows.borrower_type).all())
+    student_borrows = borrower_totals.get('student', 0)
+    staff_borrows = borrower_totals.get('staff', 0)
     
     return jsonify({
-        'monthly_borrows': [{'month': item[0], 'count': item[1]} for item in monthly_borrows],
+        'granularity': granularity,
+        'start': start.isoformat(),
+        'end': end.isoformat(),
+        'borrow_trends': [{'period': period, 'count': count} for period, (count,) in borrow_trends],
         'category_distribution': [{'category': item[0], 'count': item[1]} for item in category_distribution],
-        'fine_trends': [{'month': item[0], 'amount': float(item[1]), 'count': item[2]} for item in fine_trends],
+        'fine_trends': [{'period': period, 'amount': float(amount), 'count': count} for period, (amount, count) in fine_trends],
         'borrower_ratio': {
             'students': student_borrows,
             'staff': staff_borrows
@@ -237,4 +309,124 @@ def charts():
         flash('Access denied. Admin privileges required.', 'error')
         return redirect(url_for('dashboard.index'))
     
-    return render_template('reports/charts.html')
\ No newline at end of file
+    return render_template('reports/charts.html')
+
+@reports_bp.route('/cache-stats')
+@login_required
+def cache_stats():
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    return jsonify(report_cache_stats())
+
+@reports_bp.route('/export')
+@login_required
+def export_data():
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'error')
+        return redirect(url_for('dashboard.index'))
+    
+    return render_template('reports/export.html', datasets=EXPORT_DATASETS)
+
+@reports_bp.route('/export/<dataset>')
+@login_required
+def export_dataset(dataset):
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'error')
+        return redirect(url_for('dashboard.index'))
+    
+    export_format = request.args.get('format', 'csv')
+    if dataset not in EXPORT_DATASETS or export_format not in EXPORT_FORMATS:
+        abort(404)
+    compress = request.args.get('gzip') == '1'
+    filename = export_filename(dataset, export_format, compress)
+    
+    log_action(
+        action='EXPORT_DATA',
+        entity_type='Export',
+        details={
+            'dataset': dataset,
+            'format': export_format,
+            'gzip': compress
+        }
+    )
+    
+    # Rows are streamed to the client as they are read from the database
+    response = Response(
+        stream_with_context(stream_export(dataset, export_format, compress)),
+        mimetype='application/gzip' if compress else EXPORT_FORMATS[export_format]
+    )
+    response.headers['Content-Disposition'] = f'attachment; filename={filename}'
+    return response
+
+@reports_bp.route('/jobs')
+@login_required
+def list_jobs():
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'error')
+        return redirect(url_for('dashboard.index'))
+    
+    jobs = ReportJob.query.order_by(ReportJob.created_at.desc(), ReportJob.id.desc()).limit(20).all()
+    
+    return render_template('reports/jobs.html',
+                         reports=REPORT_JOBS,
+                         formats=REPORT_JOB_FORMATS,
+                         jobs=[report_job_status(job) for job in jobs],
+                         current_year=datetime.utcnow().year)
+
+@reports_bp.route('/jobs', methods=['POST'])
+@login_required
+def submit_job():
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'error')
+        return redirect(url_for('dashboard.index'))
+    
+    report = request.form.get('report')
+    file_format = request.form.get('format', 'csv')
+    if report not in REPORT_JOBS or file_format not in REPORT_JOB_FORMATS:
+        abort(404)
+    
+    try:
+        parameters = parse_job_parameters(report, request.form)
+    except ValueError as e:
+        flash(str(e), 'error')
+        return redirect(url_for('reports.list_jobs'))
+    
+    job_id = submit_report_job(report, parameters, file_format, current_user.id)
+    
+    flash(f'{REPORT_JOBS[report][0]} is being generated', 'success')
+    return redirect(url_for('reports.job_detail', job_id=job_id))
+
+@reports_bp.route('/jobs/<int:job_id>')
+@login_required
+def job_detail(job_id):
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'error')
+        return redirect(url_for('dashboard.index'))
+    
+    job = ReportJob.query.get_or_404(job_id)
+    return render_template('reports/job_detail.html', job=report_job_status(job))
+
+@reports_bp.route('/jobs/<int:job_id>/status')
+@login_required
+def job_status(job_id):
+    if current_user.role != 'admin':
+        return jsonify({'error': 'Access denied'}), 403
+    
+    job = ReportJob.query.get_or_404(job_id)
+    return jsonify(report_job_status(job))
+
+@reports_bp.route('/jobs/<int:job_id>/download')
+@login_required
+def download_job(job_id):
+    if current_user.role != 'admin':
+        flash('Access denied. Admin privileges required.', 'error')
+        return redirect(url_for('dashboard.index'))
+    
+    job = ReportJob.query.get_or_404(job_id)
+    if job.status != 'completed':
+        flash('This report is not ready yet', 'warning')
+        return redirect(url_for('reports.job_detail', job_id=job.id))
+    
+    return send_file(report_job_path(job), mimetype=REPORT_JOB_FORMATS[job.file_format],
+                     as_attachment=True, download_name=report_job_filename(job))
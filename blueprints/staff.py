@@ -1,8 +1,11 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required
 from models import Staff, BorrowRecord, db
-from sqlalchemy import or_
+from sqlalchemy import or_, func
 from utils.audit_logger import log_action
+from utils.circulation import open_loan_counts
+from utils.borrower_lookup import sync_staff_identifiers
+from utils.database import begin_write_transaction
 
 staff_bp = Blueprint('staff', __name__)
 
@@ -21,18 +24,22 @@ def list_staff():
 @login_required
 def add_staff():
     if request.method == 'POST':
+        staff_num = request.form.get('staff_number', '').strip()
         staff = Staff(
             name=request.form['name'],
             staff_type=request.form['staff_type'],
+            staff_number=staff_num if staff_num else None,
             email=request.form.get('email', ''),
             phone=request.form.get('phone', '')
         )
         
         try:
+            begin_write_transaction()
             db.session.add(staff)
-            db.session.commit()
+            db.session.flush()
+            sync_staff_identifiers(staff)
             
-            # Log the action
+            # Log the action in the same transaction
             log_action(
                 action='CREATE_STAFF',
                 entity_type='Staff',
@@ -43,12 +50,13 @@ def add_staff():
                     'email': staff.email
                 }
             )
+            db.session.commit()
             
             flash(f'Staff member {staff.name} added successfully', 'success')
             return redirect(url_for('staff.list_staff'))
         except Exception as e:
             db.session.rollback()
-            flash('Error adding staff member', 'error')
+            flash('Error adding staff member. Please check for a duplicate staff number.', 'error')
     
     return render_template('staff/form.html')
 
@@ -68,15 +76,18 @@ def edit_staff(staff_id):
     staff_member = Staff.query.get_or_404(staff_id)
     
     if request.method == 'POST':
+        begin_write_transaction()
         staff_member.name = request.form['name']
         staff_member.staff_type = request.form['staff_type']
+        staff_num = request.form.get('staff_number', '').strip()
+        staff_member.staff_number = staff_num if staff_num else None
         staff_member.email = request.form.get('email', '')
         staff_member.phone = request.form.get('phone', '')
         
         try:
-            db.session.commit()
+            sync_staff_identifiers(staff_member)
             
-            # Log the action
+            # Log the action in the same transaction
             log_action(
                 action='UPDATE_STAFF',
                 entity_type='Staff',
@@ -87,6 +98,7 @@ def edit_staff(staff_id):
                     'email': staff_member.email
                 }
             )
+            db.session.commit()
             
             flash(f'Staff member {staff_member.name} updated successfully', 'success')
             return redirect(url_for('staff.view_staff', staff_id=staff_member.id))
@@ -101,13 +113,21 @@ def edit_staff(staff_id):
 def api_search():
     """API endpoint for staff search in borrowing forms"""
     query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
     if query:
-        staff_members = Staff.query.filter(Staff.name.contains(query)).limit(10).all()
+        open_loans = open_loan_counts(BorrowRecord.staff_id)
+        results = db.session.query(
+            Staff,
+            func.coalesce(open_loans.c.open_count, 0)
+        ).outerjoin(open_loans, Staff.id == open_loans.c.owner_id).filter(
+            Staff.name.contains(query)
+        ).order_by(Staff.name).limit(limit).all()
         
         return jsonify([{
             'id': s.id,
             'name': s.name,
-            'staff_type': s.staff_type
-        } for s in staff_members])
+            'staff_type': s.staff_type,
+            'current_borrowed': borrowed
+        } for s, borrowed in results])
     
     return jsonify([])
\ No newline at end of file
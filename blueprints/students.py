@@ -1,8 +1,11 @@
 from flask import Blueprint, render_template, request, redirect, url_for, flash, jsonify
 from flask_login import login_required
 from models import Student, BorrowRecord, Fine, db
-from sqlalchemy import or_
+from sqlalchemy import or_, func
 from utils.audit_logger import log_action
+from utils.circulation import open_loan_counts, unpaid_fine_totals
+from utils.borrower_lookup import sync_student_identifiers, resolve_identifier
+from utils.database import begin_write_transaction
 
 students_bp = Blueprint('students', __name__)
 
@@ -10,19 +13,31 @@ students_bp = Blueprint('students', __name__)
 @login_required
 def list_students():
     search = request.args.get('search', '')
+    page = request.args.get('page', 1, type=int)
+    
+    # Borrow counts and fine balances come from grouped subqueries in the same statement
+    open_loans = open_loan_counts(BorrowRecord.student_id)
+    balances = unpaid_fine_totals()
+    query = db.session.query(
+        Student,
+        func.coalesce(open_loans.c.open_count, 0),
+        func.coalesce(balances.c.balance, 0)
+    ).outerjoin(open_loans, Student.id == open_loans.c.owner_id
+    ).outerjoin(balances, Student.id == balances.c.student_id)
+    
     if search:
-        students = Student.query.filter(
+        query = query.filter(
             or_(
                 Student.name.contains(search),
                 Student.registration_number.contains(search),
                 Student.id_number.contains(search),
                 Student.passport_number.contains(search)
             )
-        ).all()
-    else:
-        students = Student.query.all()
+        )
+    
+    pagination = query.order_by(Student.name, Student.id).paginate(page=page, per_page=50, error_out=False)
     
-    return render_template('students/list.html', students=students, search=search)
+    return render_template('students/list.html', students=pagination.items, pagination=pagination, search=search)
 
 @students_bp.route('/add', methods=['GET', 'POST'])
 @login_required
@@ -48,10 +63,12 @@ def add_student():
         )
         
         try:
+            begin_write_transaction()
             db.session.add(student)
-            db.session.commit()
+            db.session.flush()
+            sync_student_identifiers(student)
             
-            # Log the action
+            # Log the action in the same transaction
             log_action(
                 action='CREATE_STUDENT',
                 entity_type='Student',
@@ -63,6 +80,7 @@ def add_student():
                     'membership_status': student.membership_status
                 }
             )
+            db.session.commit()
             
             flash(f'Student {student.name} added successfully', 'success')
             return redirect(url_for('students.list_students'))
@@ -98,6 +116,7 @@ def edit_student(student_id):
             flash('At least one identifier is required', 'error')
             return render_template('students/form.html', student=student)
         
+        begin_write_transaction()
         student.name = request.form['name']
         student.registration_number = reg_num if reg_num else None
         student.id_number = id_num if id_num else None
@@ -107,9 +126,9 @@ def edit_student(student_id):
         student.membership_status = request.form.get('membership_status', 'active')
         
         try:
-            db.session.commit()
+            sync_student_identifiers(student)
             
-            # Log the action
+            # Log the action in the same transaction
             log_action(
                 action='UPDATE_STUDENT',
                 entity_type='Student',
@@ -121,6 +140,7 @@ def edit_student(student_id):
                     'membership_status': student.membership_status
                 }
             )
+            db.session.commit()
             
             flash(f'Student {student.name} updated successfully', 'success')
             return redirect(url_for('students.view_student', student_id=student.id))
@@ -135,21 +155,73 @@ def edit_student(student_id):
 def api_search():
     """API endpoint for student search in borrowing forms"""
     query = request.args.get('q', '')
+    limit = max(1, min(request.args.get('limit', 10, type=int), 50))
     if query:
-        students = Student.query.filter(
+        # Borrow counts come from a grouped subquery in the same statement
+        open_loans = open_loan_counts(BorrowRecord.student_id)
+        results = db.session.query(
+            Student,
+            func.coalesce(open_loans.c.open_count, 0)
+        ).outerjoin(open_loans, Student.id == open_loans.c.owner_id).filter(
             or_(
                 Student.name.contains(query),
                 Student.registration_number.contains(query),
                 Student.id_number.contains(query),
                 Student.passport_number.contains(query)
             )
-        ).limit(10).all()
+        ).order_by(Student.name).limit(limit).all()
         
         return jsonify([{
             'id': s.id,
             'name': s.name,
             'identifier': s.identifier,
-            'current_borrowed': s.current_borrowed_count
-        } for s in students])
+            'membership_status': s.membership_status,
+            'current_borrowed': borrowed
+        } for s, borrowed in results])
+    
+    return jsonify([])
+
+def _resolved_borrower(match):
+    # JSON description of the borrower a BorrowerIdentifier belongs to
+    if match.student_id:
+        student = match.student
+        return {
+            'borrower_type': 'student',
+            'id': student.id,
+            'name': student.name,
+            'identifier': student.identifier,
+            'matched_id_type': match.id_type,
+            'membership_status': student.membership_status,
+            'current_borrowed': student.current_borrowed_count
+        }
+    
+    staff = match.staff
+    return {
+        'borrower_type': 'staff',
+        'id': staff.id,
+        'name': staff.name,
+        'staff_number': staff.staff_number,
+        'matched_id_type': match.id_type,
+        'staff_type': staff.staff_type,
+        'current_borrowed': BorrowRecord.query.filter_by(staff_id=staff.id, returned_at=None).count()
+    }
+
+@students_bp.route('/api/resolve')
+@login_required
+def api_resolve():
+    """
+    API endpoint resolving a scanned card or typed ID number to its borrower
+
+    When the number belongs to several borrowers, answers 409 with all of
+    them under 'candidates' for the caller to choose from.
+    """
+    matches = resolve_identifier(request.args.get('id', ''))
+    if not matches:
+        return jsonify({'error': 'No borrower with this ID'}), 404
+    if len(matches) > 1:
+        return jsonify({
+            'error': 'Several borrowers have this ID',
+            'candidates': [_resolved_borrower(match) for match in matches]
+        }), 409
     
-    return jsonify([])
\ No newline at end of file
+    return jsonify(_resolved_borrower(matches[0]))
@@ -0,0 +1,74 @@
+#!/usr/bin/env python3
+"""
+Bulk Catalogue Import Script for Library System
+
+Streams a CSV, MARC21 or MARCXML file into the book catalogue in batches,
+for collections too large to upload through the web form. Books are matched
+on unique ID, then ISBN; matched books are updated, new ones are added, and
+one summary entry is written to the audit log.
+
+Usage:
+    python import_catalogue.py donations.csv --user admin
+    python import_catalogue.py publisher.mrc --user admin --add-copies
+    python import_catalogue.py records.xml --user admin --format marcxml --batch-size 5000
+"""
+
+import argparse
+import os
+import sys
+from main import app
+from models import User
+from utils.audit_logger import log_action
+from utils.catalogue_import import import_catalogue, detect_format, CatalogueImportError, IMPORT_BATCH_SIZE
+
+def main():
+    parser = argparse.ArgumentParser(description='Import books from a CSV, MARC21 or MARCXML file')
+    parser.add_argument('path', help='File to import')
+    parser.add_argument('--user', required=True, help='Username the import is recorded against in the audit log')
+    parser.add_argument('--format', choices=['csv', 'marc', 'marcxml'], help='File format (default: from the file name)')
+    parser.add_argument('--add-copies', action='store_true', help='Add copies to books already in the catalogue instead of replacing their stock')
+    parser.add_argument('--batch-size', type=int, default=IMPORT_BATCH_SIZE, help='Records written per batch')
+
+    args = parser.parse_args()
+    file_format = args.format or detect_format(args.path)
+
+    def report(stats):
+        print(f"  {stats['read']} read, {stats['created']} added, {stats['updated']} updated, "
+              f"{stats['skipped']} skipped", flush=True)
+
+    # Use Flask app context
+    with app.app_context():
+        user = User.query.filter_by(username=args.user).first()
+        if not user:
+            print(f"✗ No user named {args.user}")
+            sys.exit(1)
+
+        print(f"Importing {args.path} ({file_format})...")
+        try:
+            with open(args.path, 'rb') as stream:
+                stats, errors = import_catalogue(stream, file_format=file_format, add_copies=args.add_copies,
+                                                 batch_size=args.batch_size, progress=report)
+        except (CatalogueImportError, UnicodeDecodeError) as e:
+            print(f"✗ Import failed: {e}")
+            sys.exit(1)
+
+        log_action(
+            action='IMPORT_BOOKS',
+            entity_type='Book',
+            details={
+                'filename': os.path.basename(args.path),
+                'format': file_format,
+                'add_copies': args.add_copies,
+                **stats
+            },
+            user_id=user.id
+        )
+
+        for error in errors:
+            print(f"  skipped: {error}")
+        print(f"✓ Imported {stats['created']} new and {stats['updated']} existing books "
+              f"({stats['duplicates']} duplicates merged, {stats['skipped']} skipped, "
+              f"{stats['categories_created']} categories created)")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,36 @@
+"""add stored borrowed_count to book
+
+Revision ID: a1c3e5f70001
+Revises:
+Create Date: 2025-10-20 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a1c3e5f70001'
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tables are created by db.create_all() on startup, so the column may
+    # already exist on a fresh database
+    columns = [c['name'] for c in sa.inspect(op.get_bind()).get_columns('book')]
+    if 'borrowed_count' not in columns:
+        op.add_column('book', sa.Column('borrowed_count', sa.Integer(), nullable=False, server_default='0'))
+
+    # Backfill from open borrow records
+    op.execute(
+        "UPDATE book SET borrowed_count = ("
+        "SELECT COUNT(*) FROM borrow_record "
+        "WHERE borrow_record.book_id = book.id AND borrow_record.returned_at IS NULL)"
+    )
+
+
+def downgrade():
+    with op.batch_alter_table('book') as batch_op:
+        batch_op.drop_column('borrowed_count')
@@ -0,0 +1,95 @@
+"""allow one identifier value for several borrowers
+
+Revision ID: a3f7d9b10013
+Revises: f9c3e5a70012
+Create Date: 2025-11-06 09:00:00.000000
+
+"""
+import logging
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3f7d9b10013'
+down_revision = 'f9c3e5a70012'
+branch_labels = None
+depends_on = None
+
+logger = logging.getLogger('alembic.env')
+
+STUDENT_ID_TYPES = ('registration_number', 'id_number', 'passport_number')
+
+
+def normalize(value):
+    # Same rule as utils.borrower_lookup.normalize_identifier
+    return re.sub(r'[\s\-]+', '', value).upper()
+
+
+def _identifiers(bind):
+    rows = []
+    students = bind.execute(sa.text(
+        'SELECT id, registration_number, id_number, passport_number FROM student'
+    )).fetchall()
+    for student in students:
+        for id_type, raw in zip(STUDENT_ID_TYPES, student[1:]):
+            if raw:
+                rows.append({'value': normalize(raw), 'id_type': id_type, 'student_id': student[0], 'staff_id': None})
+    staff_members = bind.execute(sa.text(
+        'SELECT id, staff_number FROM staff WHERE staff_number IS NOT NULL'
+    )).fetchall()
+    for staff_id, raw in staff_members:
+        rows.append({'value': normalize(raw), 'id_type': 'staff_number', 'student_id': None, 'staff_id': staff_id})
+    return rows
+
+
+def _recreate(unique_values):
+    # The lookup table is derived from the student and staff tables, so it
+    # is rebuilt rather than altered (SQLite cannot drop the unnamed
+    # unique constraint in place)
+    bind = op.get_bind()
+    op.drop_table('borrower_identifier')
+    op.create_table(
+        'borrower_identifier',
+        sa.Column('id', sa.Integer(), nullable=False),
+        sa.Column('value', sa.String(length=50), nullable=False),
+        sa.Column('id_type', sa.String(length=20), nullable=False),
+        sa.Column('student_id', sa.Integer(), nullable=True),
+        sa.Column('staff_id', sa.Integer(), nullable=True),
+        sa.ForeignKeyConstraint(['student_id'], ['student.id']),
+        sa.ForeignKeyConstraint(['staff_id'], ['staff.id']),
+        sa.PrimaryKeyConstraint('id'),
+        *([sa.UniqueConstraint('value')] if unique_values else []),
+    )
+    op.create_index('ix_borrower_identifier_student_id', 'borrower_identifier', ['student_id'])
+    op.create_index('ix_borrower_identifier_staff_id', 'borrower_identifier', ['staff_id'])
+    if not unique_values:
+        op.create_index('ix_borrower_identifier_value', 'borrower_identifier', ['value'])
+
+    rows = _identifiers(bind)
+    if unique_values:
+        # The old table holds each value once; the others are left out
+        kept = {}
+        for row in rows:
+            if row['value'] in kept:
+                logger.warning(f"Borrower identifier not indexed, already used: {row['id_type']} {row['value']}")
+            else:
+                kept[row['value']] = row
+        rows = list(kept.values())
+    if rows:
+        bind.execute(sa.text(
+            'INSERT INTO borrower_identifier (value, id_type, student_id, staff_id) '
+            'VALUES (:value, :id_type, :student_id, :staff_id)'
+        ), rows)
+
+
+def upgrade():
+    # Also indexes the numbers the first backfill (c4e8a1b20003) skipped
+    # because another borrower had the same value
+    _recreate(unique_values=False)
+
+
+def downgrade():
+    _recreate(unique_values=True)
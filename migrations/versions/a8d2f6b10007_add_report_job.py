@@ -0,0 +1,43 @@
+"""add background report job table
+
+Revision ID: a8d2f6b10007
+Revises: f6c0e4a70006
+Create Date: 2025-10-29 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8d2f6b10007'
+down_revision = 'f6c0e4a70006'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tables are created by db.create_all() on startup, so the table may
+    # already exist on a fresh database
+    if not sa.inspect(op.get_bind()).has_table('report_job'):
+        op.create_table(
+            'report_job',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('report', sa.String(length=50), nullable=False),
+            sa.Column('parameters', sa.Text(), nullable=True),
+            sa.Column('file_format', sa.String(length=10), nullable=False),
+            sa.Column('status', sa.String(length=20), nullable=False),
+            sa.Column('requested_by', sa.Integer(), nullable=False),
+            sa.Column('created_at', sa.DateTime(), nullable=True),
+            sa.Column('started_at', sa.DateTime(), nullable=True),
+            sa.Column('finished_at', sa.DateTime(), nullable=True),
+            sa.Column('row_count', sa.Integer(), nullable=True),
+            sa.Column('file_size', sa.Integer(), nullable=True),
+            sa.Column('error', sa.Text(), nullable=True),
+            sa.ForeignKeyConstraint(['requested_by'], ['user.id']),
+            sa.PrimaryKeyConstraint('id'),
+        )
+
+
+def downgrade():
+    op.drop_table('report_job')
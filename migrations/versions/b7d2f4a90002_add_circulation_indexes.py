@@ -0,0 +1,49 @@
+"""add indexes for circulation, fines, audit and email queries
+
+Revision ID: b7d2f4a90002
+Revises: a1c3e5f70001
+Create Date: 2025-10-21 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2f4a90002'
+down_revision = 'a1c3e5f70001'
+branch_labels = None
+depends_on = None
+
+
+OPEN_LOAN = sa.text('returned_at IS NULL')
+
+# (name, table, columns, partial on open loans)
+INDEXES = [
+    ('ix_borrow_record_borrowed_at', 'borrow_record', ['borrowed_at', 'id'], False),
+    ('ix_borrow_record_returned_at', 'borrow_record', ['returned_at', 'id'], False),
+    ('ix_borrow_record_book_borrowed', 'borrow_record', ['book_id', 'borrowed_at'], False),
+    ('ix_borrow_record_student_borrowed', 'borrow_record', ['student_id', 'borrowed_at'], False),
+    ('ix_borrow_record_staff_borrowed', 'borrow_record', ['staff_id', 'borrowed_at'], False),
+    ('ix_borrow_record_open_due', 'borrow_record', ['due_date', 'id'], True),
+    ('ix_borrow_record_open_borrowed', 'borrow_record', ['borrowed_at', 'id'], True),
+    ('ix_borrow_record_open_student', 'borrow_record', ['student_id'], True),
+    ('ix_borrow_record_open_book', 'borrow_record', ['book_id'], True),
+    ('ix_fine_student_status', 'fine', ['student_id', 'paid', 'waived'], False),
+    ('ix_fine_status_created', 'fine', ['paid', 'waived', 'created_at'], False),
+    ('ix_fine_created_at', 'fine', ['created_at'], False),
+    ('ix_audit_log_timestamp', 'audit_log', ['timestamp', 'id'], False),
+    ('ix_audit_log_entity', 'audit_log', ['entity_type', 'entity_id', 'timestamp'], False),
+    ('ix_email_log_status_type', 'email_log', ['status', 'email_type'], False),
+]
+
+
+def upgrade():
+    for name, table, columns, open_loans_only in INDEXES:
+        where = {'sqlite_where': OPEN_LOAN, 'postgresql_where': OPEN_LOAN} if open_loans_only else {}
+        op.create_index(name, table, columns, if_not_exists=True, **where)
+
+
+def downgrade():
+    for name, table, columns, open_loans_only in reversed(INDEXES):
+        op.drop_index(name, table_name=table, if_exists=True)
@@ -0,0 +1,47 @@
+"""add last_borrowed_at to students and staff
+
+Revision ID: b9e3a7c20008
+Revises: a8d2f6b10007
+Create Date: 2025-10-30 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b9e3a7c20008'
+down_revision = 'a8d2f6b10007'
+branch_labels = None
+depends_on = None
+
+
+# Borrower table -> its foreign key column on borrow_record
+BORROWERS = {
+    'student': 'student_id',
+    'staff': 'staff_id',
+}
+
+
+def upgrade():
+    inspector = sa.inspect(op.get_bind())
+
+    for table, column in BORROWERS.items():
+        # Tables are created by db.create_all() on startup, so the column may
+        # already exist on a fresh database
+        if 'last_borrowed_at' not in [c['name'] for c in inspector.get_columns(table)]:
+            op.add_column(table, sa.Column('last_borrowed_at', sa.DateTime(), nullable=True))
+        op.create_index(f'ix_{table}_last_borrowed_at', table, ['last_borrowed_at'], if_not_exists=True)
+
+        # Backfill from borrow records (served by the (borrower, borrowed_at) indexes)
+        op.execute(
+            f"UPDATE {table} SET last_borrowed_at = ("
+            f"SELECT MAX(borrowed_at) FROM borrow_record WHERE borrow_record.{column} = {table}.id)"
+        )
+
+
+def downgrade():
+    for table in BORROWERS:
+        op.drop_index(f'ix_{table}_last_borrowed_at', table_name=table, if_exists=True)
+        with op.batch_alter_table(table) as batch_op:
+            batch_op.drop_column('last_borrowed_at')
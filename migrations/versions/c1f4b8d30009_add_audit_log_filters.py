@@ -0,0 +1,54 @@
+"""add audit log filter indexes and lookup table
+
+Revision ID: c1f4b8d30009
+Revises: b9e3a7c20008
+Create Date: 2025-10-31 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c1f4b8d30009'
+down_revision = 'b9e3a7c20008'
+branch_labels = None
+depends_on = None
+
+
+# Index name -> columns; one per filter combination of the audit browser
+INDEXES = {
+    'ix_audit_log_entity_type_timestamp': ['entity_type', 'timestamp', 'id'],
+    'ix_audit_log_action_timestamp': ['action', 'timestamp', 'id'],
+    'ix_audit_log_user_timestamp': ['user_id', 'timestamp', 'id'],
+    'ix_audit_log_entity_type_user_timestamp': ['entity_type', 'user_id', 'timestamp', 'id'],
+    'ix_audit_log_action_user_timestamp': ['action', 'user_id', 'timestamp', 'id'],
+}
+
+
+def upgrade():
+    for name, columns in INDEXES.items():
+        op.create_index(name, 'audit_log', columns, if_not_exists=True)
+
+    # Tables are created by db.create_all() on startup, so the table may
+    # already exist on a fresh database
+    if not sa.inspect(op.get_bind()).has_table('audit_log_value'):
+        op.create_table(
+            'audit_log_value',
+            sa.Column('field', sa.String(length=20), nullable=False),
+            sa.Column('value', sa.String(length=100), nullable=False),
+            sa.PrimaryKeyConstraint('field', 'value'),
+        )
+
+    op.execute("DELETE FROM audit_log_value")
+    for field in ('action', 'entity_type'):
+        op.execute(
+            f"INSERT INTO audit_log_value (field, value) "
+            f"SELECT DISTINCT '{field}', {field} FROM audit_log WHERE {field} IS NOT NULL"
+        )
+
+
+def downgrade():
+    op.drop_table('audit_log_value')
+    for name in INDEXES:
+        op.drop_index(name, table_name='audit_log', if_exists=True)
@@ -0,0 +1,88 @@
+"""add borrower identifier lookup table and staff number
+
+Revision ID: c4e8a1b20003
+Revises: b7d2f4a90002
+Create Date: 2025-10-22 09:00:00.000000
+
+"""
+import re
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c4e8a1b20003'
+down_revision = 'b7d2f4a90002'
+branch_labels = None
+depends_on = None
+
+
+STUDENT_ID_TYPES = ('registration_number', 'id_number', 'passport_number')
+
+
+def normalize(value):
+    # Same rule as utils.borrower_lookup.normalize_identifier
+    return re.sub(r'[\s\-]+', '', value).upper()
+
+
+def upgrade():
+    bind = op.get_bind()
+    inspector = sa.inspect(bind)
+
+    # Tables are created by db.create_all() on startup, so the table may
+    # already exist on a fresh database
+    if 'staff_number' not in [c['name'] for c in inspector.get_columns('staff')]:
+        with op.batch_alter_table('staff') as batch_op:
+            batch_op.add_column(sa.Column('staff_number', sa.String(length=50), nullable=True))
+            batch_op.create_unique_constraint('uq_staff_staff_number', ['staff_number'])
+
+    if not inspector.has_table('borrower_identifier'):
+        op.create_table(
+            'borrower_identifier',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('value', sa.String(length=50), nullable=False),
+            sa.Column('id_type', sa.String(length=20), nullable=False),
+            sa.Column('student_id', sa.Integer(), nullable=True),
+            sa.Column('staff_id', sa.Integer(), nullable=True),
+            sa.ForeignKeyConstraint(['student_id'], ['student.id']),
+            sa.ForeignKeyConstraint(['staff_id'], ['staff.id']),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('value'),
+        )
+        op.create_index('ix_borrower_identifier_student_id', 'borrower_identifier', ['student_id'])
+        op.create_index('ix_borrower_identifier_staff_id', 'borrower_identifier', ['staff_id'])
+
+    # Backfill, skipping numbers that normalize to one already taken
+    if bind.execute(sa.text('SELECT 1 FROM borrower_identifier')).first():
+        return
+
+    rows = []
+    seen = set()
+    students = bind.execute(sa.text(
+        'SELECT id, registration_number, id_number, passport_number FROM student'
+    )).fetchall()
+    for student in students:
+        for id_type, raw in zip(STUDENT_ID_TYPES, student[1:]):
+            if raw and normalize(raw) not in seen:
+                seen.add(normalize(raw))
+                rows.append({'value': normalize(raw), 'id_type': id_type, 'student_id': student[0], 'staff_id': None})
+    staff_members = bind.execute(sa.text(
+        'SELECT id, staff_number FROM staff WHERE staff_number IS NOT NULL'
+    )).fetchall()
+    for staff_id, raw in staff_members:
+        if normalize(raw) not in seen:
+            seen.add(normalize(raw))
+            rows.append({'value': normalize(raw), 'id_type': 'staff_number', 'student_id': None, 'staff_id': staff_id})
+
+    if rows:
+        bind.execute(sa.text(
+            'INSERT INTO borrower_identifier (value, id_type, student_id, staff_id) '
+            'VALUES (:value, :id_type, :student_id, :staff_id)'
+        ), rows)
+
+
+def downgrade():
+    op.drop_table('borrower_identifier')
+    with op.batch_alter_table('staff') as batch_op:
+        batch_op.drop_column('staff_number')
@@ -0,0 +1,34 @@
+"""add shared summary cache table
+
+Revision ID: d2a6c8e40004
+Revises: c4e8a1b20003
+Create Date: 2025-10-24 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd2a6c8e40004'
+down_revision = 'c4e8a1b20003'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tables are created by db.create_all() on startup, so the table may
+    # already exist on a fresh database
+    if not sa.inspect(op.get_bind()).has_table('summary_cache'):
+        op.create_table(
+            'summary_cache',
+            sa.Column('key', sa.String(length=100), nullable=False),
+            sa.Column('value', sa.Text(), nullable=True),
+            sa.Column('generation', sa.Integer(), nullable=False),
+            sa.Column('expires_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('key'),
+        )
+
+
+def downgrade():
+    op.drop_table('summary_cache')
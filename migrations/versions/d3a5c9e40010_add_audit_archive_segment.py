@@ -0,0 +1,41 @@
+"""add audit archive segment index
+
+Revision ID: d3a5c9e40010
+Revises: c1f4b8d30009
+Create Date: 2025-11-01 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd3a5c9e40010'
+down_revision = 'c1f4b8d30009'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tables are created by db.create_all() on startup, so the table may
+    # already exist on a fresh database
+    if not sa.inspect(op.get_bind()).has_table('audit_archive_segment'):
+        op.create_table(
+            'audit_archive_segment',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('month', sa.String(length=7), nullable=False),
+            sa.Column('filename', sa.String(length=200), nullable=False),
+            sa.Column('first_timestamp', sa.DateTime(), nullable=False),
+            sa.Column('last_timestamp', sa.DateTime(), nullable=False),
+            sa.Column('row_count', sa.Integer(), nullable=False),
+            sa.Column('file_size', sa.Integer(), nullable=False),
+            sa.Column('entity_types', sa.Text(), nullable=False),
+            sa.Column('actions', sa.Text(), nullable=False),
+            sa.Column('updated_at', sa.DateTime(), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sa.UniqueConstraint('month'),
+        )
+
+
+def downgrade():
+    op.drop_table('audit_archive_segment')
@@ -0,0 +1,56 @@
+"""add daily circulation rollup tables
+
+Revision ID: e5b9d3f60005
+Revises: d2a6c8e40004
+Create Date: 2025-10-27 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'e5b9d3f60005'
+down_revision = 'd2a6c8e40004'
+branch_labels = None
+depends_on = None
+
+# Table name -> (key column, key type); every borrow rollup has day + key + borrows
+BORROW_ROLLUPS = {
+    'book_daily_borrows': ('book_id', sa.Integer()),
+    'category_daily_borrows': ('category_id', sa.Integer()),
+    'borrower_daily_borrows': ('borrower_type', sa.String(length=10)),
+    'student_daily_borrows': ('student_id', sa.Integer()),
+}
+
+
+def upgrade():
+    # Tables are created by db.create_all() on startup, so they may already
+    # exist on a fresh database. They are filled from the borrow records the
+    # first time the app starts (utils.rollups.init_rollups).
+    inspector = sa.inspect(op.get_bind())
+
+    for table, (key, key_type) in BORROW_ROLLUPS.items():
+        if not inspector.has_table(table):
+            op.create_table(
+                table,
+                sa.Column('day', sa.Date(), nullable=False),
+                sa.Column(key, key_type, nullable=False),
+                sa.Column('borrows', sa.Integer(), nullable=False),
+                sa.PrimaryKeyConstraint('day', key),
+            )
+
+    if not inspector.has_table('fine_daily_collections'):
+        op.create_table(
+            'fine_daily_collections',
+            sa.Column('day', sa.Date(), nullable=False),
+            sa.Column('fines_paid', sa.Integer(), nullable=False),
+            sa.Column('amount_paid', sa.Float(), nullable=False),
+            sa.PrimaryKeyConstraint('day'),
+        )
+
+
+def downgrade():
+    op.drop_table('fine_daily_collections')
+    for table in reversed(list(BORROW_ROLLUPS)):
+        op.drop_table(table)
@@ -0,0 +1,136 @@
+"""move audit, email and backup logs to the log database
+
+Revision ID: e8b2d4f60011
+Revises: d3a5c9e40010
+Create Date: 2025-11-03 09:00:00.000000
+
+"""
+import json
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = 'e8b2d4f60011'
+down_revision = 'd3a5c9e40010'
+branch_labels = None
+depends_on = None
+
+
+# Tables of the log bind (models.LOG_BIND) that used to be in the main database
+LOG_TABLES = ['audit_log', 'audit_archive_segment', 'backup_log', 'email_log']
+
+# Rows copied per INSERT
+CHUNK_SIZE = 1000
+
+
+def _log_engine():
+    return current_app.extensions['sqlalchemy'].engines['logs']
+
+
+def _same_database(engine):
+    # The default on PostgreSQL: the logs stay where they are, on their own pool
+    main_url = op.get_bind().engine.url.render_as_string(hide_password=False)
+    return engine.url.render_as_string(hide_password=False) == main_url
+
+
+def _copy(source, target, name, target_table=None):
+    """Copy a table between connections, returning the number of rows"""
+    source_table = sa.Table(name, sa.MetaData(), autoload_with=source)
+    if target_table is None:
+        target_table = sa.Table(name, sa.MetaData(), autoload_with=target)
+    columns = [column.name for column in source_table.columns if column.name in target_table.columns]
+
+    # Rows keep their IDs (audit entries refer to email and backup logs by
+    # ID) unless logs were written to the target before the move, in which
+    # case they are appended with new IDs rather than dropped
+    keep_ids = target.execute(sa.select(sa.func.count()).select_from(target_table)).scalar() == 0
+    if not keep_ids and 'id' in columns:
+        columns.remove('id')
+
+    copied = 0
+    result = source.execute(sa.select(*[source_table.c[column] for column in columns]))
+    for rows in result.mappings().partitions(CHUNK_SIZE):
+        target.execute(sa.insert(target_table), [dict(row) for row in rows])
+        copied += len(rows)
+
+    if copied and keep_ids and 'id' in columns and target.dialect.name == 'postgresql':
+        target.execute(sa.text(
+            f"SELECT setval(pg_get_serial_sequence('{name}', 'id'), (SELECT max(id) FROM {name}))"
+        ))
+    return copied
+
+
+def _drop(connection, name):
+    if connection.dialect.name == 'sqlite' and name == 'audit_log':
+        # Its full-text index; the triggers go with the table
+        connection.execute(sa.text("DROP TABLE IF EXISTS audit_log_fts"))
+    sa.Table(name, sa.MetaData()).drop(connection)
+
+
+def _rebuild_values(connection):
+    # Filter values of the moved entries, and of the archived months
+    values = set()
+    for field in ('action', 'entity_type'):
+        values.update((field, value) for (value,) in connection.execute(sa.text(
+            f"SELECT DISTINCT {field} FROM audit_log WHERE {field} IS NOT NULL"
+        )))
+    for entity_types, actions in connection.execute(sa.text(
+        "SELECT entity_types, actions FROM audit_archive_segment"
+    )):
+        values.update(('entity_type', value) for value in json.loads(entity_types))
+        values.update(('action', value) for value in json.loads(actions))
+
+    connection.execute(sa.text("DELETE FROM audit_log_value"))
+    if values:
+        connection.execute(sa.text("INSERT INTO audit_log_value (field, value) VALUES (:field, :value)"),
+                           [{'field': field, 'value': value} for field, value in sorted(values)])
+
+
+def upgrade():
+    log_engine = _log_engine()
+    if _same_database(log_engine):
+        return
+
+    bind = op.get_bind()
+    existing = set(sa.inspect(bind).get_table_names())
+    log_metadata = current_app.extensions['sqlalchemy'].metadatas['logs']
+    log_metadata.create_all(log_engine)
+
+    with log_engine.begin() as target:
+        for name in LOG_TABLES:
+            if name in existing:
+                _copy(bind, target, name, log_metadata.tables[name])
+        if 'audit_log' in existing:
+            _rebuild_values(target)
+
+    for name in LOG_TABLES + ['audit_log_value']:
+        if name in existing:
+            _drop(bind, name)
+    if 'data_version' in existing:
+        # Their versions are now kept in log_data_version
+        bind.execute(sa.text("DELETE FROM data_version WHERE table_name IN ('audit_log', 'backup_log', 'email_log')"))
+
+
+def downgrade():
+    log_engine = _log_engine()
+    if _same_database(log_engine):
+        return
+
+    bind = op.get_bind()
+    with log_engine.begin() as source:
+        # The tables as they are in the log database, not as the models are now
+        existing = set(sa.inspect(source).get_table_names())
+        main_metadata = sa.MetaData()
+        for name in LOG_TABLES + ['audit_log_value']:
+            if name in existing:
+                sa.Table(name, main_metadata, autoload_with=source)
+        main_metadata.create_all(bind)
+
+        for name in LOG_TABLES + ['audit_log_value']:
+            if name in existing:
+                _copy(source, bind, name, main_metadata.tables[name])
+        for name in LOG_TABLES + ['audit_log_value']:
+            if name in existing:
+                _drop(source, name)
@@ -0,0 +1,32 @@
+"""add per-table data version counters
+
+Revision ID: f6c0e4a70006
+Revises: e5b9d3f60005
+Create Date: 2025-10-28 09:00:00.000000
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f6c0e4a70006'
+down_revision = 'e5b9d3f60005'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Tables are created by db.create_all() on startup, so the table may
+    # already exist on a fresh database
+    if not sa.inspect(op.get_bind()).has_table('data_version'):
+        op.create_table(
+            'data_version',
+            sa.Column('table_name', sa.String(length=64), nullable=False),
+            sa.Column('version', sa.Integer(), nullable=False),
+            sa.PrimaryKeyConstraint('table_name'),
+        )
+
+
+def downgrade():
+    op.drop_table('data_version')
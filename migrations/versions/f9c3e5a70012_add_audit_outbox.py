@@ -0,0 +1,73 @@
+"""add audit outbox
+
+Revision ID: f9c3e5a70012
+Revises: e8b2d4f60011
+Create Date: 2025-11-05 09:00:00.000000
+
+"""
+from contextlib import nullcontext
+from alembic import op
+import sqlalchemy as sa
+from flask import current_app
+
+
+# revision identifiers, used by Alembic.
+revision = 'f9c3e5a70012'
+down_revision = 'e8b2d4f60011'
+branch_labels = None
+depends_on = None
+
+
+def _log_connection():
+    # audit_log is in the log database (models.LOG_BIND), which is this one
+    # when both URLs are the same
+    log_engine = current_app.extensions['sqlalchemy'].engines['logs']
+    bind = op.get_bind()
+    if log_engine.url.render_as_string(hide_password=False) == bind.engine.url.render_as_string(hide_password=False):
+        return nullcontext(bind)
+    return log_engine.begin()
+
+
+def upgrade():
+    # Tables are created by db.create_all() on startup, so the table may
+    # already exist on a fresh database
+    if not sa.inspect(op.get_bind()).has_table('audit_outbox'):
+        op.create_table(
+            'audit_outbox',
+            sa.Column('id', sa.Integer(), nullable=False),
+            sa.Column('user_id', sa.Integer(), nullable=False),
+            sa.Column('action', sa.String(length=100), nullable=False),
+            sa.Column('entity_type', sa.String(length=50), nullable=False),
+            sa.Column('entity_id', sa.Integer(), nullable=True),
+            sa.Column('details', sa.Text(), nullable=True),
+            sa.Column('timestamp', sa.DateTime(), nullable=True),
+            sa.Column('ip_address', sa.String(length=45), nullable=True),
+            sa.PrimaryKeyConstraint('id'),
+            sqlite_autoincrement=True,
+        )
+
+    with _log_connection() as connection:
+        columns = [column['name'] for column in sa.inspect(connection).get_columns('audit_log')]
+        if 'outbox_id' not in columns:
+            connection.execute(sa.text("ALTER TABLE audit_log ADD COLUMN outbox_id INTEGER"))
+            connection.execute(sa.text("CREATE UNIQUE INDEX ix_audit_log_outbox_id ON audit_log (outbox_id)"))
+
+
+def downgrade():
+    bind = op.get_bind()
+    with _log_connection() as connection:
+        # Entries not copied yet would go with the outbox
+        copied = {outbox_id for (outbox_id,) in connection.execute(sa.text(
+            "SELECT outbox_id FROM audit_log WHERE outbox_id IS NOT NULL"
+        ))}
+        waiting = [dict(row) for row in bind.execute(sa.text(
+            "SELECT id, user_id, action, entity_type, entity_id, details, timestamp, ip_address FROM audit_outbox"
+        )).mappings() if row['id'] not in copied]
+        if waiting:
+            connection.execute(sa.text(
+                "INSERT INTO audit_log (user_id, action, entity_type, entity_id, details, timestamp, ip_address) "
+                "VALUES (:user_id, :action, :entity_type, :entity_id, :details, :timestamp, :ip_address)"
+            ), waiting)
+        connection.execute(sa.text("DROP INDEX IF EXISTS ix_audit_log_outbox_id"))
+        connection.execute(sa.text("ALTER TABLE audit_log DROP COLUMN outbox_id"))
+    op.drop_table('audit_outbox')
@@ -1,10 +1,15 @@
 from flask_sqlalchemy import SQLAlchemy
 from flask_login import UserMixin
+from sqlalchemy.ext.hybrid import hybrid_property
 from datetime import datetime, timedelta
 
 # Create SQLAlchemy instance that will be initialized in app.py
 db = SQLAlchemy()
 
+# Bind key of the log database (audit, email and backup logs). Rows there
+# refer to users, students and loans by ID only, without foreign keys.
+LOG_BIND = 'logs'
+
 class User(UserMixin, db.Model):
     id = db.Column(db.Integer, primary_key=True)
     username = db.Column(db.String(80), unique=True, nullable=False)
@@ -33,6 +38,7 @@ class Student(db.Model):
     phone = db.Column(db.String(20))
     membership_status = db.Column(db.String(20), default='active')  # active, suspended, expired
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_borrowed_at = db.Column(db.DateTime, nullable=True, index=True)  # Moved forward by every checkout
     
     # Relationships
     borrow_records = db.relationship('BorrowRecord', backref='student_ref', lazy=True)
@@ -57,18 +63,38 @@ class Student(db.Model):
     def total_fines(self):
         """Get total unpaid fines"""
         return sum(fine.amount for fine in self.fines if not fine.paid)
+    
+    @property
+    def days_inactive(self):
+        """Days since the student last borrowed (or joined, if they never have)"""
+        since = self.last_borrowed_at or self.created_at
+        return (datetime.utcnow() - since).days if since else None
 
 class Staff(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     name = db.Column(db.String(100), nullable=False)
     staff_type = db.Column(db.String(20), nullable=False)  # teacher, intern
+    staff_number = db.Column(db.String(50), unique=True, nullable=True)  # Staff card number
     email = db.Column(db.String(120))
     phone = db.Column(db.String(20))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    last_borrowed_at = db.Column(db.DateTime, nullable=True, index=True)  # Moved forward by every checkout
     
     # Relationships
     borrow_records = db.relationship('BorrowRecord', backref='staff_ref', lazy=True)
 
+class BorrowerIdentifier(db.Model):
+    """Normalized copy of every student and staff ID, for exact-match card lookups"""
+    id = db.Column(db.Integer, primary_key=True)
+    value = db.Column(db.String(50), nullable=False, index=True)  # Normalized, see utils.borrower_lookup; not unique
+    id_type = db.Column(db.String(20), nullable=False)  # registration_number, id_number, passport_number, staff_number
+    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=True, index=True)
+    staff_id = db.Column(db.Integer, db.ForeignKey('staff.id'), nullable=True, index=True)
+    
+    # Relationships
+    student = db.relationship('Student', lazy=True)
+    staff = db.relationship('Staff', lazy=True)
+
 class Book(db.Model):
     id = db.Column(db.Integer, primary_key=True)
     title = db.Column(db.String(200), nullable=False)
@@ -78,17 +104,17 @@ class Book(db.Model):
     unique_id = db.Column(db.String(50), unique=True, nullable=False)
     category_id = db.Column(db.Integer, db.ForeignKey('category.id'), nullable=True)
     total_copies = db.Column(db.Integer, default=1)
+    borrowed_count = db.Column(db.Integer, nullable=False, default=0, server_default='0')  # Open loans, maintained on borrow/return
     shelf_location = db.Column(db.String(50))
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     
     # Relationships
     borrow_records = db.relationship('BorrowRecord', backref='book_ref', lazy=True)
     
-    @property
+    @hybrid_property
     def available_copies(self):
-        """Get number of available copies"""
-        borrowed_count = BorrowRecord.query.filter_by(book_id=self.id, returned_at=None).count()
-        return self.total_copies - borrowed_count
+        """Get number of available copies (usable in queries as well)"""
+        return self.total_copies - self.borrowed_count
     
     @property
     def category_name(self):
@@ -96,6 +122,24 @@ class Book(db.Model):
         return self.category_ref.name if self.category_ref else 'Uncategorized'
 
 class BorrowRecord(db.Model):
+    __table_args__ = (
+        # Circulation lists and history pages, newest first
+        db.Index('ix_borrow_record_borrowed_at', 'borrowed_at', 'id'),
+        db.Index('ix_borrow_record_returned_at', 'returned_at', 'id'),
+        db.Index('ix_borrow_record_book_borrowed', 'book_id', 'borrowed_at'),
+        db.Index('ix_borrow_record_student_borrowed', 'student_id', 'borrowed_at'),
+        db.Index('ix_borrow_record_staff_borrowed', 'staff_id', 'borrowed_at'),
+        # Open loans only (partial indexes where the database supports them)
+        db.Index('ix_borrow_record_open_due', 'due_date', 'id',
+                 sqlite_where=db.text('returned_at IS NULL'), postgresql_where=db.text('returned_at IS NULL')),
+        db.Index('ix_borrow_record_open_borrowed', 'borrowed_at', 'id',
+                 sqlite_where=db.text('returned_at IS NULL'), postgresql_where=db.text('returned_at IS NULL')),
+        db.Index('ix_borrow_record_open_student', 'student_id',
+                 sqlite_where=db.text('returned_at IS NULL'), postgresql_where=db.text('returned_at IS NULL')),
+        db.Index('ix_borrow_record_open_book', 'book_id',
+                 sqlite_where=db.text('returned_at IS NULL'), postgresql_where=db.text('returned_at IS NULL')),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     book_id = db.Column(db.Integer, db.ForeignKey('book.id'), nullable=False)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=True)
@@ -141,6 +185,12 @@ class BorrowRecord(db.Model):
         return "Student" if self.student_id else "Staff"
 
 class Fine(db.Model):
+    __table_args__ = (
+        db.Index('ix_fine_student_status', 'student_id', 'paid', 'waived'),
+        db.Index('ix_fine_status_created', 'paid', 'waived', 'created_at'),
+        db.Index('ix_fine_created_at', 'created_at'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=False)
     borrow_record_id = db.Column(db.Integer, db.ForeignKey('borrow_record.id'), nullable=False)
@@ -167,29 +217,84 @@ class Fine(db.Model):
     waived_by_user = db.relationship('User', backref='waived_fines', lazy=True)
 
 class AuditLog(db.Model):
+    __bind_key__ = LOG_BIND
+    __table_args__ = (
+        db.Index('ix_audit_log_timestamp', 'timestamp', 'id'),
+        db.Index('ix_audit_log_entity', 'entity_type', 'entity_id', 'timestamp'),
+        # Audit browser filters, newest first; an action belongs to a single
+        # entity type, so action indexes also serve action + entity type
+        db.Index('ix_audit_log_entity_type_timestamp', 'entity_type', 'timestamp', 'id'),
+        db.Index('ix_audit_log_action_timestamp', 'action', 'timestamp', 'id'),
+        db.Index('ix_audit_log_user_timestamp', 'user_id', 'timestamp', 'id'),
+        db.Index('ix_audit_log_entity_type_user_timestamp', 'entity_type', 'user_id', 'timestamp', 'id'),
+        db.Index('ix_audit_log_action_user_timestamp', 'action', 'user_id', 'timestamp', 'id'),
+        db.Index('ix_audit_log_outbox_id', 'outbox_id', unique=True),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
-    user_id = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    user_id = db.Column(db.Integer, nullable=False)
     action = db.Column(db.String(100), nullable=False)  # e.g., 'CREATE_STUDENT', 'BORROW_BOOK', 'WAIVE_FINE'
     entity_type = db.Column(db.String(50), nullable=False)  # e.g., 'Student', 'Book', 'BorrowRecord'
     entity_id = db.Column(db.Integer, nullable=True)  # ID of the affected entity
     details = db.Column(db.Text, nullable=True)  # JSON string with action details
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
     ip_address = db.Column(db.String(45), nullable=True)  # User's IP address
+    outbox_id = db.Column(db.Integer, nullable=True)  # AuditOutbox row it was copied from, if any
     
     # Relationships
-    user = db.relationship('User', backref='audit_logs', lazy=True)
+    user = db.relationship('User', primaryjoin='foreign(AuditLog.user_id) == User.id', backref='audit_logs', lazy=True)
+
+class AuditOutbox(db.Model):
+    """
+    Audit entries committed with a change to the main database, waiting to be
+    copied to the log database by utils.audit_logger.move_audit_outbox()
+    """
+    # IDs are never reused once the outbox is emptied; audit_log.outbox_id
+    # records which rows have been copied
+    __table_args__ = {'sqlite_autoincrement': True}
+    
+    id = db.Column(db.Integer, primary_key=True)
+    user_id = db.Column(db.Integer, nullable=False)
+    action = db.Column(db.String(100), nullable=False)
+    entity_type = db.Column(db.String(50), nullable=False)
+    entity_id = db.Column(db.Integer, nullable=True)
+    details = db.Column(db.Text, nullable=True)
+    timestamp = db.Column(db.DateTime, default=datetime.utcnow)
+    ip_address = db.Column(db.String(45), nullable=True)
+
+class AuditLogValue(db.Model):
+    """Distinct actions and entity types in the audit log, for the filter dropdowns"""
+    __bind_key__ = LOG_BIND
+    field = db.Column(db.String(20), primary_key=True)  # 'action' or 'entity_type'
+    value = db.Column(db.String(100), primary_key=True)
+
+class AuditArchiveSegment(db.Model):
+    """One month of audit entries moved out of audit_log by utils.audit_archive"""
+    __bind_key__ = LOG_BIND
+    id = db.Column(db.Integer, primary_key=True)
+    month = db.Column(db.String(7), unique=True, nullable=False)  # YYYY-MM
+    filename = db.Column(db.String(200), nullable=False)  # gzip NDJSON file in AUDIT_ARCHIVE_DIR
+    first_timestamp = db.Column(db.DateTime, nullable=False)
+    last_timestamp = db.Column(db.DateTime, nullable=False)
+    row_count = db.Column(db.Integer, nullable=False)
+    file_size = db.Column(db.Integer, nullable=False)  # Size in bytes
+    entity_types = db.Column(db.Text, nullable=False)  # JSON list
+    actions = db.Column(db.Text, nullable=False)  # JSON list
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
 
 class BackupLog(db.Model):
+    __bind_key__ = LOG_BIND
+    
     id = db.Column(db.Integer, primary_key=True)
     filename = db.Column(db.String(200), nullable=False)
-    created_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_by = db.Column(db.Integer, nullable=False)
     created_at = db.Column(db.DateTime, default=datetime.utcnow)
     file_size = db.Column(db.Integer, nullable=True)  # Size in bytes
     status = db.Column(db.String(20), default='completed')  # completed, failed, in_progress
     description = db.Column(db.Text, nullable=True)
     
     # Relationships
-    created_by_user = db.relationship('User', backref='backups_created', lazy=True)
+    created_by_user = db.relationship('User', primaryjoin='foreign(BackupLog.created_by) == User.id', backref='backups_created', lazy=True)
 
 class NotificationPreference(db.Model):
     id = db.Column(db.Integer, primary_key=True)
@@ -204,17 +309,88 @@ class NotificationPreference(db.Model):
     student = db.relationship('Student', backref='notification_preferences', lazy=True)
 
 class EmailLog(db.Model):
+    __bind_key__ = LOG_BIND
+    __table_args__ = (
+        db.Index('ix_email_log_status_type', 'status', 'email_type'),
+    )
+    
     id = db.Column(db.Integer, primary_key=True)
     recipient_email = db.Column(db.String(120), nullable=False)
     subject = db.Column(db.String(200), nullable=False)
     body = db.Column(db.Text, nullable=False)
     email_type = db.Column(db.String(50), nullable=False)  # 'due_reminder', 'overdue_notice'
-    student_id = db.Column(db.Integer, db.ForeignKey('student.id'), nullable=True)
-    borrow_record_id = db.Column(db.Integer, db.ForeignKey('borrow_record.id'), nullable=True)
+    student_id = db.Column(db.Integer, nullable=True)
+    borrow_record_id = db.Column(db.Integer, nullable=True)
     sent_at = db.Column(db.DateTime, default=datetime.utcnow)
     status = db.Column(db.String(20), default='sent')  # sent, failed, pending
     error_message = db.Column(db.Text, nullable=True)
     
     # Relationships
-    student = db.relationship('Student', backref='emails_received', lazy=True)
-    borrow_record = db.relationship('BorrowRecord', backref='emails_sent', lazy=True)
\ No newline at end of file
+    student = db.relationship('Student', primaryjoin='foreign(EmailLog.student_id) == Student.id', backref='emails_received', lazy=True)
+    borrow_record = db.relationship('BorrowRecord', primaryjoin='foreign(EmailLog.borrow_record_id) == BorrowRecord.id', backref='emails_sent', lazy=True)
+
+class SummaryCache(db.Model):
+    """Precomputed page summaries shared by all worker processes"""
+    key = db.Column(db.String(100), primary_key=True)
+    value = db.Column(db.Text, nullable=True)  # JSON, NULL once invalidated
+    generation = db.Column(db.Integer, nullable=False, default=0)  # Bumped on every invalidation
+    expires_at = db.Column(db.DateTime, nullable=True)
+
+class BookDailyBorrows(db.Model):
+    """Borrows per book per day, maintained by utils.rollups"""
+    day = db.Column(db.Date, primary_key=True)
+    book_id = db.Column(db.Integer, primary_key=True)
+    borrows = db.Column(db.Integer, nullable=False, default=0)
+
+class CategoryDailyBorrows(db.Model):
+    """Borrows per category per day (category_id 0 = uncategorized)"""
+    day = db.Column(db.Date, primary_key=True)
+    category_id = db.Column(db.Integer, primary_key=True)
+    borrows = db.Column(db.Integer, nullable=False, default=0)
+
+class BorrowerDailyBorrows(db.Model):
+    """Borrows per borrower type ('student' / 'staff') per day"""
+    day = db.Column(db.Date, primary_key=True)
+    borrower_type = db.Column(db.String(10), primary_key=True)
+    borrows = db.Column(db.Integer, nullable=False, default=0)
+
+class StudentDailyBorrows(db.Model):
+    """Borrows per student per day"""
+    day = db.Column(db.Date, primary_key=True)
+    student_id = db.Column(db.Integer, primary_key=True)
+    borrows = db.Column(db.Integer, nullable=False, default=0)
+
+class FineDailyCollections(db.Model):
+    """Fines paid per day"""
+    day = db.Column(db.Date, primary_key=True)
+    fines_paid = db.Column(db.Integer, nullable=False, default=0)
+    amount_paid = db.Column(db.Float, nullable=False, default=0.0)
+
+class DataVersion(db.Model):
+    """Per-table change counter, bumped by every commit that writes to the table"""
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class LogDataVersion(db.Model):
+    """DataVersion for the tables of the log database, kept in that database"""
+    __bind_key__ = LOG_BIND
+    table_name = db.Column(db.String(64), primary_key=True)
+    version = db.Column(db.Integer, nullable=False, default=0)
+
+class ReportJob(db.Model):
+    """Report generated in the background by utils.report_jobs"""
+    id = db.Column(db.Integer, primary_key=True)
+    report = db.Column(db.String(50), nullable=False)
+    parameters = db.Column(db.Text, nullable=True)  # JSON string
+    file_format = db.Column(db.String(10), nullable=False)  # csv, html
+    status = db.Column(db.String(20), nullable=False, default='queued')  # queued, running, completed, failed
+    requested_by = db.Column(db.Integer, db.ForeignKey('user.id'), nullable=False)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    row_count = db.Column(db.Integer, nullable=True)
+    file_size = db.Column(db.Integer, nullable=True)  # Size in bytes
+    error = db.Column(db.Text, nullable=True)
+    
+    # Relationships
+    requested_by_user = db.relationship('User', backref='report_jobs', lazy=True)
@@ -0,0 +1,46 @@
+#!/usr/bin/env python3
+"""
+Circulation Rollup Rebuild Script
+
+Reports and charts read borrow and fine totals from daily rollup tables,
+which are updated in the same transaction as every checkout and fine
+payment. This script recomputes the rollups from the borrow records and
+fines, for use after bulk loads, manual database edits or restored backups.
+
+Usage:
+    python rebuild_rollups.py                      # Rebuild all history
+    python rebuild_rollups.py --since 2025-01-01   # Rebuild from a day onwards
+"""
+
+import argparse
+import sys
+from datetime import datetime
+from main import app
+from models import db
+from utils.database import begin_write_transaction
+from utils.rollups import rebuild_rollups
+
+def main():
+    parser = argparse.ArgumentParser(description='Recompute the daily circulation rollups')
+    parser.add_argument('--since', help='First day to rebuild (YYYY-MM-DD); default is all history')
+
+    args = parser.parse_args()
+
+    since = None
+    if args.since:
+        try:
+            since = datetime.strptime(args.since, '%Y-%m-%d').date()
+        except ValueError:
+            print(f"✗ Invalid date: {args.since} (expected YYYY-MM-DD)")
+            sys.exit(1)
+
+    # Use Flask app context
+    with app.app_context():
+        begin_write_transaction()
+        rebuild_rollups(since)
+        db.session.commit()
+
+        print(f"✓ Rebuilt circulation rollups {'from ' + args.since if since else 'for all history'}")
+
+if __name__ == '__main__':
+    main()
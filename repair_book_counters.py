@@ -0,0 +1,51 @@
+#!/usr/bin/env python3
+"""
+Book Availability Counter Repair Script
+
+Each book stores the number of copies currently on loan (borrowed_count),
+which is maintained in the same transaction as every borrow and return.
+This script recomputes that counter from the borrow records so that any
+drift (for example after a manual database edit or a restored backup) can
+be detected and corrected.
+
+Usage:
+    python repair_book_counters.py --verify    # Report mismatched books only
+    python repair_book_counters.py --repair    # Report and correct mismatches
+"""
+
+import argparse
+import sys
+from main import app
+from utils.circulation import find_borrowed_count_mismatches, repair_borrowed_counts
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify or repair stored book availability counters')
+    parser.add_argument('--verify', action='store_true', help='Report books whose counters do not match borrow records')
+    parser.add_argument('--repair', action='store_true', help='Recompute mismatched counters from borrow records')
+
+    args = parser.parse_args()
+
+    if not (args.verify or args.repair):
+        parser.print_help()
+        sys.exit(1)
+
+    # Use Flask app context
+    with app.app_context():
+        if args.repair:
+            mismatches = repair_borrowed_counts()
+        else:
+            mismatches = find_borrowed_count_mismatches()
+
+        for book, stored_count, actual_count in mismatches:
+            print(f"{book.unique_id} ({book.title}): stored {stored_count}, actual {actual_count}")
+
+        if not mismatches:
+            print("✓ All book counters match borrow records")
+        elif args.repair:
+            print(f"✓ Repaired {len(mismatches)} book counters")
+        else:
+            print(f"✗ Found {len(mismatches)} mismatched book counters (run with --repair to fix)")
+            sys.exit(2)
+
+if __name__ == '__main__':
+    main()
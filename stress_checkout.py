@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Concurrent Checkout Load Tool for Library System
+
+Fires many simultaneous checkouts through the Flask test client against a
+throwaway SQLite database and reports throughput, along with whether any
+book was lent beyond its stock, any student went over the borrowing limit,
+or a stored counter drifted from the borrow records. The same invariants
+are checked at small scale by tests/test_circulation.py; this script is
+for trying them under heavier load.
+
+Usage:
+    python stress_checkout.py                          # Default run
+    python stress_checkout.py --threads 32 --checkouts 1000 --books 10 --copies 2
+"""
+
+import argparse
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+
+def main():
+    parser = argparse.ArgumentParser(description='Stress test concurrent checkouts')
+    parser.add_argument('--threads', type=int, default=16, help='Number of concurrent desks (threads)')
+    parser.add_argument('--checkouts', type=int, default=400, help='Total number of checkout attempts')
+    parser.add_argument('--books', type=int, default=20, help='Number of titles to compete for')
+    parser.add_argument('--copies', type=int, default=3, help='Copies of each title')
+    parser.add_argument('--students', type=int, default=4, help='Students shared between all desks')
+
+    args = parser.parse_args()
+
+    # Point the application at a throwaway database before it is imported
+    db_dir = tempfile.mkdtemp(prefix='library_stress_')
+    os.environ['DATABASE_URL'] = 'sqlite:///' + os.path.join(db_dir, 'stress.db')
+    os.environ['LOG_DATABASE_URL'] = 'sqlite:///' + os.path.join(db_dir, 'stress_logs.db')
+    # Nothing may be left in (or served from) the real instance's cache and files
+    os.environ['REPORT_CACHE_PATH'] = os.path.join(db_dir, 'report_cache.db')
+    os.environ['REPORT_JOB_DIR'] = os.path.join(db_dir, 'report_jobs')
+    os.environ['AUDIT_ARCHIVE_DIR'] = os.path.join(db_dir, 'audit_archive')
+    os.environ.setdefault('SESSION_SECRET', 'stress-test')
+
+    from app import create_app
+    from models import Book, Student, Staff, BorrowRecord, db
+    from sqlalchemy import func
+    from utils.circulation import find_borrowed_count_mismatches, STUDENT_BORROW_LIMIT
+
+    app = create_app()
+
+    with app.app_context():
+        books = [
+            Book(title=f'Stress Title {i}', unique_id=f'STRESS-{i:04d}', total_copies=args.copies)
+            for i in range(args.books)
+        ]
+        borrowers = [Staff(name=f'Stress Desk {i}', staff_type='teacher') for i in range(args.threads)]
+        students = [
+            Student(name=f'Stress Student {i}', registration_number=f'STRESS/{i:04d}', email=f'stress{i}@example.com')
+            for i in range(args.students)
+        ]
+        db.session.add_all(books + borrowers + students)
+        db.session.commit()
+        book_ids = [book.id for book in books]
+        staff_ids = [staff.id for staff in borrowers]
+        student_ids = [student.id for student in students]
+
+    results = {'borrowed': 0, 'refused': 0, 'limited': 0, 'errors': 0}
+    lowest_available = [args.copies]
+    lock = threading.Lock()
+    done = threading.Event()
+
+    def desk(attempts, staff_id):
+        client = app.test_client()
+        client.post('/auth/login', data={'username': 'librarian', 'password': 'librarian123'})
+        for _ in range(attempts):
+            # About half of the attempts are for one of the shared students
+            if student_ids and random.random() < 0.5:
+                borrower = {'borrower_type': 'student', 'student_id': random.choice(student_ids)}
+            else:
+                borrower = {'borrower_type': 'staff', 'staff_id': staff_id}
+            response = client.post('/borrowing/borrow', data={'book_id': random.choice(book_ids), **borrower})
+            with lock:
+                if response.status_code == 302:
+                    results['borrowed'] += 1
+                elif b'not available' in response.data:
+                    results['refused'] += 1
+                elif b'maximum borrowing limit' in response.data:
+                    results['limited'] += 1
+                else:
+                    results['errors'] += 1
+
+    def monitor():
+        # Sample stock while the desks are running
+        while not done.is_set():
+            with app.app_context():
+                available = db.session.query(func.min(Book.available_copies)).scalar()
+                db.session.remove()
+            lowest_available[0] = min(lowest_available[0], available)
+            time.sleep(0.01)
+
+    per_thread = [args.checkouts // args.threads] * args.threads
+    for i in range(args.checkouts % args.threads):
+        per_thread[i] += 1
+
+    threads = [threading.Thread(target=desk, args=(n, staff_id)) for n, staff_id in zip(per_thread, staff_ids)]
+    watcher = threading.Thread(target=monitor)
+
+    start = time.perf_counter()
+    watcher.start()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - start
+    done.set()
+    watcher.join()
+
+    with app.app_context():
+        open_loans = BorrowRecord.query.filter_by(returned_at=None).count()
+        oversubscribed = Book.query.filter(Book.borrowed_count > Book.total_copies).count()
+        mismatched = len(find_borrowed_count_mismatches())
+        most_borrowed_by_student = db.session.query(func.count(BorrowRecord.id)).filter(
+            BorrowRecord.student_id.isnot(None), BorrowRecord.returned_at.is_(None)
+        ).group_by(BorrowRecord.student_id).order_by(func.count(BorrowRecord.id).desc()).limit(1).scalar() or 0
+
+    capacity = args.books * args.copies
+    print(f"Attempts:            {args.checkouts} from {args.threads} threads")
+    print(f"Borrowed:            {results['borrowed']} (stock {capacity})")
+    print(f"Refused (no copies): {results['refused']}")
+    print(f"Refused (limit):     {results['limited']}")
+    print(f"Errors:              {results['errors']}")
+    print(f"Lowest availability: {lowest_available[0]}")
+    print(f"Elapsed:             {elapsed:.2f}s ({args.checkouts / elapsed:.1f} checkouts/sec)")
+
+    failures = []
+    if lowest_available[0] < 0 or oversubscribed:
+        failures.append('a book went below zero available copies')
+    if results['borrowed'] != open_loans:
+        failures.append(f"{results['borrowed']} successful checkouts but {open_loans} open loans")
+    if results['borrowed'] > capacity:
+        failures.append('more checkouts succeeded than copies exist')
+    if most_borrowed_by_student > STUDENT_BORROW_LIMIT:
+        failures.append(f'a student holds {most_borrowed_by_student} books (limit {STUDENT_BORROW_LIMIT})')
+    if mismatched:
+        failures.append(f'{mismatched} book counters do not match borrow records')
+    if results['errors']:
+        failures.append(f"{results['errors']} requests failed unexpectedly")
+
+    for failure in failures:
+        print(f"✗ {failure}")
+    if failures:
+        sys.exit(1)
+    print("✓ No oversubscription")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,17 @@
+import pytest
+from app import create_app
+from models import db
+
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('SESSION_SECRET', 'test')
+    monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'library.db'}")
+    monkeypatch.setenv('REPORT_CACHE_PATH', str(tmp_path / 'report_cache.db'))
+    monkeypatch.setenv('REPORT_JOB_DIR', str(tmp_path / 'report_jobs'))
+    monkeypatch.setenv('AUDIT_ARCHIVE_DIR', str(tmp_path / 'audit_archive'))
+    monkeypatch.setenv('AUDIT_WRITER_MODE', 'sync')
+    app = create_app()
+    with app.app_context():
+        yield app
+        db.session.remove()
@@ -0,0 +1,39 @@
+from models import AuditLog, BorrowerIdentifier, Student, db
+from utils.audit_logger import flush_audit_log
+from utils.borrower_lookup import rebuild_identifier_index, resolve_identifier
+
+
+def _login(app):
+    client = app.test_client()
+    client.post('/auth/login', data={'username': 'admin', 'password': 'admin123'})
+    return client
+
+
+def test_passport_number_equal_to_another_students_id_number(app):
+    # David Ochieng (seed data) has ID number 34567890
+    client = _login(app)
+    response = client.post('/students/add', data={
+        'name': 'Mei Lin', 'passport_number': '3456-7890', 'email': 'mei.lin@example.com'
+    })
+    assert response.status_code == 302
+    assert Student.query.filter_by(passport_number='3456-7890').count() == 1
+    flush_audit_log()
+    assert AuditLog.query.filter_by(action='CREATE_STUDENT').count() == 1
+
+    assert sorted(match.id_type for match in resolve_identifier('34567890')) == ['id_number', 'passport_number']
+    response = client.get('/students/api/resolve?id=34567890')
+    assert response.status_code == 409
+    assert sorted(c['name'] for c in response.get_json()['candidates']) == ['David Ochieng', 'Mei Lin']
+
+    response = client.get('/students/api/resolve?id=P15/1234/2023')
+    assert response.status_code == 200 and response.get_json()['name'] == 'John Kimani'
+
+
+def test_rebuild_indexes_every_identifier(app):
+    student = Student(name='Mei Lin', passport_number='34567890', email='mei.lin@example.com')
+    db.session.add(student)
+    db.session.commit()
+    indexed = rebuild_identifier_index()
+    db.session.commit()
+    assert indexed == BorrowerIdentifier.query.count()
+    assert BorrowerIdentifier.query.filter_by(value='34567890').count() == 2
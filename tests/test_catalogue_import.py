@@ -0,0 +1,58 @@
+import io
+import pytest
+from sqlalchemy import insert
+from models import Book
+from utils.catalogue_import import CatalogueImporter, CatalogueImportError, import_catalogue
+
+
+def _import(text, file_format='csv'):
+    data = text.encode() if isinstance(text, str) else text
+    return import_catalogue(io.BytesIO(data), file_format=file_format)
+
+
+def _books(*unique_ids):
+    return {book.unique_id: book.isbn for book in Book.query.filter(Book.unique_id.in_(unique_ids))}
+
+
+def test_isbn_used_by_another_unique_id_is_reported(app):
+    stats, errors = _import('title,isbn,unique_id\nA,111,X\nB,111,Y\nC,222,Y\n')
+    assert _books('X', 'Y') == {'X': '111', 'Y': '222'}
+    assert stats['created'] == 2 and stats['skipped'] == 1
+    assert errors == ['Record 2: ISBN 111 is already used by X in this file, not Y']
+
+
+def test_isbns_are_compared_without_hyphens(app):
+    stats, errors = _import('title,isbn,unique_id\nOne,978-0-00-000000-1,NB-1\nTwo,9780000000001,NB-2\n')
+    assert _books('NB-1', 'NB-2') == {'NB-1': '9780000000001'}
+    assert len(errors) == 1 and 'NB-2' in errors[0]
+
+
+def test_record_without_unique_id_joins_its_isbn(app):
+    stats, errors = _import('title,isbn,unique_id,copies\nA,111,X,1\nA,111,,2\n')
+    assert _books('X') == {'X': '111'}
+    assert stats['duplicates'] == 1 and errors == []
+
+
+def test_isbn_of_an_existing_book_is_reported(app):
+    _import('title,isbn,unique_id\nA,111,X\n')
+    stats, errors = _import('title,isbn,unique_id\nB,111,Y\n')
+    assert _books('X', 'Y') == {'X': '111'}
+    assert errors == ['ISBN 111 belongs to X, not Y']
+
+
+def test_constraint_violation_skips_only_the_bad_row(app):
+    _import('title,isbn,unique_id\nA,111,X\n')
+    importer = CatalogueImporter()
+    written = importer._execute(insert(Book), [
+        {'title': 'New', 'unique_id': 'N', 'isbn': None, 'total_copies': 1, 'borrowed_count': 0},
+        {'title': 'Clash', 'unique_id': 'X', 'isbn': None, 'total_copies': 1, 'borrowed_count': 0},
+    ])
+    assert [row['unique_id'] for row in written] == ['N']
+    assert importer.stats['skipped'] == 1 and 'Clash' in importer.errors[0]
+    assert set(_books('N', 'X')) == {'N', 'X'}
+
+
+@pytest.mark.parametrize('data', [b'00010xxxxxxxxxxxxx', b'00030xxxxxxxabcdexxxxxxxxxxxxxxxxx', b'00100short'])
+def test_malformed_marc_record_is_an_import_error(app, data):
+    with pytest.raises(CatalogueImportError, match='at byte 0'):
+        _import(data, 'marc')
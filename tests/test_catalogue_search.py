@@ -0,0 +1,39 @@
+import pytest
+from models import Book, db
+from utils.catalogue_search import index_books, search_books_query
+
+
+@pytest.fixture(autouse=True)
+def books(app):
+    books = [
+        Book(title='我学汉语 第一册', author='刘珣', unique_id='CJK-001'),
+        Book(title='汉语会话301句', author='康玉华', unique_id='CJK-002'),
+    ]
+    db.session.add_all(books)
+    db.session.flush()
+    index_books(books)
+    db.session.commit()
+    return books
+
+
+def _titles(search):
+    return [book.title for book in search_books_query(search).all()]
+
+
+@pytest.mark.parametrize('backend', ['fts5', 'like'])
+def test_cjk_substring_search(app, backend):
+    app.config['CATALOGUE_SEARCH_BACKEND'] = backend
+    with app.app_context():
+        assert _titles('汉语') == ['我学汉语 第一册', '汉语会话301句']
+        assert _titles('第一') == ['我学汉语 第一册']
+        assert _titles('汉语 康') == ['汉语会话301句']
+        assert _titles('刘') == ['我学汉语 第一册']
+        assert _titles('法语') == []
+
+
+def test_mixed_search_uses_index_for_other_words(app):
+    assert app.config['CATALOGUE_SEARCH_BACKEND'] == 'fts5'
+    with app.app_context():
+        assert sorted(_titles('汉语 cjk')) == ['我学汉语 第一册', '汉语会话301句']
+        assert _titles('汉语 cjk-002') == ['汉语会话301句']
+        assert _titles('汉语 hsk') == []
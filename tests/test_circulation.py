@@ -0,0 +1,102 @@
+import threading
+import pytest
+from models import AuditLog, AuditOutbox, Book, BorrowRecord, Staff, db
+from utils.audit_logger import flush_audit_log
+from utils.circulation import find_borrowed_count_mismatches
+
+DESKS = 6
+COPIES = 2
+
+
+@pytest.fixture
+def stock(app):
+    books = [Book(title=f'Contested {i}', unique_id=f'CONTESTED-{i}', total_copies=COPIES) for i in range(3)]
+    desks = [Staff(name=f'Desk {i}', staff_type='teacher') for i in range(DESKS)]
+    db.session.add_all(books + desks)
+    db.session.commit()
+    return [book.id for book in books], [staff.id for staff in desks]
+
+
+def _run_desks(app, work):
+    # One logged-in client per thread, all started together. A read left
+    # open by this thread would hold off their commits
+    db.session.rollback()
+    start = threading.Barrier(DESKS)
+    results, failures = [None] * DESKS, []
+
+    def desk(i):
+        client = app.test_client()
+        client.post('/auth/login', data={'username': 'librarian', 'password': 'librarian123'})
+        start.wait()
+        try:
+            results[i] = work(client, i)
+        except Exception as e:
+            failures.append(e)
+
+    threads = [threading.Thread(target=desk, args=(i,)) for i in range(DESKS)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if failures:
+        raise failures[0]
+    db.session.rollback()
+    return results
+
+
+def _assert_consistent():
+    assert Book.query.filter(Book.borrowed_count > Book.total_copies).count() == 0
+    assert find_borrowed_count_mismatches() == []
+
+
+def _audit_count(action):
+    # Every committed change has its entry, copied out of the outbox
+    flush_audit_log()
+    assert AuditOutbox.query.count() == 0
+    return AuditLog.query.filter_by(action=action).count()
+
+
+def test_concurrent_checkouts_never_oversubscribe(app, stock):
+    book_ids, staff_ids = stock
+
+    def borrow_everything(client, i):
+        borrowed = 0
+        for book_id in book_ids * 2:
+            response = client.post('/borrowing/borrow', data={
+                'book_id': book_id, 'borrower_type': 'staff', 'staff_id': staff_ids[i]
+            })
+            assert response.status_code == 302 or b'not available' in response.data
+            borrowed += response.status_code == 302
+        return borrowed
+
+    borrowed = sum(_run_desks(app, borrow_everything))
+    assert borrowed == len(book_ids) * COPIES
+    assert BorrowRecord.query.filter_by(returned_at=None).count() == borrowed
+    _assert_consistent()
+    assert _audit_count('BORROW_BOOK') == borrowed
+
+
+def test_concurrent_batch_borrow_and_return(app, stock):
+    book_ids, staff_ids = stock
+    unique_ids = [f'CONTESTED-{i}' for i in range(len(book_ids))]
+
+    def batch_borrow(client, i):
+        response = client.post('/borrowing/api/batch-borrow', json={'unique_ids': unique_ids, 'staff_id': staff_ids[i]})
+        assert response.status_code == 200
+        return [r['borrow_id'] for r in response.get_json()['results'] if r['status'] == 'borrowed']
+
+    loans = [borrow_id for borrowed in _run_desks(app, batch_borrow) for borrow_id in borrowed]
+    assert len(loans) == len(book_ids) * COPIES
+    _assert_consistent()
+    assert _audit_count('BORROW_BOOK') == len(loans)
+
+    # Every desk returns every loan; each is closed exactly once
+    def batch_return(client, i):
+        response = client.post('/borrowing/api/batch-return', json={'borrow_ids': loans})
+        assert response.status_code == 200
+        return response.get_json()['returned']
+
+    assert sum(_run_desks(app, batch_return)) == len(loans)
+    assert BorrowRecord.query.filter_by(returned_at=None).count() == 0
+    _assert_consistent()
+    assert _audit_count('RETURN_BOOK') == len(loans)
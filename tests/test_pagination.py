@@ -0,0 +1,36 @@
+from datetime import datetime, timedelta
+import pytest
+from sqlalchemy import insert
+from models import AuditLog, db
+from utils.pagination import keyset_page
+
+
+@pytest.fixture
+def entries(app):
+    start = datetime(2025, 1, 1)
+    db.session.execute(insert(AuditLog), [
+        {'user_id': 1, 'action': 'TEST', 'entity_type': 'Test', 'entity_id': i,
+         'timestamp': None if i % 4 == 0 else start + timedelta(days=i // 3)}
+        for i in range(40)
+    ])
+    db.session.commit()
+    return AuditLog.query.filter_by(action='TEST')
+
+
+def _walk(query, descending):
+    seen, cursor = [], None
+    while True:
+        items, cursor = keyset_page(query, AuditLog.timestamp, AuditLog.id,
+                                    cursor=cursor, per_page=7, descending=descending)
+        seen += [entry.id for entry in items]
+        if cursor is None:
+            return seen
+
+
+@pytest.mark.parametrize('descending', [True, False])
+def test_pages_cover_every_row_in_order(entries, descending):
+    # SQLite sorts NULL below every date
+    rows = entries.all()
+    expected = sorted(rows, key=lambda e: (e.timestamp is not None, e.timestamp or datetime.min, e.id),
+                      reverse=descending)
+    assert _walk(entries, descending) == [entry.id for entry in expected]
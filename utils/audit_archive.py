@@ -0,0 +1,228 @@
+import gzip
+import json
+import os
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import and_, delete, func, or_, select
+from models import AuditLog, AuditArchiveSegment, User, LOG_BIND, db
+from utils.database import begin_write_transaction
+
+# Entries older than this are moved out of audit_log by archive_audit_log.py
+AUDIT_RETENTION_DAYS = 365
+
+# Entries read from audit_log per transaction while a segment is written
+ARCHIVE_CHUNK_SIZE = 1000
+
+# Columns kept for each archived entry
+_COLUMNS = ('id', 'user_id', 'action', 'entity_type', 'entity_id', 'details', 'ip_address', 'timestamp')
+
+class ArchivedAuditLog:
+    """An entry read back from an archive segment, with the attributes templates use on AuditLog"""
+    archived = True
+
+    def __init__(self, row, user=None):
+        for column in _COLUMNS:
+            setattr(self, column, row.get(column))
+        self.timestamp = datetime.fromisoformat(row['timestamp'])
+        self.user = user
+
+def _month_start(moment):
+    return datetime(moment.year, moment.month, 1)
+
+def _next_month(start):
+    return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+
+def segment_path(segment):
+    """Where the file of a segment is kept"""
+    return os.path.join(current_app.config['AUDIT_ARCHIVE_DIR'], segment.filename)
+
+def _read_segment(path):
+    with gzip.open(path, 'rt', encoding='utf-8') as segment_file:
+        for line in segment_file:
+            yield json.loads(line)
+
+def archivable_months(cutoff):
+    """
+    First days of the months whose entries are all older than cutoff
+
+    Only whole months are archived, so a month is included once cutoff has
+    passed its end.
+    """
+    oldest = db.session.query(func.min(AuditLog.timestamp)).scalar()
+    months = []
+    if oldest is None:
+        return months
+    month = _month_start(oldest)
+    while _next_month(month) <= cutoff:
+        months.append(month)
+        month = _next_month(month)
+    return months
+
+def _month_entries(start, end, last_id):
+    # Entries of the month in (timestamp, id) order, a chunk per short read
+    # transaction so writers are never held up for the whole month
+    position = None
+    while True:
+        query = select(*[getattr(AuditLog, column) for column in _COLUMNS]).where(
+            AuditLog.timestamp >= start, AuditLog.timestamp < end, AuditLog.id <= last_id
+        )
+        if position:
+            query = query.where(or_(AuditLog.timestamp > position[0],
+                                    and_(AuditLog.timestamp == position[0], AuditLog.id > position[1])))
+        rows = db.session.execute(query.order_by(AuditLog.timestamp, AuditLog.id).limit(ARCHIVE_CHUNK_SIZE)).all()
+        db.session.rollback()
+        for row in rows:
+            yield dict(row._mapping)
+        if len(rows) < ARCHIVE_CHUNK_SIZE:
+            return
+        position = (rows[-1].timestamp, rows[-1].id)
+
+def archive_month(month):
+    """
+    Move one month of audit entries into its compressed segment file
+
+    Entries are streamed into a new gzip NDJSON file (merged with the
+    month's existing segment, if any), which is then recorded in the
+    segment index and the entries deleted from audit_log in one
+    transaction. Entries added while the file was written are left for
+    the next run.
+
+    Args:
+        month (datetime): First day of the month
+
+    Returns:
+        Number of entries moved
+    """
+    start, end = month, _next_month(month)
+    label = start.strftime('%Y-%m')
+    last_id = db.session.query(func.max(AuditLog.id)).scalar() or 0
+    segment = AuditArchiveSegment.query.filter_by(month=label).first()
+    previous = segment_path(segment) if segment else None
+    db.session.rollback()
+
+    filename = f"audit_{start.strftime('%Y_%m')}_{datetime.utcnow().strftime('%Y%m%d%H%M%S%f')}.ndjson.gz"
+    path = os.path.join(current_app.config['AUDIT_ARCHIVE_DIR'], filename)
+    moved, count, first, last = 0, 0, None, None
+    entity_types, actions = set(), set()
+
+    def write(segment_file, row):
+        nonlocal count, first, last
+        segment_file.write(json.dumps(row, default=str))
+        segment_file.write('\n')
+        timestamp = datetime.fromisoformat(str(row['timestamp']))
+        first = min(first, timestamp) if first else timestamp
+        last = max(last, timestamp) if last else timestamp
+        entity_types.add(row['entity_type'])
+        actions.add(row['action'])
+        count += 1
+
+    try:
+        with gzip.open(path, 'wt', encoding='utf-8') as segment_file:
+            if previous:
+                for row in _read_segment(previous):
+                    write(segment_file, row)
+            for row in _month_entries(start, end, last_id):
+                row['timestamp'] = row['timestamp'].isoformat()
+                write(segment_file, row)
+                moved += 1
+
+        if not moved:
+            os.remove(path)
+            return 0
+
+        begin_write_transaction(LOG_BIND)
+        segment = AuditArchiveSegment.query.filter_by(month=label).first() or AuditArchiveSegment(month=label)
+        segment.filename = filename
+        segment.first_timestamp = first
+        segment.last_timestamp = last
+        segment.row_count = count
+        segment.file_size = os.path.getsize(path)
+        segment.entity_types = json.dumps(sorted(entity_types))
+        segment.actions = json.dumps(sorted(actions))
+        db.session.add(segment)
+        db.session.execute(delete(AuditLog).where(
+            AuditLog.timestamp >= start, AuditLog.timestamp < end, AuditLog.id <= last_id
+        ))
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        if os.path.exists(path):
+            os.remove(path)
+        raise
+
+    if previous and os.path.exists(previous):
+        os.remove(previous)
+    return moved
+
+def archive_audit_log(cutoff, progress=None):
+    """
+    Move every whole month of audit entries older than cutoff into the archive
+
+    Args:
+        cutoff (datetime): Entries of months ending before this are archived
+        progress (callable): Called with (month label, entries moved) after each month
+
+    Returns:
+        Total number of entries moved
+    """
+    total = 0
+    for month in archivable_months(cutoff):
+        moved = archive_month(month)
+        total += moved
+        if progress:
+            progress(month.strftime('%Y-%m'), moved)
+    return total
+
+def archived_values(column):
+    """Distinct values listed in the 'entity_types' or 'actions' column of the segment index"""
+    values = set()
+    for (listed,) in db.session.query(getattr(AuditArchiveSegment, column)):
+        values.update(json.loads(listed))
+    return values
+
+def _matches(row, entity_type, entity_id, action, user_id):
+    return ((not entity_type or row['entity_type'] == entity_type)
+            and (entity_id is None or row['entity_id'] == entity_id)
+            and (not action or row['action'] == action)
+            and (not user_id or row['user_id'] == user_id))
+
+def archived_entries(entity_type=None, entity_id=None, action=None, user_id=None, before=None):
+    """
+    Archived entries matching the filters, newest first
+
+    Segments whose time range, entity types or actions rule them out are
+    not opened; the others are read one month at a time.
+
+    Args:
+        entity_type, entity_id, action, user_id: Optional filters
+        before (tuple): Only entries before this (timestamp, id) position
+
+    Yields:
+        ArchivedAuditLog objects
+    """
+    segments = AuditArchiveSegment.query.order_by(AuditArchiveSegment.month.desc()).all()
+    users = {}
+
+    for segment in segments:
+        if before and segment.first_timestamp > before[0]:
+            continue
+        if entity_type and entity_type not in json.loads(segment.entity_types):
+            continue
+        if action and action not in json.loads(segment.actions):
+            continue
+
+        entries = [
+            ArchivedAuditLog(row) for row in _read_segment(segment_path(segment))
+            if _matches(row, entity_type, entity_id, action, user_id)
+        ]
+        entries.sort(key=lambda entry: (entry.timestamp, entry.id), reverse=True)
+
+        missing = {entry.user_id for entry in entries} - users.keys()
+        if missing:
+            users.update({user.id: user for user in User.query.filter(User.id.in_(missing))})
+
+        for entry in entries:
+            if before and (entry.timestamp, entry.id) >= before:
+                continue
+            entry.user = users.get(entry.user_id)
+            yield entry
@@ -1,13 +1,386 @@
+import atexit
 import json
-from flask import request
+import os
+import queue
+import threading
+import time
+from flask import current_app, request
 from flask_login import current_user
-from models import AuditLog, db
+from sqlalchemy import delete, event, insert, literal, select
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from models import AuditLog, AuditLogValue, AuditOutbox, LOG_BIND, db
+from utils.audit_archive import archived_entries, archived_values
+from utils.database import begin_write_transaction, insert_missing
+from utils.write_tracking import on_commit_touching
 from datetime import datetime
 
+# Entries waiting for the background writer; beyond this the
+# AUDIT_QUEUE_FULL_POLICY applies
+AUDIT_QUEUE_SIZE = 10000
+
+# Most entries inserted per transaction by the background writer
+AUDIT_BATCH_SIZE = 500
+
+# Longest an entry waits for others to share its batch (seconds); fewer,
+# larger batches mean fewer commits competing with requests for the lock
+AUDIT_FLUSH_INTERVAL = 0.5
+
+# Tries at writing a batch before its entries are given up, e.g. when
+# another connection keeps the database locked
+AUDIT_WRITE_ATTEMPTS = 3
+
+AUDIT_WRITER_MODES = ('async', 'sync')
+AUDIT_QUEUE_FULL_POLICIES = ('block', 'drop', 'sync')
+
+def build_audit_entry(action, entity_type, entity_id=None, details=None, user_id=None):
+    """
+    Build an audit trail entry without adding it to the session
+    
+    Use this when the caller adds the entry to its own transaction
+    itself, e.g. one entry per item of a batch.
+    
+    Args:
+        action (str): Action performed (e.g., 'CREATE_STUDENT', 'BORROW_BOOK')
+        entity_type (str): Type of entity affected (e.g., 'Student', 'Book')
+        entity_id (int): ID of the affected entity
+        details (dict): Additional details about the action
+        user_id (int): User who performed the action (defaults to current_user)
+    
+    Returns:
+        AuditLog object
+    """
+    # Get user ID
+    if user_id is None:
+        user_id = current_user.id if current_user.is_authenticated else None
+    
+    # Get client IP address
+    ip_address = None
+    if request:
+        ip_address = request.environ.get('HTTP_X_FORWARDED_FOR') or request.environ.get('REMOTE_ADDR')
+    
+    # Convert details to JSON string
+    details_json = None
+    if details:
+        details_json = json.dumps(details, default=str)
+    
+    return AuditLog(
+        user_id=user_id,
+        action=action,
+        entity_type=entity_type,
+        entity_id=entity_id,
+        details=details_json,
+        ip_address=ip_address,
+        timestamp=datetime.utcnow()
+    )
+
+def _audit_row(audit_log):
+    # Column values of an entry, safe to hand to another thread
+    return {
+        'user_id': audit_log.user_id,
+        'action': audit_log.action,
+        'entity_type': audit_log.entity_type,
+        'entity_id': audit_log.entity_id,
+        'details': audit_log.details,
+        'ip_address': audit_log.ip_address,
+        'timestamp': audit_log.timestamp,
+    }
+
+def _write_entries(rows):
+    # One transaction for the whole batch, inserted with a single executemany;
+    # only the log database is locked
+    begin_write_transaction(LOG_BIND)
+    db.session.execute(insert(AuditLog), rows)
+    db.session.commit()
+
+def move_audit_outbox():
+    """
+    Copy the entries waiting in the audit outbox to audit_log, and empty it
+
+    Entries committed with a change to the main database wait there (see
+    log_action). Each batch is inserted into the log database in one
+    transaction and deleted from the outbox in another. The copies keep
+    their outbox ID, so a batch copied but not yet deleted when the
+    process stopped is not copied again.
+
+    Returns:
+        Number of entries copied
+    """
+    moved = 0
+    while True:
+        rows = [
+            {**_audit_row(entry), 'outbox_id': entry.id}
+            for entry in AuditOutbox.query.order_by(AuditOutbox.id).limit(AUDIT_BATCH_SIZE)
+        ]
+        if not rows:
+            db.session.rollback()
+            return moved
+        ids = [row['outbox_id'] for row in rows]
+
+        begin_write_transaction(LOG_BIND)
+        copied = set(db.session.scalars(select(AuditLog.outbox_id).where(AuditLog.outbox_id.in_(ids))))
+        new = [row for row in rows if row['outbox_id'] not in copied]
+        if new:
+            db.session.execute(insert(AuditLog), new)
+        db.session.commit()
+
+        begin_write_transaction()
+        db.session.execute(delete(AuditOutbox).where(AuditOutbox.id.in_(ids)))
+        db.session.commit()
+
+        moved += len(new)
+        if len(rows) < AUDIT_BATCH_SIZE:
+            return moved
+
+def _retrying(write):
+    # write(), tried up to AUDIT_WRITE_ATTEMPTS times while the database is locked
+    for attempt in range(1, AUDIT_WRITE_ATTEMPTS + 1):
+        try:
+            return write()
+        except OperationalError:
+            db.session.rollback()
+            if attempt == AUDIT_WRITE_ATTEMPTS:
+                raise
+            time.sleep(attempt)
+
+# Queue markers: write what is queued now / copy the outbox / and then stop the thread
+_FLUSH = object()
+_MOVE = object()
+_STOP = object()
+
+class AuditWriter:
+    """
+    Writes audit entries from a background thread, in batches
+
+    Entries are queued by log_action() and inserted by one daemon thread
+    per process. It collects entries for up to AUDIT_FLUSH_INTERVAL (or
+    AUDIT_BATCH_SIZE of them) and inserts them in a single transaction,
+    so the trail costs one commit per batch rather than one per action.
+    It also copies entries from the audit outbox when asked to.
+
+    The thread is started on first use, so each (forked) web process gets
+    its own, and the queue is flushed when the process exits.
+    """
+
+    def __init__(self, app, full_policy='block'):
+        self.app = app
+        self.full_policy = full_policy
+        self.queue = queue.Queue(maxsize=AUDIT_QUEUE_SIZE)
+        self.dropped = 0
+        self._thread = None
+        self._pid = None
+        self._lock = threading.Lock()
+
+    def _ensure_running(self):
+        with self._lock:
+            if self._thread is None or not self._thread.is_alive() or self._pid != os.getpid():
+                if self._pid != os.getpid():
+                    # Entries queued before a fork belong to the parent
+                    self.queue = queue.Queue(maxsize=AUDIT_QUEUE_SIZE)
+                self._pid = os.getpid()
+                self._thread = threading.Thread(target=self._run, name='audit-writer', daemon=True)
+                self._thread.start()
+
+    def submit(self, row):
+        """
+        Queue one entry (a dict of AuditLog column values)
+
+        When the queue is full the entry is, depending on full_policy,
+        queued once there is room ('block'), discarded ('drop') or written
+        in the calling thread ('sync').
+        """
+        self._ensure_running()
+        try:
+            self.queue.put_nowait(row)
+            return
+        except queue.Full:
+            pass
+
+        if self.full_policy == 'drop':
+            self.dropped += 1
+            self.app.logger.warning(f"Audit queue full, entry dropped: {row['action']} ({self.dropped} dropped so far)")
+        elif self.full_policy == 'sync':
+            db.session.add(AuditLog(**row))
+            db.session.commit()
+        else:
+            self.queue.put(row)
+
+    def request_move(self):
+        """Have the thread copy the audit outbox to the log database"""
+        self._ensure_running()
+        try:
+            self.queue.put_nowait(_MOVE)
+        except queue.Full:
+            # The outbox is copied whole, so the next move or flush picks these up
+            pass
+
+    def _take_batch(self):
+        # Up to AUDIT_BATCH_SIZE entries, collected for at most
+        # AUDIT_FLUSH_INTERVAL; a flush or stop marker ends the batch early
+        batch = [self.queue.get()]
+        deadline = time.monotonic() + AUDIT_FLUSH_INTERVAL
+        while len(batch) < AUDIT_BATCH_SIZE and batch[-1] not in (_FLUSH, _STOP):
+            timeout = deadline - time.monotonic()
+            if timeout <= 0:
+                break
+            try:
+                batch.append(self.queue.get(timeout=timeout))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        with self.app.app_context():
+            while True:
+                batch = self._take_batch()
+                rows = [row for row in batch if isinstance(row, dict)]
+                try:
+                    if rows:
+                        _retrying(lambda: _write_entries(rows))
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception(f"Audit logging failed, {len(rows)} entries lost")
+                try:
+                    if _MOVE in batch or _STOP in batch:
+                        _retrying(move_audit_outbox)
+                except Exception:
+                    db.session.rollback()
+                    self.app.logger.exception("Audit outbox not copied, its entries are kept for the next attempt")
+                finally:
+                    db.session.remove()
+                    for _ in batch:
+                        self.queue.task_done()
+                if _STOP in batch:
+                    return
+
+    def flush(self):
+        """Wait until every entry queued so far has been written"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self.queue.put(_FLUSH)
+            self.queue.join()
+
+    def close(self):
+        """Write what is still queued and stop the thread"""
+        if self._thread is not None and self._thread.is_alive() and self._pid == os.getpid():
+            self.queue.put(_STOP)
+            self._thread.join()
+
+def flush_audit_log():
+    """
+    Wait until queued audit entries, and those in the outbox, are in audit_log
+
+    Call before reading the trail back when entries logged moments ago
+    must be included. The session's transaction is rolled back first (an
+    open SQLite read would keep the writer from committing), so call it
+    before making changes.
+    """
+    db.session.rollback()
+    writer = current_app.extensions.get('audit_writer')
+    if writer is not None:
+        writer.flush()
+    move_audit_outbox()
+
+def _writes_main_database(session):
+    # Tables written in this transaction, or about to be, outside the log database
+    written = {
+        obj.__table__.name for obj in list(session.new) + list(session.dirty) + list(session.deleted)
+        if not isinstance(obj, AuditLog) and hasattr(obj, '__table__')
+    }
+    written |= session.info.get('touched_tables', set())
+    return bool(written - db.metadatas[LOG_BIND].tables.keys())
+
+def _route_to_outbox(session, flush_context, instances):
+    # Entries joining a transaction that writes to the main database are
+    # stored in its outbox instead, so they commit (or roll back) with it
+    entries = [obj for obj in session.new if isinstance(obj, AuditLog)]
+    if not entries or not _writes_main_database(session):
+        return
+    for entry in entries:
+        session.expunge(entry)
+        session.add(AuditOutbox(**_audit_row(entry)))
+    session.info['audit_outbox'] = True
+
+def _outbox_committed(session):
+    if not session.info.pop('audit_outbox', False):
+        return
+    writer = current_app.extensions.get('audit_writer')
+    if writer is not None:
+        writer.request_move()
+    else:
+        session.info['audit_outbox_committed'] = True
+
+def _outbox_discarded(session):
+    session.info.pop('audit_outbox', None)
+
+def _move_committed_entries(exception=None):
+    # 'sync' mode: entries this app context committed to the outbox are
+    # copied before it ends
+    if not db.session.info.pop('audit_outbox_committed', False):
+        return
+    try:
+        db.session.rollback()
+        move_audit_outbox()
+    except Exception:
+        db.session.rollback()
+        current_app.logger.exception("Audit outbox not copied, its entries are kept for the next attempt")
+
+def init_audit_writer(app):
+    """
+    Choose how log_action() writes, from AUDIT_WRITER_MODE
+
+    'async' (the default) queues entries for the background AuditWriter,
+    with AUDIT_QUEUE_FULL_POLICY deciding what happens when the queue is
+    full; 'sync' commits each entry as it is logged, e.g. for tests that
+    read the trail straight after an action.
+
+    Args:
+        app: Flask application
+    """
+    mode = app.config.get('AUDIT_WRITER_MODE') or 'async'
+    policy = app.config.get('AUDIT_QUEUE_FULL_POLICY') or 'block'
+    if mode not in AUDIT_WRITER_MODES:
+        raise RuntimeError(f"AUDIT_WRITER_MODE must be one of {', '.join(AUDIT_WRITER_MODES)}, not {mode}")
+    if policy not in AUDIT_QUEUE_FULL_POLICIES:
+        raise RuntimeError(f"AUDIT_QUEUE_FULL_POLICY must be one of {', '.join(AUDIT_QUEUE_FULL_POLICIES)}, not {policy}")
+
+    writer = AuditWriter(app, policy) if mode == 'async' else None
+    app.extensions['audit_writer'] = writer
+    if writer is not None:
+        # Entries still queued when the process exits are written first
+        atexit.register(writer.close)
+    else:
+        app.teardown_appcontext(_move_committed_entries)
+
+    # Ahead of the other flush hooks, which then see the outbox rows
+    if not event.contains(Session, 'before_flush', _route_to_outbox):
+        event.listen(Session, 'before_flush', _route_to_outbox, insert=True)
+        event.listen(Session, 'after_commit', _outbox_committed)
+        event.listen(Session, 'after_rollback', _outbox_discarded)
+
+def _has_pending_writes(session):
+    # Objects not yet flushed, or tables already written in this transaction
+    return bool(session.new or session.dirty or session.deleted or session.info.get('touched_tables'))
+
 def log_action(action, entity_type, entity_id=None, details=None, user_id=None):
     """
     Log an action to the audit trail
     
+    When the session holds uncommitted changes, the entry joins that unit
+    of work: it is added to the session and persisted by the caller's
+    commit, or discarded with the change on rollback. Log before
+    committing (after a flush, when entity_id is a new row's ID) so one
+    commit writes both. The trail is in the log database, so when the
+    change is to the main database the entry is committed to the main
+    database's outbox (AuditOutbox) and copied to audit_log afterwards,
+    by the background writer, or when the request ends in 'sync' mode;
+    move_audit_outbox() finishes any copy interrupted by a restart.
+    
+    Otherwise the action stands alone (an export, a download). The entry
+    is built here (user, IP address and time are those of the current
+    request) and handed to the background writer, so the caller does not
+    wait for a second commit. Without a writer (AUDIT_WRITER_MODE 'sync')
+    it is committed immediately.
+    
     Args:
         action (str): Action performed (e.g., 'CREATE_STUDENT', 'BORROW_BOOK')
         entity_type (str): Type of entity affected (e.g., 'Student', 'Book')
@@ -16,39 +389,122 @@ def log_action(action, entity_type, entity_id=None, details=None, user_id=None):
         user_id (int): User who performed the action (defaults to current_user)
     """
     try:
-        # Get user ID
-        if user_id is None:
-            user_id = current_user.id if current_user.is_authenticated else None
-        
-        # Get client IP address
-        ip_address = None
-        if request:
-            ip_address = request.environ.get('HTTP_X_FORWARDED_FOR') or request.environ.get('REMOTE_ADDR')
-        
-        # Convert details to JSON string
-        details_json = None
-        if details:
-            details_json = json.dumps(details, default=str)
-        
         # Create audit log entry
-        audit_log = AuditLog(
-            user_id=user_id,
-            action=action,
-            entity_type=entity_type,
-            entity_id=entity_id,
-            details=details_json,
-            ip_address=ip_address,
-            timestamp=datetime.utcnow()
-        )
+        audit_log = build_audit_entry(action, entity_type, entity_id, details, user_id)
+    except Exception as e:
+        # Don't let audit logging break the main application
+        print(f"Audit logging failed: {e}")
+        return
+    
+    if _has_pending_writes(db.session):
+        db.session.add(audit_log)
+        return
+    
+    try:
+        writer = current_app.extensions.get('audit_writer')
+        if writer is not None:
+            writer.submit(_audit_row(audit_log))
+            return
         
         db.session.add(audit_log)
         db.session.commit()
         
     except Exception as e:
-        # Don't let audit logging break the main application
         print(f"Audit logging failed: {e}")
         db.session.rollback()
 
+# Fields of AuditLog listed in AuditLogValue
+AUDIT_VALUE_FIELDS = ('action', 'entity_type')
+
+# (field, value) pairs known to be in AuditLogValue, learnt from commits
+# made by this process; only values not seen before are written
+_known_values = set()
+
+def _pending_values(session):
+    return session.info.setdefault('audit_values', set())
+
+def _collect_added_values(session, flush_context, instances):
+    # Entries added through the unit of work (log_action, build_audit_entry)
+    for obj in session.new:
+        if isinstance(obj, AuditLog):
+            _pending_values(session).update((field, getattr(obj, field)) for field in AUDIT_VALUE_FIELDS)
+
+def _collect_inserted_values(orm_execute_state):
+    # Entries bulk inserted with session.execute(insert(AuditLog), rows)
+    table = getattr(orm_execute_state.statement, 'table', None)
+    if not orm_execute_state.is_insert or getattr(table, 'name', None) != AuditLog.__tablename__:
+        return
+    rows = orm_execute_state.parameters
+    if isinstance(rows, dict):
+        rows = [rows]
+    for row in rows or []:
+        _pending_values(orm_execute_state.session).update(
+            (field, row[field]) for field in AUDIT_VALUE_FIELDS if row.get(field)
+        )
+
+def _store_values(session, touched):
+    new = _pending_values(session) - _known_values
+    insert_missing(AuditLogValue, [{'field': field, 'value': value} for field, value in sorted(new)])
+
+def _remember_values(session):
+    _known_values.update(session.info.pop('audit_values', ()))
+
+def _forget_values(session, *args):
+    session.info.pop('audit_values', None)
+
+def audit_log_values(field):
+    """Distinct values of an AuditLog field ('action' or 'entity_type'), sorted"""
+    return [row[0] for row in db.session.query(AuditLogValue.value).filter(
+        AuditLogValue.field == field
+    ).order_by(AuditLogValue.value)]
+
+def rebuild_audit_log_values():
+    """
+    Recompute AuditLogValue from the audit log, in the current transaction
+
+    For catch-up after rows were written without the session events, e.g.
+    a bulk load or an archival run; the caller commits. Values only found
+    in archived months are kept, from the segment index.
+    """
+    db.session.execute(delete(AuditLogValue))
+    for field in AUDIT_VALUE_FIELDS:
+        column = getattr(AuditLog, field)
+        db.session.execute(insert(AuditLogValue).from_select(
+            ['field', 'value'], select(literal(field), column).where(column.isnot(None)).distinct()
+        ))
+    
+    archived = {('entity_type', value) for value in archived_values('entity_types')}
+    archived |= {('action', value) for value in archived_values('actions')}
+    insert_missing(AuditLogValue, [{'field': field, 'value': value} for field, value in archived])
+    _known_values.clear()
+
+def init_audit_log_values(app):
+    """
+    Keep AuditLogValue in step with the audit log
+
+    Every commit that writes audit entries adds their actions and entity
+    types to the lookup table. On startup the table is built if it is
+    empty but entries exist.
+
+    Args:
+        app: Flask application, called inside its app context after
+            init_write_tracking()
+    """
+    if not event.contains(Session, 'before_flush', _collect_added_values):
+        event.listen(Session, 'before_flush', _collect_added_values)
+        event.listen(Session, 'do_orm_execute', _collect_inserted_values)
+        event.listen(Session, 'after_commit', _remember_values)
+        event.listen(Session, 'after_rollback', _forget_values)
+    on_commit_touching({'audit_log'}, _store_values)
+
+    try:
+        if not db.session.query(AuditLogValue.field).first() and db.session.query(AuditLog.id).first():
+            rebuild_audit_log_values()
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.warning(f"Audit log filter values not built: {e}")
+
 def get_audit_logs(limit=100, entity_type=None, action=None, user_id=None):
     """
     Retrieve audit logs with optional filtering
@@ -75,18 +531,26 @@ def get_audit_logs(limit=100, entity_type=None, action=None, user_id=None):
     
     return query.order_by(AuditLog.timestamp.desc()).limit(limit).all()
 
-def get_entity_history(entity_type, entity_id):
+def get_entity_history(entity_type, entity_id, include_archived=False):
     """
     Get audit history for a specific entity
     
     Args:
         entity_type (str): Type of entity
         entity_id (int): ID of the entity
+        include_archived (bool): Also read archived months (utils.audit_archive)
     
     Returns:
-        List of AuditLog objects for the entity
+        List of AuditLog objects for the entity, newest first, followed by
+        ArchivedAuditLog objects when include_archived is True
     """
-    return AuditLog.query.filter_by(
+    history = AuditLog.query.filter_by(
         entity_type=entity_type,
         entity_id=entity_id
-    ).order_by(AuditLog.timestamp.desc()).all()
\ No newline at end of file
+    ).order_by(AuditLog.timestamp.desc(), AuditLog.id.desc()).all()
+    
+    if include_archived:
+        before = (history[-1].timestamp, history[-1].id) if history else None
+        history.extend(archived_entries(entity_type=entity_type, entity_id=entity_id, before=before))
+    
+    return history
\ No newline at end of file
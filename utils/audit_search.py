@@ -0,0 +1,143 @@
+import re
+from flask import current_app
+from sqlalchemy import false
+from models import AuditLog, LOG_BIND, db
+
+# SQLite FTS5 index over audit_log.details. It is an external-content
+# table (the text is read back from audit_log, not stored twice) kept in
+# step by triggers, since entries are written by the background writer,
+# bulk inserts and archival as well as by the ORM.
+FTS5_DDL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS audit_log_fts USING fts5(
+        details, content = 'audit_log', content_rowid = 'id',
+        tokenize = 'unicode61 remove_diacritics 2'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS audit_log_fts_insert AFTER INSERT ON audit_log BEGIN
+        INSERT INTO audit_log_fts(rowid, details) VALUES (new.id, new.details);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS audit_log_fts_delete AFTER DELETE ON audit_log BEGIN
+        INSERT INTO audit_log_fts(audit_log_fts, rowid, details) VALUES ('delete', old.id, old.details);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS audit_log_fts_update AFTER UPDATE OF details ON audit_log BEGIN
+        INSERT INTO audit_log_fts(audit_log_fts, rowid, details) VALUES ('delete', old.id, old.details);
+        INSERT INTO audit_log_fts(rowid, details) VALUES (new.id, new.details);
+    END
+    """,
+]
+
+# PostgreSQL keeps the tsvector as a generated column over the details
+# text (not every entry's details are valid JSON, so jsonb is not used)
+POSTGRES_DDL = [
+    """
+    ALTER TABLE audit_log ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (to_tsvector('simple', coalesce(details, ''))) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_audit_log_search_vector ON audit_log USING GIN (search_vector)",
+]
+
+def _execute(sql):
+    # Plain SQL goes to the default bind unless told otherwise
+    return db.session.execute(db.text(sql), bind_arguments={'bind': db.engines[LOG_BIND]})
+
+def init_audit_search_index(app):
+    """
+    Create the full-text index over audit details for the configured database
+
+    Sets app.config['AUDIT_SEARCH_BACKEND'] to 'fts5', 'postgresql' or
+    'like' (substring filter when no full-text support is available).
+
+    Args:
+        app: Flask application, called inside its app context
+    """
+    engine = db.engines[LOG_BIND]
+    dialect = engine.dialect.name
+    backend = 'like'
+
+    try:
+        if dialect == 'sqlite':
+            exists = _execute("SELECT 1 FROM sqlite_master WHERE name = 'audit_log_fts'").first()
+            for statement in FTS5_DDL:
+                _execute(statement)
+            if not exists:
+                rebuild_audit_search_index()
+            backend = 'fts5'
+        elif dialect == 'postgresql':
+            for statement in POSTGRES_DDL:
+                _execute(statement)
+            backend = 'postgresql'
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.warning(f"Full-text audit search unavailable, using substring search: {e}")
+        backend = 'like'
+
+    app.config['AUDIT_SEARCH_BACKEND'] = backend
+
+def _backend():
+    return current_app.config.get('AUDIT_SEARCH_BACKEND', 'like')
+
+def rebuild_audit_search_index():
+    """Repopulate the SQLite FTS5 index from the audit_log table"""
+    _execute("INSERT INTO audit_log_fts(audit_log_fts) VALUES ('rebuild')")
+
+def _phrases(search):
+    """
+    Split user input into phrases of plain word tokens, dropping query syntax
+
+    Each whitespace-separated word is one phrase, so an identifier such as
+    "P15/1234/2023" must match as the tokens p15, 1234, 2023 in sequence.
+    """
+    phrases = [re.findall(r'\w+', word.lower()) for word in search.split()]
+    return [tokens for tokens in phrases if tokens]
+
+def search_audit_query(search, query=None):
+    """
+    Restrict an AuditLog query to entries whose details match the search text
+
+    Every word must match, its last part as a prefix, so "P15/1234/2023"
+    finds the entries mentioning that registration number. Best matches
+    come first, newest first among equals.
+
+    Args:
+        search (str): Text typed by the user
+        query: AuditLog query to restrict (defaults to AuditLog.query)
+
+    Returns:
+        AuditLog query ordered by relevance
+    """
+    if query is None:
+        query = AuditLog.query
+
+    phrases = _phrases(search)
+    if not phrases:
+        return query.filter(false())
+
+    backend = _backend()
+
+    if backend == 'fts5':
+        match = ' '.join('"' + ' '.join(tokens) + '"*' for tokens in phrases)
+        matches = db.text(
+            "SELECT rowid AS audit_log_id, bm25(audit_log_fts) AS rank FROM audit_log_fts WHERE audit_log_fts MATCH :match"
+        ).bindparams(match=match).columns(audit_log_id=db.Integer, rank=db.Float).subquery()
+        return query.join(matches, AuditLog.id == matches.c.audit_log_id).order_by(
+            matches.c.rank, AuditLog.timestamp.desc(), AuditLog.id.desc()
+        )
+
+    if backend == 'postgresql':
+        tsquery = ' & '.join('(' + ' <-> '.join(tokens) + ':*)' for tokens in phrases)
+        matches = db.text(
+            "SELECT id AS audit_log_id, ts_rank(search_vector, to_tsquery('simple', :tsquery)) AS rank "
+            "FROM audit_log WHERE search_vector @@ to_tsquery('simple', :tsquery)"
+        ).bindparams(tsquery=tsquery).columns(audit_log_id=db.Integer, rank=db.Float).subquery()
+        return query.join(matches, AuditLog.id == matches.c.audit_log_id).order_by(
+            matches.c.rank.desc(), AuditLog.timestamp.desc(), AuditLog.id.desc()
+        )
+
+    return query.filter(AuditLog.details.contains(search)).order_by(AuditLog.timestamp.desc(), AuditLog.id.desc())
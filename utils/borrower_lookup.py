@@ -0,0 +1,106 @@
+import re
+from sqlalchemy.orm import joinedload
+from models import Student, Staff, BorrowerIdentifier, db
+
+STUDENT_ID_TYPES = ('registration_number', 'id_number', 'passport_number')
+
+def normalize_identifier(value):
+    """
+    Normalize an ID number the way it is stored in the lookup table
+
+    Card scanners and people type the same number differently, so case,
+    spaces and hyphens are ignored: "p15/1234/2023 " and "P15/1234/2023"
+    resolve to the same student.
+    """
+    if not value:
+        return ''
+    return re.sub(r'[\s\-]+', '', value).upper()
+
+def _replace_identifiers(owner_filter, rows):
+    # Bulk delete runs immediately, so re-adding an unchanged number does not
+    # collide with the row being replaced
+    BorrowerIdentifier.query.filter(owner_filter).delete(synchronize_session=False)
+    for row in rows:
+        db.session.add(BorrowerIdentifier(**row))
+
+def sync_student_identifiers(student):
+    """
+    Refresh the lookup rows of a student after it was added or edited
+
+    The student must have been flushed so that it has an ID.
+    """
+    _replace_identifiers(BorrowerIdentifier.student_id == student.id, [
+        {'value': normalize_identifier(getattr(student, id_type)), 'id_type': id_type, 'student_id': student.id}
+        for id_type in STUDENT_ID_TYPES if getattr(student, id_type)
+    ])
+
+def sync_staff_identifiers(staff):
+    """Refresh the lookup row of a staff member after it was added or edited"""
+    rows = []
+    if staff.staff_number:
+        rows.append({'value': normalize_identifier(staff.staff_number), 'id_type': 'staff_number', 'staff_id': staff.id})
+    _replace_identifiers(BorrowerIdentifier.staff_id == staff.id, rows)
+
+def rebuild_identifier_index():
+    """
+    Repopulate the lookup table from the student and staff tables
+
+    Returns:
+        Number of identifiers indexed
+    """
+    BorrowerIdentifier.query.delete(synchronize_session=False)
+
+    rows = []
+    for student in Student.query.all():
+        for id_type in STUDENT_ID_TYPES:
+            if getattr(student, id_type):
+                rows.append(BorrowerIdentifier(
+                    value=normalize_identifier(getattr(student, id_type)), id_type=id_type, student_id=student.id
+                ))
+    for staff in Staff.query.filter(Staff.staff_number.isnot(None)).all():
+        rows.append(BorrowerIdentifier(
+            value=normalize_identifier(staff.staff_number), id_type='staff_number', staff_id=staff.id
+        ))
+
+    db.session.add_all(rows)
+    return len(rows)
+
+def init_identifier_index(app):
+    """
+    Fill the lookup table on startup if it is empty but borrowers exist
+
+    Covers freshly seeded databases and databases created before the table
+    existed.
+
+    Args:
+        app: Flask application, called inside its app context
+    """
+    try:
+        if not BorrowerIdentifier.query.first() and (Student.query.first() or Staff.query.first()):
+            rebuild_identifier_index()
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.warning(f"Borrower identifier index not built: {e}")
+
+def resolve_identifier(raw):
+    """
+    Find the borrowers a scanned or typed ID number belongs to
+
+    Numbers are not unique across ID types (one student's passport number
+    may be another's national ID number), so several borrowers can match;
+    the caller picks one.
+
+    Returns:
+        List of BorrowerIdentifier with their student or staff loaded, one
+        per borrower; empty when nobody has the number
+    """
+    value = normalize_identifier(raw)
+    if not value:
+        return []
+    matches = {}
+    for match in BorrowerIdentifier.query.options(
+        joinedload(BorrowerIdentifier.student), joinedload(BorrowerIdentifier.staff)
+    ).filter_by(value=value).order_by(BorrowerIdentifier.id):
+        matches.setdefault((match.student_id, match.staff_id), match)
+    return list(matches.values())
@@ -0,0 +1,421 @@
+import csv
+import io
+import re
+import xml.etree.ElementTree as ET
+from sqlalchemy import insert, or_, update
+from sqlalchemy.exc import IntegrityError
+from models import Book, Category, db
+from utils.catalogue_search import index_books
+
+# Rows written per executemany round trip (and per commit)
+IMPORT_BATCH_SIZE = 1000
+
+# CSV header spellings accepted for each Book field
+CSV_COLUMNS = {
+    'title': ('title', 'book title'),
+    'author': ('author', 'authors', 'creator'),
+    'publisher': ('publisher',),
+    'isbn': ('isbn', 'isbn13', 'isbn10'),
+    'unique_id': ('unique_id', 'unique id', 'book id', 'accession number', 'barcode'),
+    'category': ('category', 'category name'),
+    'total_copies': ('total_copies', 'copies', 'quantity'),
+    'shelf_location': ('shelf_location', 'shelf location', 'shelf', 'location'),
+}
+
+MARC_RECORD_TERMINATOR = b'\x1d'
+MARC_FIELD_TERMINATOR = b'\x1e'
+MARC_SUBFIELD_DELIMITER = '\x1f'
+MARCXML_NS = '{http://www.loc.gov/MARC21/slim}'
+
+class CatalogueImportError(Exception):
+    """Raised when an import file cannot be read at all"""
+
+def detect_format(filename):
+    """Guess the import format from a file name: 'csv', 'marc' or 'marcxml'"""
+    name = (filename or '').lower()
+    if name.endswith(('.mrc', '.marc', '.dat')):
+        return 'marc'
+    if name.endswith('.xml'):
+        return 'marcxml'
+    return 'csv'
+
+def read_csv_records(stream):
+    """
+    Yield one dict per CSV row, keyed by Book field
+
+    Args:
+        stream: Binary file object; decoded as UTF-8 (a BOM is allowed)
+    """
+    text = io.TextIOWrapper(stream, encoding='utf-8-sig', newline='')
+    reader = csv.DictReader(text)
+    if not reader.fieldnames:
+        raise CatalogueImportError('The CSV file is empty')
+
+    headers = {name.strip().lower(): name for name in reader.fieldnames if name}
+    mapping = {}
+    for field, aliases in CSV_COLUMNS.items():
+        for alias in aliases:
+            if alias in headers:
+                mapping[field] = headers[alias]
+                break
+    if 'title' not in mapping:
+        raise CatalogueImportError('The CSV file needs a "title" column')
+
+    for row in reader:
+        yield {field: row.get(column) for field, column in mapping.items()}
+
+def _marc_record(fields):
+    """Map MARC (tag, value-or-subfields) pairs onto Book fields"""
+    def first(tag, code):
+        for field_tag, value in fields:
+            if field_tag == tag and isinstance(value, dict) and value.get(code):
+                return value[code]
+        return None
+
+    control_number = next((value for tag, value in fields if tag == '001'), None)
+    title = ' '.join(part for part in (first('245', 'a'), first('245', 'b')) if part)
+    isbn = first('020', 'a')
+
+    return {
+        'title': title.rstrip(' /:;,.'),
+        'author': (first('100', 'a') or first('110', 'a') or first('700', 'a') or '').rstrip(' ,.'),
+        'publisher': (first('264', 'b') or first('260', 'b') or '').rstrip(' ,:;'),
+        'isbn': isbn.split()[0] if isbn else None,
+        'unique_id': control_number,
+        'shelf_location': first('852', 'h'),
+    }
+
+def _subfields(data):
+    subfields = {}
+    for chunk in data.split(MARC_SUBFIELD_DELIMITER)[1:]:
+        if chunk:
+            subfields.setdefault(chunk[0], chunk[1:].strip())
+    return subfields
+
+def _marc_fields(record):
+    """(tag, value-or-subfields) pairs of one ISO 2709 record; ValueError when malformed"""
+    encoding = 'utf-8' if record[9:10] == b'a' else 'latin-1'
+    base_address = int(record[12:17])
+    if not 24 < base_address <= len(record):
+        raise ValueError(f'base address {base_address} outside the record')
+    directory = record[24:base_address - 1]
+
+    fields = []
+    for i in range(0, len(directory), 12):
+        entry = directory[i:i + 12].decode('ascii')
+        tag, field_length, start = entry[:3], int(entry[3:7]), int(entry[7:12])
+        data = record[base_address + start:base_address + start + field_length]
+        data = data.rstrip(MARC_FIELD_TERMINATOR + MARC_RECORD_TERMINATOR).decode(encoding, errors='replace')
+        fields.append((tag, data if tag < '010' else _subfields(data)))
+    return fields
+
+def read_marc_records(stream):
+    """
+    Yield one dict per MARC21 (ISO 2709) record, read one record at a time
+
+    Records flagged as Unicode in the leader are decoded as UTF-8; others
+    (MARC-8) are decoded as Latin-1, which keeps ASCII fields intact.
+    """
+    offset = 0
+    while True:
+        length_bytes = stream.read(5)
+        if not length_bytes or not length_bytes.strip():
+            return
+        try:
+            length = int(length_bytes)
+        except ValueError:
+            raise CatalogueImportError('Not a MARC21 file (bad record length)')
+        if length < 25:
+            raise CatalogueImportError(f'Malformed MARC21 record at byte {offset}: length {length} is too short')
+        record = length_bytes + stream.read(length - 5)
+        if len(record) < length:
+            raise CatalogueImportError(f'Malformed MARC21 record at byte {offset}: the file ends inside it')
+
+        try:
+            fields = _marc_fields(record)
+        except ValueError as e:
+            raise CatalogueImportError(f'Malformed MARC21 record at byte {offset}: {e}')
+        offset += length
+
+        yield _marc_record(fields)
+
+def read_marcxml_records(stream):
+    """Yield one dict per MARCXML <record>, freeing each element once read"""
+    try:
+        for _, element in ET.iterparse(stream, events=('end',)):
+            if element.tag not in (MARCXML_NS + 'record', 'record'):
+                continue
+
+            fields = []
+            for child in element:
+                tag = child.get('tag')
+                if child.tag.endswith('controlfield'):
+                    fields.append((tag, (child.text or '').strip()))
+                elif child.tag.endswith('datafield'):
+                    subfields = {}
+                    for subfield in child:
+                        subfields.setdefault(subfield.get('code'), (subfield.text or '').strip())
+                    fields.append((tag, subfields))
+            element.clear()
+
+            yield _marc_record(fields)
+    except ET.ParseError as e:
+        raise CatalogueImportError(f'Invalid MARCXML: {e}')
+
+READERS = {
+    'csv': read_csv_records,
+    'marc': read_marc_records,
+    'marcxml': read_marcxml_records,
+}
+
+def normalize_isbn(value):
+    """Strip hyphens and spaces from an ISBN; returns None when blank"""
+    if not value:
+        return None
+    isbn = re.sub(r'[\s\-]', '', value).upper()
+    return isbn or None
+
+def normalize_record(record):
+    """
+    Clean one raw record into Book column values
+
+    Returns:
+        (values, error) tuple; values is None when the record is unusable
+    """
+    def clean(field, limit):
+        value = (record.get(field) or '').strip()
+        return value[:limit]
+
+    title = clean('title', 200)
+    if not title:
+        return None, 'missing title'
+
+    isbn = normalize_isbn(record.get('isbn'))
+    if isbn and len(isbn) > 20:
+        return None, f'ISBN too long: {isbn}'
+
+    unique_id = clean('unique_id', 50) or (f'ISBN-{isbn}' if isbn else '')
+    if not unique_id:
+        return None, f'no unique ID or ISBN for "{title}"'
+
+    copies = (record.get('total_copies') or '').strip()
+    try:
+        total_copies = int(copies) if copies else 1
+    except ValueError:
+        return None, f'invalid number of copies "{copies}" for {unique_id}'
+    if total_copies < 1:
+        return None, f'invalid number of copies "{copies}" for {unique_id}'
+
+    return {
+        'title': title,
+        'author': clean('author', 200),
+        'publisher': clean('publisher', 200),
+        'isbn': isbn,
+        'unique_id': unique_id,
+        'category': clean('category', 100),
+        'total_copies': total_copies,
+        'shelf_location': clean('shelf_location', 50),
+    }, None
+
+def _keyed_on_isbn(values):
+    # Records without a unique ID are identified by their ISBN (see normalize_record)
+    return values['isbn'] is not None and values['unique_id'] == f"ISBN-{values['isbn']}"
+
+class CatalogueImporter:
+    """
+    Load a stream of catalogue records in batches
+
+    Each batch is deduplicated on unique_id (records without one join the
+    record with their ISBN), matched against existing books with one query,
+    then written with one executemany INSERT and one executemany UPDATE and
+    committed. A record whose ISBN belongs to another book is skipped and
+    reported. Only one batch is held in memory at a time.
+
+    Args:
+        add_copies (bool): For matched books, add the file's copies to the
+            existing stock (donations) instead of replacing total_copies
+        batch_size (int): Records per batch
+        progress (callable): Called with the running stats after each batch
+    """
+
+    def __init__(self, add_copies=False, batch_size=IMPORT_BATCH_SIZE, progress=None):
+        self.add_copies = add_copies
+        self.batch_size = batch_size
+        self.progress = progress
+        self.categories = {name.lower(): category_id for category_id, name in db.session.query(Category.id, Category.name)}
+        self.stats = {'read': 0, 'created': 0, 'updated': 0, 'duplicates': 0, 'skipped': 0, 'categories_created': 0}
+        self.errors = []
+
+    def _error(self, message):
+        self.stats['skipped'] += 1
+        # Keep a bounded sample for the summary
+        if len(self.errors) < 100:
+            self.errors.append(message)
+
+    def _category_id(self, name):
+        if not name:
+            return None
+        key = name.lower()
+        if key not in self.categories:
+            category = Category(name=name)
+            db.session.add(category)
+            db.session.flush()
+            self.categories[key] = category.id
+            self.stats['categories_created'] += 1
+        return self.categories[key]
+
+    def run(self, records):
+        """Import an iterable of raw record dicts; returns the stats dict"""
+        batch = {}
+        batch_isbns = {}
+
+        for record in records:
+            self.stats['read'] += 1
+            values, error = normalize_record(record)
+            if error:
+                self._error(f"Record {self.stats['read']}: {error}")
+                continue
+
+            # Later rows for the same book replace earlier ones in the batch
+            key = values['unique_id']
+            owner = batch_isbns.get(values['isbn'])
+            if owner is not None and owner != key:
+                if not _keyed_on_isbn(values):
+                    self._error(f"Record {self.stats['read']}: ISBN {values['isbn']} is already used by "
+                                f"{owner} in this file, not {key}")
+                    continue
+                key = values['unique_id'] = owner
+            if key in batch:
+                self.stats['duplicates'] += 1
+                earlier = batch[key]
+                if self.add_copies:
+                    values['total_copies'] += earlier['total_copies']
+                if earlier['isbn'] and earlier['isbn'] != values['isbn']:
+                    del batch_isbns[earlier['isbn']]
+            batch[key] = values
+            if values['isbn']:
+                batch_isbns[values['isbn']] = key
+
+            if len(batch) >= self.batch_size:
+                self._write(batch)
+                batch, batch_isbns = {}, {}
+
+        if batch:
+            self._write(batch)
+        return self.stats
+
+    def _write(self, batch):
+        records = list(batch.values())
+        unique_ids = [r['unique_id'] for r in records]
+        isbns = [r['isbn'] for r in records if r['isbn']]
+
+        existing = db.session.query(
+            Book.id, Book.unique_id, Book.isbn, Book.total_copies, Book.borrowed_count
+        ).filter(or_(Book.unique_id.in_(unique_ids), Book.isbn.in_(isbns))).all()
+        by_unique_id = {row.unique_id: row for row in existing}
+        by_isbn = {row.isbn: row for row in existing if row.isbn}
+
+        inserts, updates = [], []
+        claimed = set()
+        for record in records:
+            match = by_unique_id.get(record['unique_id'])
+            isbn_owner = by_isbn.get(record['isbn'])
+            if match is None and _keyed_on_isbn(record):
+                match = isbn_owner
+            if isbn_owner is not None and (match is None or isbn_owner.id != match.id):
+                self._error(f"ISBN {record['isbn']} belongs to {isbn_owner.unique_id}, not {record['unique_id']}")
+                continue
+            if match is not None and match.id in claimed:
+                self.stats['duplicates'] += 1
+                continue
+
+            row = {
+                'title': record['title'],
+                'author': record['author'],
+                'publisher': record['publisher'],
+                'isbn': record['isbn'],
+                'category_id': self._category_id(record['category']),
+                'total_copies': record['total_copies'],
+                'shelf_location': record['shelf_location'],
+            }
+            if match is None:
+                row.update(unique_id=record['unique_id'], borrowed_count=0)
+                inserts.append(row)
+                continue
+
+            claimed.add(match.id)
+            if self.add_copies:
+                row['total_copies'] += match.total_copies
+            # Never drop stock below the copies that are out on loan
+            row['total_copies'] = max(row['total_copies'], match.borrowed_count)
+            if not record['category']:
+                del row['category_id']
+            row['id'] = match.id
+            updates.append(row)
+
+        inserts = self._execute(insert(Book), inserts)
+        updates = self._execute(update(Book), updates)
+
+        # Refresh the full-text index for everything this batch touched
+        touched = db.session.query(
+            Book.id, Book.title, Book.author, Book.publisher, Book.isbn, Book.unique_id
+        ).filter(or_(
+            Book.unique_id.in_([r['unique_id'] for r in inserts]),
+            Book.id.in_([r['id'] for r in updates])
+        )).all()
+        index_books(touched)
+
+        db.session.commit()
+
+        self.stats['created'] += len(inserts)
+        self.stats['updated'] += len(updates)
+        if self.progress:
+            self.progress(self.stats)
+
+    def _execute(self, statement, rows):
+        """
+        Run an executemany in a savepoint, retrying row by row when a row
+        breaks a constraint (e.g. a unique ID or ISBN taken meanwhile)
+
+        Returns:
+            The rows that were written
+        """
+        if not rows:
+            return rows
+        try:
+            with db.session.begin_nested():
+                db.session.execute(statement, rows)
+            return rows
+        except IntegrityError:
+            pass
+
+        written = []
+        for row in rows:
+            try:
+                with db.session.begin_nested():
+                    db.session.execute(statement, [row])
+                written.append(row)
+            except IntegrityError as e:
+                self._error(f"\"{row['title']}\" not saved: {e.orig}")
+        return written
+
+def import_catalogue(stream, file_format='csv', add_copies=False, batch_size=IMPORT_BATCH_SIZE, progress=None):
+    """
+    Stream a CSV, MARC21 or MARCXML file into the book catalogue
+
+    Args:
+        stream: Binary file object
+        file_format (str): 'csv', 'marc' or 'marcxml'
+        add_copies (bool): Add copies to matched books instead of replacing stock
+        batch_size (int): Records per batch
+        progress (callable): Called with the running stats after each batch
+
+    Returns:
+        (stats, errors) tuple; errors is a sample of skipped-record messages
+    """
+    if file_format not in READERS:
+        raise CatalogueImportError(f'Unsupported format: {file_format}')
+
+    importer = CatalogueImporter(add_copies=add_copies, batch_size=batch_size, progress=progress)
+    importer.run(READERS[file_format](stream))
+    return importer.stats, importer.errors
@@ -0,0 +1,183 @@
+import re
+from flask import current_app
+from sqlalchemy import or_, false
+from models import Book, db
+
+# SQLite FTS5 table holding a copy of the searchable book fields. The
+# unicode61 tokenizer with remove_diacritics=2 folds pinyin tone marks so
+# that "hanyu" matches "Hànyǔ".
+FTS5_DDL = """
+CREATE VIRTUAL TABLE IF NOT EXISTS book_fts USING fts5(
+    title, author, publisher, isbn, unique_id,
+    tokenize = 'unicode61 remove_diacritics 2'
+)
+"""
+
+# PostgreSQL keeps the tsvector as a generated column, so it can never fall
+# out of step with the row it belongs to
+POSTGRES_DDL = [
+    """
+    ALTER TABLE book ADD COLUMN IF NOT EXISTS search_vector tsvector
+    GENERATED ALWAYS AS (
+        setweight(to_tsvector('simple', coalesce(title, '')), 'A') ||
+        setweight(to_tsvector('simple', coalesce(author, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(unique_id, '') || ' ' || coalesce(isbn, '')), 'B') ||
+        setweight(to_tsvector('simple', coalesce(publisher, '')), 'C')
+    ) STORED
+    """,
+    "CREATE INDEX IF NOT EXISTS ix_book_search_vector ON book USING GIN (search_vector)",
+]
+
+# Column weights for bm25(): title, author, publisher, isbn, unique_id
+FTS5_RANK = "bm25(book_fts, 10.0, 5.0, 1.0, 3.0, 3.0)"
+
+# Han, kana and hangul characters. Both full-text backends index a run of
+# them as a single token, so part of a title ("汉语" in "我学汉语 第一册")
+# could not be found through the index; such terms are matched as substrings.
+CJK_RE = re.compile(r'[\u3040-\u30ff\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff]')
+
+def init_search_index(app):
+    """
+    Create the full-text index for the configured database if needed
+
+    Sets app.config['CATALOGUE_SEARCH_BACKEND'] to 'fts5', 'postgresql' or
+    'like' (plain substring filters when no full-text support is available).
+
+    Args:
+        app: Flask application, called inside its app context
+    """
+    dialect = db.engine.dialect.name
+    backend = 'like'
+
+    try:
+        if dialect == 'sqlite':
+            exists = db.session.execute(
+                db.text("SELECT 1 FROM sqlite_master WHERE name = 'book_fts'")
+            ).first()
+            db.session.execute(db.text(FTS5_DDL))
+            if not exists:
+                rebuild_search_index()
+            backend = 'fts5'
+        elif dialect == 'postgresql':
+            for statement in POSTGRES_DDL:
+                db.session.execute(db.text(statement))
+            backend = 'postgresql'
+        db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.warning(f"Full-text catalogue search unavailable, using substring search: {e}")
+        backend = 'like'
+
+    app.config['CATALOGUE_SEARCH_BACKEND'] = backend
+
+def _backend():
+    return current_app.config.get('CATALOGUE_SEARCH_BACKEND', 'like')
+
+def rebuild_search_index():
+    """Repopulate the SQLite FTS5 table from the book table"""
+    db.session.execute(db.text("DELETE FROM book_fts"))
+    db.session.execute(db.text(
+        "INSERT INTO book_fts(rowid, title, author, publisher, isbn, unique_id) "
+        "SELECT id, title, coalesce(author, ''), coalesce(publisher, ''), "
+        "coalesce(isbn, ''), unique_id FROM book"
+    ))
+
+def index_books(books):
+    """
+    Write books to the search index inside the current transaction
+
+    The books must already be flushed so that they have IDs. On PostgreSQL
+    the generated column is maintained by the database and this is a no-op.
+
+    Args:
+        books (list): Book objects (or rows with the same columns) that were added or edited
+    """
+    if _backend() != 'fts5' or not books:
+        return
+
+    ids = [{'id': book.id} for book in books]
+    db.session.execute(db.text("DELETE FROM book_fts WHERE rowid = :id"), ids)
+    db.session.execute(db.text(
+        "INSERT INTO book_fts(rowid, title, author, publisher, isbn, unique_id) "
+        "VALUES (:id, :title, :author, :publisher, :isbn, :unique_id)"
+    ), [{
+        'id': book.id,
+        'title': book.title,
+        'author': book.author or '',
+        'publisher': book.publisher or '',
+        'isbn': book.isbn or '',
+        'unique_id': book.unique_id
+    } for book in books])
+
+def index_book(book):
+    """Write a single book to the search index (see index_books)"""
+    index_books([book])
+
+def _terms(search):
+    """Split user input into plain word tokens, dropping query syntax"""
+    return re.findall(r'\w+', search.lower())
+
+def _substring_filter(term):
+    return or_(
+        Book.title.icontains(term),
+        Book.author.icontains(term),
+        Book.publisher.icontains(term),
+        Book.isbn.icontains(term),
+        Book.unique_id.icontains(term)
+    )
+
+def search_books_query(search, query=None):
+    """
+    Restrict a Book query to books matching the search text, best match first
+
+    Every word must match (prefix matching, so "hsk" finds "HSK1-001").
+    Words containing Chinese, Japanese or Korean characters match anywhere
+    in a field, so "汉语" finds "我学汉语 第一册".
+
+    Args:
+        search (str): Text typed by the user
+        query: Book query to restrict (defaults to Book.query)
+
+    Returns:
+        Book query ordered by relevance
+    """
+    if query is None:
+        query = Book.query
+
+    terms = _terms(search)
+    if not terms:
+        return query.filter(false())
+
+    # CJK words are filtered as substrings, the rest go through the index
+    for term in terms:
+        if CJK_RE.search(term):
+            query = query.filter(_substring_filter(term))
+    terms = [term for term in terms if not CJK_RE.search(term)]
+    if not terms:
+        return query.order_by(Book.title)
+
+    backend = _backend()
+
+    if backend == 'fts5':
+        match = ' '.join(f'"{term}"*' for term in terms)
+        matches = db.text(
+            f"SELECT rowid AS book_id, {FTS5_RANK} AS rank FROM book_fts WHERE book_fts MATCH :match"
+        ).bindparams(match=match).columns(book_id=db.Integer, rank=db.Float).subquery()
+        return query.join(matches, Book.id == matches.c.book_id).order_by(matches.c.rank, Book.title)
+
+    if backend == 'postgresql':
+        tsquery = ' & '.join(f'{term}:*' for term in terms)
+        matches = db.text(
+            "SELECT id AS book_id, ts_rank(search_vector, to_tsquery('simple', :tsquery)) AS rank "
+            "FROM book WHERE search_vector @@ to_tsquery('simple', :tsquery)"
+        ).bindparams(tsquery=tsquery).columns(book_id=db.Integer, rank=db.Float).subquery()
+        return query.join(matches, Book.id == matches.c.book_id).order_by(matches.c.rank.desc(), Book.title)
+
+    return query.filter(
+        or_(
+            Book.title.contains(search),
+            Book.author.contains(search),
+            Book.isbn.contains(search),
+            Book.unique_id.contains(search)
+        )
+    ).order_by(Book.title)
@@ -0,0 +1,442 @@
+from datetime import datetime
+from sqlalchemy import func, or_, update
+from sqlalchemy.orm import joinedload
+from sqlalchemy.orm.attributes import set_committed_value
+from models import Book, Student, Staff, BorrowRecord, Fine, db
+from utils.audit_logger import build_audit_entry
+from utils.rollups import record_borrows, record_fine_payment
+
+# Maximum number of books a student may have on loan at once
+STUDENT_BORROW_LIMIT = 3
+
+# Late return fine for students, in KES per day overdue
+FINE_PER_DAY = 20
+
+# Largest number of items accepted by one batch checkout or return
+MAX_BATCH_SIZE = 50
+
+class CheckoutError(Exception):
+    """A checkout was refused; the message is suitable for showing to the user"""
+
+def lock_student_loans(student_id):
+    """
+    Lock a student row and count their open loans
+
+    The row lock (FOR UPDATE on PostgreSQL; the BEGIN IMMEDIATE write lock
+    on SQLite) keeps concurrent checkouts for the same student from both
+    passing the borrowing limit.
+
+    Args:
+        student_id (int): Borrowing student
+
+    Returns:
+        int: Number of books the student currently has on loan
+    """
+    db.session.query(Student.id).filter_by(id=student_id).with_for_update().first()
+    return BorrowRecord.query.filter_by(student_id=student_id, returned_at=None).count()
+
+def reserve_copy(book_id):
+    """
+    Take one copy of a book if any is left
+
+    Uses a conditional UPDATE (borrowed_count < total_copies) so two desks
+    can never take the last copy. Nothing is written when it fails.
+
+    Args:
+        book_id (int): Book to lend
+
+    Returns:
+        bool: False if no copies were left
+    """
+    reserved = db.session.execute(
+        update(Book)
+        .where(Book.id == book_id, Book.borrowed_count < Book.total_copies)
+        .values(borrowed_count=Book.borrowed_count + 1)
+        .execution_options(synchronize_session=False)
+    )
+    return reserved.rowcount == 1
+
+def checkout_book(book_id, student_id=None, staff_id=None, notes=''):
+    """
+    Reserve a copy of a book and create its borrow record
+
+    Must run inside begin_write_transaction(); the caller commits. Nothing
+    is written when a CheckoutError is raised.
+
+    Args:
+        book_id (int): Book to lend
+        student_id (int): Borrowing student, if any
+        staff_id (int): Borrowing staff member, if any
+        notes (str): Optional notes for the borrow record
+
+    Returns:
+        The new (flushed) BorrowRecord
+    """
+    if student_id and lock_student_loans(student_id) >= STUDENT_BORROW_LIMIT:
+        raise CheckoutError(f'Student has reached the maximum borrowing limit of {STUDENT_BORROW_LIMIT} books')
+
+    if not reserve_copy(book_id):
+        raise CheckoutError('This book is not available for borrowing')
+
+    borrow_record = BorrowRecord(
+        book_id=book_id,
+        student_id=student_id,
+        staff_id=staff_id,
+        notes=notes
+    )
+    db.session.add(borrow_record)
+    db.session.flush()
+    record_borrows([borrow_record])
+    record_borrower_activity([borrow_record])
+    return borrow_record
+
+def record_borrower_activity(borrow_records):
+    """
+    Move each borrower's last_borrowed_at forward to their newest new loan
+
+    One conditional UPDATE per borrower, so a later loan committed first
+    is never overwritten by an earlier one. Runs in the caller's transaction.
+    """
+    for model, column in ((Student, 'student_id'), (Staff, 'staff_id')):
+        latest = {}
+        for record in borrow_records:
+            borrower_id = getattr(record, column)
+            if borrower_id:
+                latest[borrower_id] = max(latest.get(borrower_id, record.borrowed_at), record.borrowed_at)
+
+        for borrower_id, borrowed_at in latest.items():
+            db.session.execute(
+                update(model)
+                .where(model.id == borrower_id,
+                       or_(model.last_borrowed_at.is_(None), model.last_borrowed_at < borrowed_at))
+                .values(last_borrowed_at=borrowed_at)
+                .execution_options(synchronize_session=False)
+            )
+
+def mark_returned(borrow_record, returned_at=None):
+    """
+    Close an open loan and release its copy, at most once
+
+    The loan is closed with a conditional UPDATE (returned_at IS NULL), so
+    two desks returning the same record cannot release the copy twice.
+
+    Args:
+        borrow_record (BorrowRecord): Loan being returned
+        returned_at (datetime): Return time (defaults to now)
+
+    Returns:
+        bool: False if the loan had already been returned
+    """
+    returned_at = returned_at or datetime.utcnow()
+    closed = db.session.execute(
+        update(BorrowRecord)
+        .where(BorrowRecord.id == borrow_record.id, BorrowRecord.returned_at.is_(None))
+        .values(returned_at=returned_at)
+        .execution_options(synchronize_session=False)
+    )
+    if closed.rowcount != 1:
+        return False
+
+    set_committed_value(borrow_record, 'returned_at', returned_at)
+    adjust_borrowed_count(borrow_record.book_id, -1)
+    return True
+
+def assess_late_fine(borrow_record):
+    """
+    Create the late return fine for a returned student loan, if it was late
+
+    Days overdue are counted up to the return time. The fine is added to
+    the session; the caller commits.
+
+    Args:
+        borrow_record (BorrowRecord): Loan that has just been returned
+
+    Returns:
+        The new Fine, or None if no fine applies
+    """
+    if not borrow_record.student_id or borrow_record.returned_at <= borrow_record.due_date:
+        return None
+
+    days_overdue = (borrow_record.returned_at - borrow_record.due_date).days
+    if days_overdue <= 0:
+        return None
+
+    fine_amount = days_overdue * FINE_PER_DAY
+    fine = Fine(
+        student_id=borrow_record.student_id,
+        borrow_record_id=borrow_record.id,
+        amount=fine_amount,
+        original_amount=fine_amount,
+        reason=f'Late return - {days_overdue} days overdue'
+    )
+    db.session.add(fine)
+    return fine
+
+def mark_fine_paid(fine, paid_at=None):
+    """
+    Mark an outstanding fine as paid, at most once
+
+    The fine is marked with a conditional UPDATE (neither paid nor waived),
+    so two submits of the same payment cannot both count it. Only the one
+    that marks it records the payment in the daily rollup and the audit
+    log. The caller commits.
+
+    Args:
+        fine (Fine): Fine being paid
+        paid_at (datetime): Payment time (defaults to now)
+
+    Returns:
+        bool: False if the fine had already been paid or waived
+    """
+    paid_at = paid_at or datetime.utcnow()
+    marked = db.session.execute(
+        update(Fine)
+        .where(Fine.id == fine.id, Fine.paid == False, Fine.waived == False)
+        .values(paid=True, paid_at=paid_at)
+        .execution_options(synchronize_session=False)
+    )
+    if marked.rowcount != 1:
+        return False
+
+    set_committed_value(fine, 'paid', True)
+    set_committed_value(fine, 'paid_at', paid_at)
+    record_fine_payment(fine)
+    db.session.add(build_audit_entry(
+        action='PAY_FINE',
+        entity_type='Fine',
+        entity_id=fine.id,
+        details={
+            'amount': fine.amount,
+            'student_id': fine.student_id,
+            'borrow_record_id': fine.borrow_record_id
+        }
+    ))
+    return True
+
+def adjust_borrowed_count(book_id, delta):
+    """
+    Adjust a book's stored open-loan counter inside the current transaction
+
+    The update is issued as ``borrowed_count = borrowed_count + delta`` so that
+    it is applied by the database rather than from a value read earlier.
+
+    Args:
+        book_id (int): ID of the book
+        delta (int): +1 for a checkout, -1 for a return
+    """
+    Book.query.filter_by(id=book_id).update(
+        {Book.borrowed_count: Book.borrowed_count + delta},
+        synchronize_session='evaluate'
+    )
+
+def find_borrowed_count_mismatches():
+    """
+    Compare each book's stored counter with its open borrow records
+
+    Returns:
+        List of (book, stored_count, actual_count) tuples for books whose
+        stored counter is out of step with borrow_record
+    """
+    open_loans = open_loan_counts(BorrowRecord.book_id)
+
+    actual = func.coalesce(open_loans.c.open_count, 0)
+    rows = db.session.query(Book, actual).outerjoin(
+        open_loans, Book.id == open_loans.c.owner_id
+    ).filter(Book.borrowed_count != actual).order_by(Book.id).all()
+
+    return [(book, book.borrowed_count, count) for book, count in rows]
+
+def repair_borrowed_counts():
+    """
+    Recompute stored counters from borrow_record for every mismatched book
+
+    Returns:
+        List of (book, old_count, new_count) tuples that were corrected
+    """
+    mismatches = find_borrowed_count_mismatches()
+
+    for book, _, actual_count in mismatches:
+        book.borrowed_count = actual_count
+
+    db.session.commit()
+    return mismatches
+
+def open_loan_counts(borrower_column):
+    """
+    Grouped subquery of open loans per borrower (or per book)
+
+    Join it with an outer join and read ``coalesce(sub.c.open_count, 0)`` to
+    get counts for many rows in the same query instead of one COUNT per row.
+
+    Args:
+        borrower_column: BorrowRecord.student_id, staff_id or book_id
+
+    Returns:
+        Subquery with columns ``owner_id`` and ``open_count``
+    """
+    return db.session.query(
+        borrower_column.label('owner_id'),
+        func.count(BorrowRecord.id).label('open_count')
+    ).filter(
+        BorrowRecord.returned_at.is_(None),
+        borrower_column.isnot(None)
+    ).group_by(borrower_column).subquery()
+
+def overdue_loans(now=None):
+    """
+    Query of open loans past their due date
+
+    Served by the partial index on open loans (due_date, id), so counting
+    or taking the most overdue rows does not scan returned loans.
+    """
+    now = now or datetime.utcnow()
+    return BorrowRecord.query.filter(BorrowRecord.returned_at.is_(None), BorrowRecord.due_date < now)
+
+def unpaid_fine_totals():
+    """
+    Grouped subquery of outstanding fine balance per student
+
+    Waived fines have their amount set to zero, so summing unpaid amounts
+    gives the same figure as Student.total_fines without loading each fine.
+
+    Returns:
+        Subquery with columns ``student_id`` and ``balance``
+    """
+    return db.session.query(
+        Fine.student_id.label('student_id'),
+        func.sum(Fine.amount).label('balance')
+    ).filter(
+        Fine.paid == False
+    ).group_by(Fine.student_id).subquery()
+
+def checkout_batch(unique_ids, borrower, notes=''):
+    """
+    Check out several books to one borrower in the current transaction
+
+    Books are looked up in one query and the student limit is checked once.
+    Records and audit entries are added to the session; the caller commits,
+    so the whole batch is persisted (or rolled back) together. Items that
+    cannot be lent are reported and skipped.
+
+    Args:
+        unique_ids (list): Book unique IDs as scanned, in order
+        borrower (Student or Staff): Who is borrowing
+        notes (str): Optional notes for every borrow record
+
+    Returns:
+        List of per-item result dicts, in the order of unique_ids
+    """
+    is_student = isinstance(borrower, Student)
+    books = {book.unique_id: book for book in Book.query.filter(Book.unique_id.in_(set(unique_ids)))}
+
+    remaining = None
+    if is_student:
+        remaining = STUDENT_BORROW_LIMIT - lock_student_loans(borrower.id)
+
+    results = []
+    created = []
+    for unique_id in unique_ids:
+        result = {'unique_id': unique_id}
+        results.append(result)
+        book = books.get(unique_id)
+
+        if book is None:
+            result.update(status='not_found', message='No book with this unique ID')
+        elif remaining is not None and remaining <= 0:
+            result.update(status='refused', message=f'Student has reached the maximum borrowing limit of {STUDENT_BORROW_LIMIT} books')
+        elif not reserve_copy(book.id):
+            result.update(status='refused', message='This book is not available for borrowing')
+        else:
+            borrow_record = BorrowRecord(
+                book_id=book.id,
+                student_id=borrower.id if is_student else None,
+                staff_id=None if is_student else borrower.id,
+                notes=notes
+            )
+            db.session.add(borrow_record)
+            created.append((result, book, borrow_record))
+            if remaining is not None:
+                remaining -= 1
+
+    # One flush inserts every record of the batch
+    db.session.flush()
+    record_borrows([borrow_record for _, _, borrow_record in created])
+    record_borrower_activity([borrow_record for _, _, borrow_record in created])
+
+    for result, book, borrow_record in created:
+        result.update(
+            status='borrowed',
+            borrow_id=borrow_record.id,
+            title=book.title,
+            due_date=borrow_record.due_date.isoformat()
+        )
+        db.session.add(build_audit_entry(
+            action='BORROW_BOOK',
+            entity_type='BorrowRecord',
+            entity_id=borrow_record.id,
+            details={
+                'book_id': book.id,
+                'book_title': book.title,
+                'borrower_type': 'Student' if is_student else 'Staff',
+                'borrower_id': borrower.id,
+                'borrower_name': borrower.name,
+                'due_date': borrow_record.due_date.isoformat(),
+                'batch': True
+            }
+        ))
+
+    return results
+
+def return_batch(borrow_ids):
+    """
+    Return several loans in the current transaction
+
+    Loans are loaded in one query; each is closed with mark_returned(),
+    fined if late, and audited. The caller commits.
+
+    Args:
+        borrow_ids (list): BorrowRecord IDs to return
+
+    Returns:
+        List of per-item result dicts, in the order of borrow_ids
+    """
+    records = {
+        record.id: record
+        for record in BorrowRecord.query.options(joinedload(BorrowRecord.book_ref)).filter(BorrowRecord.id.in_(set(borrow_ids)))
+    }
+    returned_at = datetime.utcnow()
+
+    results = []
+    for borrow_id in borrow_ids:
+        result = {'borrow_id': borrow_id}
+        results.append(result)
+        borrow_record = records.get(borrow_id)
+
+        if borrow_record is None:
+            result.update(status='not_found', message='No borrow record with this ID')
+            continue
+        if not mark_returned(borrow_record, returned_at):
+            result.update(status='refused', message='This book has already been returned')
+            continue
+
+        fine = assess_late_fine(borrow_record)
+        result.update(
+            status='returned',
+            title=borrow_record.book_ref.title,
+            fine=fine.amount if fine else 0
+        )
+        db.session.add(build_audit_entry(
+            action='RETURN_BOOK',
+            entity_type='BorrowRecord',
+            entity_id=borrow_record.id,
+            details={
+                'book_id': borrow_record.book_id,
+                'book_title': borrow_record.book_ref.title,
+                'borrower_type': borrow_record.borrower_type,
+                'borrower_id': borrow_record.student_id or borrow_record.staff_id,
+                'fine_amount': fine.amount if fine else 0,
+                'batch': True
+            }
+        ))
+
+    return results
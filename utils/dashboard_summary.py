@@ -0,0 +1,101 @@
+from datetime import datetime, timedelta
+from sqlalchemy import func
+from sqlalchemy.orm import joinedload
+from models import Student, Staff, Book, BorrowRecord, Fine, db
+from utils.circulation import overdue_loans
+from utils.email_service import get_email_statistics
+from utils.summary_cache import get_summary, store_summary, invalidate_summaries
+from utils.write_tracking import on_commit_touching
+
+DASHBOARD_CACHE_KEY = 'dashboard'
+
+# Longest a cached summary is served without any write invalidating it
+DASHBOARD_CACHE_TTL = timedelta(minutes=5)
+
+# Overdue loans listed on the dashboard (the rest are in the overdue report)
+DASHBOARD_OVERDUE_PREVIEW = 5
+
+# Writes to these tables change the numbers on the dashboard. Email
+# statistics are read from the log database on every view instead, so
+# that sending email never writes to the main database.
+DASHBOARD_TABLES = {'student', 'staff', 'book', 'borrow_record', 'fine'}
+
+def _loan_summary(borrow):
+    return {
+        'book_title': borrow.book_ref.title,
+        'borrower_type': borrow.borrower_type,
+        'borrower_name': borrow.borrower_name,
+        'borrowed_at': borrow.borrowed_at.isoformat(),
+        'due_date': borrow.due_date.isoformat(),
+    }
+
+def build_dashboard_summary():
+    """
+    Compute the dashboard figures from the database
+
+    Returns:
+        (summary, expires_at) tuple. The summary expires when the next open
+        loan becomes overdue, or after DASHBOARD_CACHE_TTL, whichever is first.
+    """
+    now = datetime.utcnow()
+    with_people = (joinedload(BorrowRecord.book_ref), joinedload(BorrowRecord.student_ref), joinedload(BorrowRecord.staff_ref))
+    open_loans = BorrowRecord.query.filter(BorrowRecord.returned_at.is_(None))
+
+    recent_borrows = BorrowRecord.query.options(*with_people).order_by(
+        BorrowRecord.borrowed_at.desc(), BorrowRecord.id.desc()
+    ).limit(5).all()
+    most_overdue = overdue_loans(now).options(*with_people).order_by(
+        BorrowRecord.due_date, BorrowRecord.id
+    ).limit(DASHBOARD_OVERDUE_PREVIEW).all()
+    next_due = db.session.query(func.min(BorrowRecord.due_date)).filter(
+        BorrowRecord.returned_at.is_(None), BorrowRecord.due_date >= now
+    ).scalar()
+
+    summary = {
+        'total_students': Student.query.count(),
+        'total_staff': Staff.query.count(),
+        'total_books': Book.query.count(),
+        'active_borrows': open_loans.count(),
+        'total_fines': db.session.query(func.sum(Fine.amount)).filter_by(paid=False).scalar() or 0,
+        'overdue_count': overdue_loans(now).count(),
+        'recent_borrows': [_loan_summary(borrow) for borrow in recent_borrows],
+        'overdue_books': [_loan_summary(borrow) for borrow in most_overdue],
+    }
+
+    expires_at = now + DASHBOARD_CACHE_TTL
+    if next_due and next_due < expires_at:
+        expires_at = next_due
+    return summary, expires_at
+
+def _with_dates(summary):
+    # JSON keeps datetimes as ISO strings; the template wants datetimes
+    now = datetime.utcnow()
+    for key in ('recent_borrows', 'overdue_books'):
+        for loan in summary[key]:
+            loan['borrowed_at'] = datetime.fromisoformat(loan['borrowed_at'])
+            loan['due_date'] = datetime.fromisoformat(loan['due_date'])
+            loan['days_overdue'] = max((now - loan['due_date']).days, 0)
+    return summary
+
+def get_dashboard_summary():
+    """
+    Dashboard figures, from the shared cache when it is fresh
+
+    A hit costs one query, plus one on the log database for the email
+    statistics. On a miss the summary is rebuilt and stored for every
+    worker process.
+    """
+    summary, generation = get_summary(DASHBOARD_CACHE_KEY)
+    if summary is None:
+        summary, expires_at = build_dashboard_summary()
+        store_summary(DASHBOARD_CACHE_KEY, generation, summary, expires_at)
+    summary = _with_dates(summary)
+    summary['email_stats'] = get_email_statistics()
+    return summary
+
+def _invalidate_dashboard(session, touched_tables):
+    invalidate_summaries(session, [DASHBOARD_CACHE_KEY])
+
+def init_dashboard_cache():
+    """Invalidate the cached dashboard whenever a transaction changes its tables"""
+    on_commit_touching(DASHBOARD_TABLES, _invalidate_dashboard)
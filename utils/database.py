@@ -0,0 +1,141 @@
+import os
+from sqlalchemy import event, insert, update
+from sqlalchemy.dialects import postgresql, sqlite
+from sqlalchemy.engine import make_url
+from models import db
+
+# How long (ms) a SQLite connection waits for the write lock before giving up
+SQLITE_BUSY_TIMEOUT = 30000
+
+def configure_engine(engine):
+    """
+    Apply dialect-specific connection settings to an engine
+
+    On SQLite, pysqlite's own implicit BEGIN is switched off and SQLAlchemy
+    emits BEGIN itself, so that a unit of work can ask for BEGIN IMMEDIATE
+    (see begin_write_transaction) and take the write lock up front. Writers
+    queue for the lock for up to SQLITE_BUSY_TIMEOUT instead of failing with
+    "database is locked" after the driver's 5 second default.
+
+    Args:
+        engine: SQLAlchemy engine created by Flask-SQLAlchemy
+    """
+    if engine.dialect.name != 'sqlite':
+        return
+
+    @event.listens_for(engine, 'connect')
+    def configure_sqlite_connection(dbapi_connection, connection_record):
+        dbapi_connection.isolation_level = None
+        dbapi_connection.execute(f'PRAGMA busy_timeout = {SQLITE_BUSY_TIMEOUT}')
+
+    @event.listens_for(engine, 'begin')
+    def emit_begin(conn):
+        mode = conn.get_execution_options().get('sqlite_begin')
+        conn.exec_driver_sql(f'BEGIN {mode}' if mode else 'BEGIN')
+
+def log_database_url(database_url):
+    """
+    Default URL of the log database (models.LOG_BIND) for a main database URL
+
+    A SQLite file gets a sibling file, e.g. library.db -> library_logs.db,
+    with its own write lock. Other databases keep the logs in the same
+    database, reached through a separate connection pool.
+    """
+    url = make_url(database_url)
+    if url.get_backend_name() != 'sqlite':
+        return database_url
+    if not url.database or url.database == ':memory:':
+        return 'sqlite://'
+    root, ext = os.path.splitext(url.database)
+    return url.set(database=f'{root}_logs{ext or ".db"}').render_as_string(hide_password=False)
+
+def begin_write_transaction(bind_key=None):
+    """
+    Start a fresh transaction that will write, taking locks as early as possible
+
+    Any read-only transaction already open on the session (for example the
+    one used to load current_user) is rolled back first. On SQLite the new
+    transaction is started with BEGIN IMMEDIATE so that concurrent writers
+    queue on the database lock instead of interleaving their reads and
+    writes. Other databases use row locks taken by the caller.
+
+    Args:
+        bind_key: Database that will be written: None for the main database,
+            models.LOG_BIND for a transaction that only writes logs. Audit
+            entries added alongside main database writes are kept in the
+            main database's outbox (see utils.audit_logger), so need no
+            other lock.
+    """
+    db.session.rollback()
+
+    engine = db.engines[bind_key]
+    if engine.dialect.name == 'sqlite':
+        db.session.connection(bind_arguments={'bind': engine}, execution_options={'sqlite_begin': 'IMMEDIATE'})
+
+def increment_counters(model, counts):
+    """
+    Add to counter columns, creating rows that do not exist yet
+
+    Uses a single INSERT ... ON CONFLICT DO UPDATE on SQLite and PostgreSQL,
+    so concurrent increments never lose updates. Runs in the caller's
+    transaction.
+
+    Args:
+        model: Model whose primary key identifies a counter row
+        counts (dict): Primary key tuple -> {counter column: amount to add}
+    """
+    if not counts:
+        return
+
+    keys = [column.name for column in model.__table__.primary_key.columns]
+    rows = [{**dict(zip(keys, key)), **values} for key, values in counts.items()]
+    counters = list(rows[0].keys() - set(keys))
+    dialect = db.session.get_bind(model).dialect.name
+
+    if dialect in ('sqlite', 'postgresql'):
+        # Single INSERT ... ON CONFLICT DO UPDATE for all rows
+        stmt = (sqlite.insert if dialect == 'sqlite' else postgresql.insert)(model).values(rows)
+        stmt = stmt.on_conflict_do_update(
+            index_elements=keys,
+            set_={name: getattr(model, name) + stmt.excluded[name] for name in counters}
+        )
+        db.session.execute(stmt)
+        return
+
+    for row in rows:
+        updated = db.session.execute(
+            update(model)
+            .where(*[getattr(model, name) == row[name] for name in keys])
+            .values({name: getattr(model, name) + row[name] for name in counters})
+        )
+        if updated.rowcount == 0:
+            db.session.execute(insert(model), [row])
+
+def insert_missing(model, rows):
+    """
+    Insert rows whose primary key does not exist yet, leaving existing rows alone
+
+    Uses INSERT ... ON CONFLICT DO NOTHING on SQLite and PostgreSQL, so
+    concurrent writers adding the same row never fail. Runs in the caller's
+    transaction.
+
+    Args:
+        model: Model whose primary key identifies a row
+        rows (list): Dicts of column values
+    """
+    if not rows:
+        return
+
+    dialect = db.session.get_bind(model).dialect.name
+    if dialect in ('sqlite', 'postgresql'):
+        stmt = (sqlite.insert if dialect == 'sqlite' else postgresql.insert)(model).values(rows)
+        db.session.execute(stmt.on_conflict_do_nothing())
+        return
+
+    keys = [column.name for column in model.__table__.primary_key.columns]
+    for row in rows:
+        exists = db.session.query(*[getattr(model, name) for name in keys]).filter(
+            *[getattr(model, name) == row[name] for name in keys]
+        ).first()
+        if exists is None:
+            db.session.execute(insert(model), [row])
@@ -4,8 +4,11 @@ from email.mime.text import MIMEText
 from email.mime.multipart import MIMEMultipart
 from datetime import datetime, timedelta
 from flask import current_app
-from models import EmailLog, NotificationPreference, BorrowRecord, Student, db
+from sqlalchemy import func
+from sqlalchemy.exc import SQLAlchemyError
+from models import EmailLog, NotificationPreference, BorrowRecord, Student, LOG_BIND, db
 from utils.audit_logger import log_action
+from utils.database import begin_write_transaction
 
 # Email service configuration
 SENDGRID_API_KEY = os.environ.get('SENDGRID_API_KEY')
@@ -84,7 +87,14 @@ def send_email(to_email, subject, body, email_type, student_id=None, borrow_reco
             status = 'failed'
             error_message = 'No email credentials configured (GMAIL_USER or SENDGRID_API_KEY required)'
         
-        # Log the email
+    except Exception as e:
+        status = 'failed'
+        error_message = str(e)
+        current_app.logger.error(f"Failed to send email: {e}")
+    
+    # Log the email and its audit entry in one transaction on the log database
+    try:
+        begin_write_transaction(LOG_BIND)
         email_log = EmailLog(
             recipient_email=to_email,
             subject=subject,
@@ -97,9 +107,8 @@ def send_email(to_email, subject, body, email_type, student_id=None, borrow_reco
         )
         
         db.session.add(email_log)
-        db.session.commit()
+        db.session.flush()
         
-        # Log action in audit trail
         log_action(
             action='SEND_EMAIL',
             entity_type='Email',
@@ -113,27 +122,12 @@ def send_email(to_email, subject, body, email_type, student_id=None, borrow_reco
                 'status': status
             }
         )
-        
-        return status == 'sent'
-        
-    except Exception as e:
-        # Log failed email
-        email_log = EmailLog(
-            recipient_email=to_email,
-            subject=subject,
-            body=body,
-            email_type=email_type,
-            student_id=student_id,
-            borrow_record_id=borrow_record_id,
-            status='failed',
-            error_message=str(e)
-        )
-        
-        db.session.add(email_log)
         db.session.commit()
-        
-        current_app.logger.error(f"Failed to send email: {e}")
-        return False
+    except SQLAlchemyError as e:
+        db.session.rollback()
+        current_app.logger.error(f"Failed to log email to {to_email}: {e}")
+    
+    return status == 'sent'
 
 def send_due_date_reminders():
     """
@@ -245,11 +239,18 @@ def get_email_statistics():
     """
     Get email sending statistics
     """
-    total_sent = EmailLog.query.filter_by(status='sent').count()
-    total_failed = EmailLog.query.filter_by(status='failed').count()
+    # One pass over ix_email_log_status_type
+    counts = {
+        (status, email_type): count for status, email_type, count in db.session.query(
+            EmailLog.status, EmailLog.email_type, func.count()
+        ).filter(EmailLog.status.in_(['sent', 'failed'])).group_by(EmailLog.status, EmailLog.email_type)
+    }
+    
+    total_sent = sum(count for (status, _), count in counts.items() if status == 'sent')
+    total_failed = sum(count for (status, _), count in counts.items() if status == 'failed')
     
-    due_reminders = EmailLog.query.filter_by(email_type='due_reminder', status='sent').count()
-    overdue_notices = EmailLog.query.filter_by(email_type='overdue_notice', status='sent').count()
+    due_reminders = counts.get(('sent', 'due_reminder'), 0)
+    overdue_notices = counts.get(('sent', 'overdue_notice'), 0)
     
     return {
         'total_sent': total_sent,
@@ -0,0 +1,145 @@
+import csv
+import io
+import json
+import zlib
+from datetime import datetime
+from sqlalchemy import case, select
+from models import Book, Category, Student, Staff, BorrowRecord, Fine, db
+
+# Rows fetched from the database per round trip, and written per chunk
+EXPORT_CHUNK_SIZE = 1000
+
+EXPORT_FORMATS = {
+    'csv': 'text/csv',
+    'ndjson': 'application/x-ndjson',
+}
+
+def _books():
+    return select(
+        Book.id, Book.unique_id, Book.isbn, Book.title, Book.author, Book.publisher,
+        Category.name.label('category'), Book.total_copies, Book.borrowed_count,
+        Book.available_copies.label('available_copies'), Book.shelf_location, Book.created_at
+    ).outerjoin(Category, Book.category_id == Category.id).order_by(Book.id)
+
+def _students():
+    return select(
+        Student.id, Student.name, Student.registration_number, Student.id_number, Student.passport_number,
+        Student.email, Student.phone, Student.membership_status, Student.created_at
+    ).order_by(Student.id)
+
+def _staff():
+    return select(
+        Staff.id, Staff.name, Staff.staff_number, Staff.staff_type, Staff.email, Staff.phone, Staff.created_at
+    ).order_by(Staff.id)
+
+def _loans():
+    return select(
+        BorrowRecord.id, BorrowRecord.book_id, Book.unique_id.label('book_unique_id'), Book.title.label('book_title'),
+        case((BorrowRecord.student_id.isnot(None), 'student'), else_='staff').label('borrower_type'),
+        BorrowRecord.student_id, BorrowRecord.staff_id,
+        case((BorrowRecord.student_id.isnot(None), Student.name), else_=Staff.name).label('borrower_name'),
+        BorrowRecord.borrowed_at, BorrowRecord.due_date, BorrowRecord.returned_at, BorrowRecord.notes
+    ).join(Book, BorrowRecord.book_id == Book.id
+    ).outerjoin(Student, BorrowRecord.student_id == Student.id
+    ).outerjoin(Staff, BorrowRecord.staff_id == Staff.id
+    ).order_by(BorrowRecord.id)
+
+def _overdue():
+    return select(
+        BorrowRecord.id, Book.unique_id.label('book_unique_id'), Book.title.label('book_title'),
+        case((BorrowRecord.student_id.isnot(None), 'student'), else_='staff').label('borrower_type'),
+        case((BorrowRecord.student_id.isnot(None), Student.name), else_=Staff.name).label('borrower_name'),
+        Student.email.label('student_email'), BorrowRecord.borrowed_at, BorrowRecord.due_date
+    ).join(Book, BorrowRecord.book_id == Book.id
+    ).outerjoin(Student, BorrowRecord.student_id == Student.id
+    ).outerjoin(Staff, BorrowRecord.staff_id == Staff.id
+    ).where(BorrowRecord.returned_at.is_(None), BorrowRecord.due_date < datetime.utcnow()
+    ).order_by(BorrowRecord.due_date, BorrowRecord.id)
+
+def _fines():
+    return select(
+        Fine.id, Fine.student_id, Student.name.label('student_name'), Fine.borrow_record_id,
+        Fine.amount, Fine.original_amount, Fine.adjustment_amount, Fine.reason,
+        Fine.paid, Fine.paid_at, Fine.waived, Fine.waived_at, Fine.waiver_reason, Fine.created_at
+    ).join(Student, Fine.student_id == Student.id).order_by(Fine.id)
+
+# Dataset name -> (label, statement builder)
+EXPORT_DATASETS = {
+    'books': ('Book Catalogue', _books),
+    'students': ('Students', _students),
+    'staff': ('Staff', _staff),
+    'loans': ('Loan History', _loans),
+    'overdue': ('Overdue Loans', _overdue),
+    'fines': ('Fines', _fines),
+}
+
+def _json_default(value):
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return str(value)
+
+def encode_rows(rows, columns, export_format):
+    """Yield CSV or NDJSON text in chunks of EXPORT_CHUNK_SIZE rows"""
+    buffer = io.StringIO()
+
+    if export_format == 'csv':
+        writer = csv.writer(buffer)
+        writer.writerow(columns)
+        write = writer.writerow
+    else:
+        def write(row):
+            buffer.write(json.dumps(dict(zip(columns, row)), default=_json_default))
+            buffer.write('\n')
+
+    for count, row in enumerate(rows, 1):
+        write(row)
+        if count % EXPORT_CHUNK_SIZE == 0:
+            yield buffer.getvalue()
+            buffer.seek(0)
+            buffer.truncate()
+
+    if buffer.tell():
+        yield buffer.getvalue()
+
+def _gzip(chunks):
+    """Compress a stream of text chunks into a gzip stream, chunk by chunk"""
+    compressor = zlib.compressobj(6, zlib.DEFLATED, 31)
+    for chunk in chunks:
+        data = compressor.compress(chunk.encode('utf-8'))
+        if data:
+            yield data
+    yield compressor.flush()
+
+def stream_export(dataset, export_format='csv', compress=False):
+    """
+    Generate an export file for a dataset without loading it into memory
+
+    Rows are read with stream_results/yield_per (a server-side cursor on
+    PostgreSQL) and encoded in chunks, so memory use stays constant however
+    many rows there are. Must be consumed inside an app context, e.g.
+    wrapped in flask.stream_with_context.
+
+    Args:
+        dataset (str): Key of EXPORT_DATASETS
+        export_format (str): 'csv' or 'ndjson'
+        compress (bool): Gzip the output
+
+    Yields:
+        str chunks, or bytes chunks when compress is True
+    """
+    _, build = EXPORT_DATASETS[dataset]
+    statement = build().execution_options(stream_results=True, yield_per=EXPORT_CHUNK_SIZE)
+
+    def chunks():
+        result = db.session.execute(statement)
+        try:
+            yield from encode_rows(result, list(result.keys()), export_format)
+        finally:
+            result.close()
+
+    return _gzip(chunks()) if compress else chunks()
+
+def export_filename(dataset, export_format, compress=False):
+    """File name for a download, e.g. loans_20251023.csv.gz"""
+    name = f"{dataset}_{datetime.utcnow().strftime('%Y%m%d')}.{export_format}"
+    return name + '.gz' if compress else name
@@ -0,0 +1,88 @@
+from datetime import datetime
+from sqlalchemy import or_, and_
+
+# Dialects that sort NULL above every value (NULLS LAST ascending, NULLS
+# FIRST descending); the others sort it below
+NULLS_SORT_HIGH = ('postgresql', 'oracle')
+
+def encode_cursor(value, row_id):
+    """Encode the sort value and ID of the last row on a page as a URL-safe cursor"""
+    # A NULL sort value is left empty
+    return f"{value.isoformat() if value is not None else ''}~{row_id}"
+
+def decode_cursor(cursor):
+    """
+    Decode a cursor made by encode_cursor
+
+    Returns:
+        (datetime, int) tuple, or None if the cursor is missing or malformed;
+        the datetime is None when the row's sort value was NULL
+    """
+    try:
+        value, row_id = cursor.rsplit('~', 1)
+        return (datetime.fromisoformat(value) if value else None), int(row_id)
+    except (AttributeError, ValueError):
+        return None
+
+def keyset_page(query, sort_column, id_column, cursor=None, per_page=50, descending=True):
+    """
+    Fetch one page of a query with keyset (seek) pagination
+
+    Instead of OFFSET, the page starts after the (sort value, id) of the last
+    row of the previous page, so every page costs the same however deep it
+    is, and an index on (sort_column, id) can serve it directly. NULL sort
+    values keep the database's own place for them, which is the one its
+    indexes are in: the smallest on SQLite and MySQL, the largest on
+    PostgreSQL and Oracle.
+
+    Args:
+        query: Query returning model objects
+        sort_column: Datetime column to order by (e.g. BorrowRecord.borrowed_at)
+        id_column: Primary key column used as the tie-breaker
+        cursor (str): Cursor of the previous page, None for the first page
+        per_page (int): Rows per page
+        descending (bool): Newest first when True
+
+    Returns:
+        (items, next_cursor) tuple; next_cursor is None on the last page
+    """
+    position = decode_cursor(cursor) if cursor else None
+
+    if descending:
+        order = (sort_column.desc(), id_column.desc())
+    else:
+        order = (sort_column.asc(), id_column.asc())
+    dialect = query.session.get_bind(mapper=sort_column.class_).dialect.name
+    nulls_first = descending == (dialect in NULLS_SORT_HIGH)
+
+    # The rows after the cursor, as consecutive runs that can each seek in
+    # the index (a single OR across the NULL boundary would scan it)
+    if not position:
+        runs = [None]
+    else:
+        value, row_id = position
+        if value is None:
+            after_nulls = and_(sort_column.is_(None), id_column < row_id if descending else id_column > row_id)
+            runs = [after_nulls, sort_column.isnot(None)] if nulls_first else [after_nulls]
+        else:
+            if descending:
+                after = or_(sort_column < value, and_(sort_column == value, id_column < row_id))
+            else:
+                after = or_(sort_column > value, and_(sort_column == value, id_column > row_id))
+            runs = [after] if nulls_first else [after, sort_column.is_(None)]
+
+    # Fetch one extra row to find out whether there is a next page
+    rows = []
+    for condition in runs:
+        run = query if condition is None else query.filter(condition)
+        rows += run.order_by(*order).limit(per_page + 1 - len(rows)).all()
+        if len(rows) > per_page:
+            break
+    items = rows[:per_page]
+
+    next_cursor = None
+    if len(rows) > per_page:
+        last = items[-1]
+        next_cursor = encode_cursor(getattr(last, sort_column.key), getattr(last, id_column.key))
+
+    return items, next_cursor
@@ -0,0 +1,215 @@
+import hashlib
+import json
+import sqlite3
+import time
+from contextlib import closing
+from functools import wraps
+from flask import current_app, request, session, make_response
+from flask.globals import request_ctx
+from flask_login import current_user
+from models import DataVersion, LogDataVersion, LOG_BIND, db
+from utils.database import increment_counters
+from utils.write_tracking import on_commit_touching
+
+# Longest a cached report is served, for reports that also depend on the clock
+REPORT_CACHE_TTL = 300  # seconds
+
+# LRU bounds; the least recently served entries are evicted beyond either
+REPORT_CACHE_MAX_ENTRIES = 500
+REPORT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+
+# Tables read by at least one cached report (filled in by @cached_report)
+_report_tables = set()
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS report_cache (
+    key TEXT PRIMARY KEY,
+    report TEXT NOT NULL,
+    content BLOB NOT NULL,
+    mimetype TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    expires_at REAL NOT NULL,
+    last_used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS ix_report_cache_last_used_at ON report_cache (last_used_at);
+CREATE TABLE IF NOT EXISTS report_cache_stats (
+    report TEXT PRIMARY KEY,
+    hits INTEGER NOT NULL DEFAULT 0,
+    misses INTEGER NOT NULL DEFAULT 0,
+    evictions INTEGER NOT NULL DEFAULT 0
+);
+"""
+
+def _connect():
+    # One short-lived connection per call; the file is shared by all workers
+    connection = sqlite3.connect(current_app.config['REPORT_CACHE_PATH'], timeout=30, isolation_level=None)
+    connection.execute('PRAGMA busy_timeout = 30000')
+    return closing(connection)
+
+def _count(connection, report, column, amount=1):
+    connection.execute(
+        f"INSERT INTO report_cache_stats (report, {column}) VALUES (?, ?) "
+        f"ON CONFLICT (report) DO UPDATE SET {column} = {column} + excluded.{column}",
+        (report, amount)
+    )
+
+def _by_version_model(tables):
+    # Versions are kept in the database that holds the table, so bumping
+    # them never takes the other database's write lock
+    log_tables = db.metadatas[LOG_BIND].tables.keys()
+    grouped = {}
+    for table in tables:
+        grouped.setdefault(LogDataVersion if table in log_tables else DataVersion, []).append(table)
+    return grouped
+
+def data_versions(tables):
+    """Current version of each table, 0 for tables never written since tracking began"""
+    versions = {}
+    for model, names in _by_version_model(tables).items():
+        versions.update(db.session.query(model.table_name, model.version).filter(model.table_name.in_(names)))
+    return {table: versions.get(table, 0) for table in sorted(tables)}
+
+def _bump_versions(session, touched):
+    for model, names in _by_version_model(touched).items():
+        increment_counters(model, {(table,): {'version': 1} for table in names})
+
+def _cache_key(report, tables, view_args):
+    parts = [
+        db.engine.url.render_as_string(hide_password=True),  # The cache file may be shared by several databases
+        report,
+        current_user.get_id(),  # Pages include the signed-in user's name
+        sorted(request.args.items(multi=True)),
+        sorted(view_args.items()),
+        data_versions(tables),
+    ]
+    return hashlib.sha256(json.dumps(parts, default=str).encode('utf-8')).hexdigest()
+
+def _lookup(report, key):
+    now = time.time()
+    with _connect() as connection:
+        connection.execute('BEGIN IMMEDIATE')
+        row = connection.execute(
+            'SELECT content, mimetype FROM report_cache WHERE key = ? AND expires_at > ?', (key, now)
+        ).fetchone()
+        if row:
+            connection.execute('UPDATE report_cache SET last_used_at = ? WHERE key = ?', (now, key))
+        _count(connection, report, 'hits' if row else 'misses')
+        connection.execute('COMMIT')
+    return row
+
+def _evict(connection):
+    count, total = connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM report_cache').fetchone()
+    if count <= REPORT_CACHE_MAX_ENTRIES and total <= REPORT_CACHE_MAX_BYTES:
+        return
+
+    kept, kept_bytes, evicted = 0, 0, []
+    for key, report, size in connection.execute(
+        'SELECT key, report, size FROM report_cache ORDER BY last_used_at DESC'
+    ).fetchall():
+        if kept < REPORT_CACHE_MAX_ENTRIES and kept_bytes + size <= REPORT_CACHE_MAX_BYTES:
+            kept += 1
+            kept_bytes += size
+        else:
+            evicted.append((key, report))
+
+    connection.executemany('DELETE FROM report_cache WHERE key = ?', [(key,) for key, _ in evicted])
+    for report in {report for _, report in evicted}:
+        _count(connection, report, 'evictions', sum(1 for _, name in evicted if name == report))
+
+def _store(report, key, content, mimetype, ttl):
+    now = time.time()
+    with _connect() as connection:
+        connection.execute('BEGIN IMMEDIATE')
+        connection.execute(
+            'INSERT OR REPLACE INTO report_cache (key, report, content, mimetype, size, expires_at, last_used_at) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?)',
+            (key, report, content, mimetype, len(content), now + ttl, now)
+        )
+        _evict(connection)
+        connection.execute('COMMIT')
+
+def cached_report(report, tables, ttl=REPORT_CACHE_TTL):
+    """
+    Serve a report view from the shared report cache
+
+    The cache key combines the report name, the signed-in user, the query
+    string and view arguments, and the current data version of every table
+    the report reads. A commit that writes to one of those tables bumps its
+    version, so the next view misses and re-runs the report; entries are
+    also dropped after ttl seconds for reports that depend on the time.
+    Only successful responses are stored, and pages with pending flash
+    messages are neither served from nor stored in the cache.
+
+    Must be applied below @login_required, and the blueprint imported
+    before init_report_cache() runs.
+
+    Args:
+        report (str): Name of the report, used in the key and hit/miss counters
+        tables (iterable): Table names the report reads
+        ttl (int): Seconds an entry may be served
+    """
+    tables = frozenset(tables)
+    _report_tables.update(tables)
+
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            if session.get('_flashes'):
+                return view(*args, **kwargs)
+
+            key = _cache_key(report, tables, kwargs)
+            try:
+                cached = _lookup(report, key)
+            except sqlite3.Error as e:
+                current_app.logger.warning(f"Report cache read failed: {e}")
+                return view(*args, **kwargs)
+            if cached:
+                response = make_response(cached[0])
+                response.mimetype = cached[1]
+                return response
+
+            response = make_response(view(*args, **kwargs))
+            if (response.status_code == 200 and not response.is_streamed
+                    and not session.get('_flashes') and not request_ctx.flashes):
+                try:
+                    _store(report, key, response.get_data(), response.mimetype, ttl)
+                except sqlite3.Error as e:
+                    current_app.logger.warning(f"Report cache write failed: {e}")
+            return response
+        return wrapper
+    return decorator
+
+def report_cache_stats():
+    """
+    Hit, miss and eviction counters per report, and the current cache size
+
+    Returns:
+        dict with 'reports' ({name: {'hits', 'misses', 'evictions'}}),
+        'entries' and 'bytes'
+    """
+    with _connect() as connection:
+        reports = {
+            report: {'hits': hits, 'misses': misses, 'evictions': evictions}
+            for report, hits, misses, evictions in connection.execute(
+                'SELECT report, hits, misses, evictions FROM report_cache_stats ORDER BY report'
+            )
+        }
+        entries, size = connection.execute('SELECT COUNT(*), COALESCE(SUM(size), 0) FROM report_cache').fetchone()
+    return {'reports': reports, 'entries': entries, 'bytes': size}
+
+def init_report_cache(app):
+    """
+    Create the report cache file and start versioning the tables reports read
+
+    Args:
+        app: Flask application, called inside its app context after the
+            blueprints are registered
+    """
+    try:
+        with _connect() as connection:
+            connection.execute('PRAGMA journal_mode = WAL')
+            connection.executescript(_SCHEMA)
+    except sqlite3.Error as e:
+        app.logger.warning(f"Report cache not available: {e}")
+
+    on_commit_touching(_report_tables, _bump_versions)
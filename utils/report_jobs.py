@@ -0,0 +1,327 @@
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+from flask import current_app
+from sqlalchemy import create_engine, func, or_, select, update
+from sqlalchemy.orm import Session
+from models import Category, Student, BorrowRecord, CategoryDailyBorrows, ReportJob, db
+from utils.audit_logger import build_audit_entry
+from utils.database import begin_write_transaction
+from utils.export import EXPORT_DATASETS, EXPORT_CHUNK_SIZE, encode_rows
+from utils.rollups import UNCATEGORIZED
+from utils.time_buckets import bucket_label
+
+# Reports generated at the same time by each web process
+REPORT_JOB_WORKERS = 2
+
+# Jobs still queued or running after this were interrupted (e.g. by a restart)
+REPORT_JOB_TIMEOUT = timedelta(hours=6)
+
+# Finished jobs and their files are deleted after this
+REPORT_JOB_RETENTION = timedelta(days=7)
+
+REPORT_JOB_FORMATS = {
+    'csv': 'text/csv',
+    'html': 'text/html',
+}
+
+# Years accepted in report parameters; anything outside is a typing error
+REPORT_YEARS = (1900, 2999)
+
+# Longest inactivity period, in months, for the inactive students report
+MAX_INACTIVE_MONTHS = 1200
+
+def _date(value):
+    return datetime.strptime(value, '%Y-%m-%d').date()
+
+def _date_parameter(value):
+    date = _date(value)
+    if not REPORT_YEARS[0] <= date.year <= REPORT_YEARS[1]:
+        raise ValueError(value)
+    return date.isoformat()
+
+def _int_parameter(low, high):
+    """Parser for a whole number between low and high inclusive"""
+    def parse(value):
+        number = int(value)
+        if not low <= number <= high:
+            raise ValueError(value)
+        return number
+    return parse
+
+def _loan_history(params):
+    statement = EXPORT_DATASETS['loans'][1]()
+    if params.get('start'):
+        statement = statement.where(BorrowRecord.borrowed_at >= _date(params['start']))
+    if params.get('end'):
+        statement = statement.where(BorrowRecord.borrowed_at < _date(params['end']) + timedelta(days=1))
+    return statement
+
+def _category_trends(params):
+    year = params['year']
+    month = bucket_label(CategoryDailyBorrows.day, 'month')
+    return select(
+        func.coalesce(Category.name, 'Uncategorized').label('category'),
+        month.label('month'),
+        func.sum(CategoryDailyBorrows.borrows).label('borrows')
+    ).outerjoin(
+        Category, CategoryDailyBorrows.category_id == Category.id
+    ).where(
+        CategoryDailyBorrows.day >= datetime(year, 1, 1).date(),
+        CategoryDailyBorrows.day <= datetime(year, 12, 31).date()
+    ).group_by(
+        CategoryDailyBorrows.category_id, Category.name, month
+    ).order_by(CategoryDailyBorrows.category_id == UNCATEGORIZED, Category.name, month)
+
+def _inactive_students(params):
+    cutoff = datetime.utcnow() - timedelta(days=30 * params['months'])
+    return select(
+        Student.id, Student.name, Student.registration_number, Student.email, Student.phone,
+        Student.membership_status, Student.created_at, Student.last_borrowed_at
+    ).where(
+        or_(Student.last_borrowed_at < cutoff, Student.last_borrowed_at.is_(None))
+    ).order_by(Student.last_borrowed_at.asc().nullsfirst(), Student.id)
+
+# Report name -> (label, statement builder, {parameter: (parser, default)})
+REPORT_JOBS = {
+    'loan_history': ('Full Loan History', _loan_history, {
+        'start': (_date_parameter, None),
+        'end': (_date_parameter, None),
+    }),
+    'category_trends': ('Category Trends by Month', _category_trends, {
+        'year': (_int_parameter(*REPORT_YEARS), lambda: datetime.utcnow().year),
+    }),
+    'inactive_students': ('Inactive Students', _inactive_students, {
+        'months': (_int_parameter(1, MAX_INACTIVE_MONTHS), 6),
+    }),
+}
+
+def parse_job_parameters(report, values):
+    """
+    Validate the parameters of a report job
+
+    Args:
+        report (str): Key of REPORT_JOBS
+        values: Mapping of submitted values, e.g. request.form
+
+    Returns:
+        dict of parameters, with defaults for those left empty
+
+    Raises:
+        ValueError: If a value cannot be parsed
+    """
+    parameters = {}
+    for name, (parse, default) in REPORT_JOBS[report][2].items():
+        value = (values.get(name) or '').strip()
+        if value:
+            try:
+                parameters[name] = parse(value)
+            except ValueError:
+                raise ValueError(f"Invalid value for {name}: {value}")
+        else:
+            parameters[name] = default() if callable(default) else default
+    return parameters
+
+def report_job_path(job):
+    """Where the result file of a job is written"""
+    return os.path.join(current_app.config['REPORT_JOB_DIR'], f"report_{job.id}.{job.file_format}")
+
+def report_job_filename(job):
+    """Download name of a job's result, e.g. loan_history_20251029_12.csv"""
+    return f"{job.report}_{job.created_at.strftime('%Y%m%d')}_{job.id}.{job.file_format}"
+
+def report_job_status(job):
+    """
+    Current state of a job, as returned by the status endpoint
+
+    Jobs left queued or running for longer than REPORT_JOB_TIMEOUT belong
+    to a process that stopped, and are reported as failed.
+    """
+    status, error = job.status, job.error
+    if status in ('queued', 'running') and job.created_at < datetime.utcnow() - REPORT_JOB_TIMEOUT:
+        status, error = 'failed', 'Interrupted before it finished'
+    return {
+        'id': job.id,
+        'report': job.report,
+        'label': REPORT_JOBS[job.report][0] if job.report in REPORT_JOBS else job.report,
+        'parameters': json.loads(job.parameters) if job.parameters else {},
+        'file_format': job.file_format,
+        'status': status,
+        'error': error,
+        'row_count': job.row_count,
+        'file_size': job.file_size,
+        'created_at': job.created_at.isoformat() if job.created_at else None,
+        'started_at': job.started_at.isoformat() if job.started_at else None,
+        'finished_at': job.finished_at.isoformat() if job.finished_at else None,
+    }
+
+@contextmanager
+def snapshot_session():
+    """
+    Read-only session that sees the database as it was when it was opened
+
+    On PostgreSQL this is a REPEATABLE READ, READ ONLY transaction, which
+    never blocks writers. SQLite readers block writers from committing for
+    as long as they read, so the database is first copied with the online
+    backup API (holding the read lock only for the copy) and the report
+    reads the copy.
+    """
+    if db.engine.dialect.name != 'sqlite':
+        with db.engine.connect() as connection:
+            connection.execution_options(isolation_level='REPEATABLE READ', postgresql_readonly=True)
+            with Session(bind=connection) as session:
+                yield session
+        return
+
+    fd, path = tempfile.mkstemp(suffix='.db', dir=current_app.config['REPORT_JOB_DIR'])
+    os.close(fd)
+    engine = None
+    try:
+        source = db.engine.raw_connection()
+        try:
+            target = sqlite3.connect(path)
+            try:
+                source.driver_connection.backup(target)
+            finally:
+                target.close()
+        finally:
+            source.close()
+
+        engine = create_engine(f'sqlite:///{path}')
+        with Session(bind=engine) as session:
+            yield session
+    finally:
+        if engine is not None:
+            engine.dispose()
+        os.remove(path)
+
+def _counted(rows, counter):
+    for row in rows:
+        counter[0] += 1
+        yield row
+
+def _write_result(report, parameters, file_format, statement, path):
+    """Write the rows of statement to path, returning the number of rows"""
+    counter = [0]
+    with snapshot_session() as session:
+        result = session.execute(statement.execution_options(stream_results=True, yield_per=EXPORT_CHUNK_SIZE))
+        columns = list(result.keys())
+        rows = _counted(result, counter)
+
+        if file_format == 'csv':
+            chunks = encode_rows(rows, columns, 'csv')
+        else:
+            chunks = current_app.jinja_env.get_template('reports/job_result.html').generate(
+                title=REPORT_JOBS[report][0],
+                parameters=parameters,
+                generated_at=datetime.utcnow(),
+                columns=columns,
+                rows=rows
+            )
+
+        with open(path, 'w', encoding='utf-8', newline='') as output:
+            for chunk in chunks:
+                output.write(chunk)
+    return counter[0]
+
+def _update_job(job_id, **values):
+    begin_write_transaction()
+    db.session.execute(update(ReportJob).where(ReportJob.id == job_id).values(**values))
+    db.session.commit()
+
+def _run_job(app, job_id):
+    with app.app_context():
+        partial = None
+        try:
+            job = db.session.get(ReportJob, job_id)
+            report, file_format, path = job.report, job.file_format, report_job_path(job)
+            parameters = json.loads(job.parameters) if job.parameters else {}
+            # Ends the read transaction; nothing below reads the main database
+            # except through the snapshot, so writers are never held up
+            _update_job(job_id, status='running', started_at=datetime.utcnow())
+
+            partial = path + '.part'
+            statement = REPORT_JOBS[report][1](parameters)
+            row_count = _write_result(report, parameters, file_format, statement, partial)
+            os.replace(partial, path)
+
+            _update_job(job_id, status='completed', finished_at=datetime.utcnow(),
+                        row_count=row_count, file_size=os.path.getsize(path))
+        except Exception as e:
+            db.session.rollback()
+            app.logger.exception(f"Report job {job_id} failed")
+            if partial and os.path.exists(partial):
+                os.remove(partial)
+            try:
+                _update_job(job_id, status='failed', finished_at=datetime.utcnow(), error=str(e))
+            except Exception:
+                db.session.rollback()
+        finally:
+            db.session.remove()
+
+_executor = None
+_executor_lock = threading.Lock()
+
+def _get_executor():
+    # Created on first use, so each (forked) web process gets its own pool
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=REPORT_JOB_WORKERS, thread_name_prefix='report-job')
+        return _executor
+
+def _purge_expired_jobs():
+    # Jobs older than REPORT_JOB_RETENTION, and their files
+    cutoff = datetime.utcnow() - REPORT_JOB_RETENTION
+    for job in ReportJob.query.filter(ReportJob.created_at < cutoff).all():
+        if os.path.exists(report_job_path(job)):
+            os.remove(report_job_path(job))
+        db.session.delete(job)
+
+def submit_report_job(report, parameters, file_format, user_id):
+    """
+    Queue a report to be generated in the background
+
+    The job row and its audit entry are committed before the work is
+    handed to the pool, so its status can be polled from any web process.
+    Jobs older than REPORT_JOB_RETENTION are deleted in the same
+    transaction.
+
+    Args:
+        report (str): Key of REPORT_JOBS
+        parameters (dict): As returned by parse_job_parameters()
+        file_format (str): Key of REPORT_JOB_FORMATS
+        user_id (int): User requesting the report
+
+    Returns:
+        ID of the new ReportJob
+    """
+    begin_write_transaction()
+    _purge_expired_jobs()
+
+    job = ReportJob(report=report, parameters=json.dumps(parameters), file_format=file_format,
+                    status='queued', requested_by=user_id)
+    db.session.add(job)
+    db.session.flush()
+    job_id = job.id
+
+    db.session.add(build_audit_entry(
+        action='REQUEST_REPORT',
+        entity_type='ReportJob',
+        entity_id=job_id,
+        details={
+            'report': report,
+            'format': file_format,
+            'parameters': parameters
+        },
+        user_id=user_id
+    ))
+    db.session.commit()
+
+    _get_executor().submit(_run_job, current_app._get_current_object(), job_id)
+    return job_id
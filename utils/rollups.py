@@ -0,0 +1,105 @@
+from collections import Counter
+from datetime import datetime
+from sqlalchemy import case, delete, func, insert, select
+from models import (Book, BorrowRecord, Fine, BookDailyBorrows, CategoryDailyBorrows,
+                    BorrowerDailyBorrows, StudentDailyBorrows, FineDailyCollections, db)
+from utils.database import increment_counters
+from utils.time_buckets import invalidate_chart_cache
+
+# Rollup tables written by this module, in rebuild order
+ROLLUP_MODELS = (BookDailyBorrows, CategoryDailyBorrows, BorrowerDailyBorrows, StudentDailyBorrows, FineDailyCollections)
+
+# Key for books without a category in CategoryDailyBorrows
+UNCATEGORIZED = 0
+
+def record_borrows(borrow_records):
+    """
+    Count new borrow records into the daily rollups
+
+    Call in the same transaction that created the (flushed) records.
+    """
+    if not borrow_records:
+        return
+
+    categories = dict(db.session.query(Book.id, Book.category_id).filter(
+        Book.id.in_({record.book_id for record in borrow_records})
+    ))
+    by_book, by_category, by_borrower, by_student = Counter(), Counter(), Counter(), Counter()
+    for record in borrow_records:
+        day = (record.borrowed_at or datetime.utcnow()).date()
+        by_book[(day, record.book_id)] += 1
+        by_category[(day, categories.get(record.book_id) or UNCATEGORIZED)] += 1
+        by_borrower[(day, 'student' if record.student_id else 'staff')] += 1
+        if record.student_id:
+            by_student[(day, record.student_id)] += 1
+
+    increment_counters(BookDailyBorrows, {key: {'borrows': n} for key, n in by_book.items()})
+    increment_counters(CategoryDailyBorrows, {key: {'borrows': n} for key, n in by_category.items()})
+    increment_counters(BorrowerDailyBorrows, {key: {'borrows': n} for key, n in by_borrower.items()})
+    increment_counters(StudentDailyBorrows, {key: {'borrows': n} for key, n in by_student.items()})
+
+def record_fine_payment(fine):
+    """Count a fine that was just marked as paid into the daily rollup"""
+    day = (fine.paid_at or datetime.utcnow()).date()
+    increment_counters(FineDailyCollections, {(day,): {'fines_paid': 1, 'amount_paid': fine.amount}})
+
+def rebuild_rollups(since=None):
+    """
+    Recompute the rollups from borrow records and fines
+
+    Used as a catch-up job after bulk loads or manual edits. Days from
+    `since` onwards are deleted and re-aggregated in the current
+    transaction, and cached chart buckets are dropped; the caller commits.
+
+    Args:
+        since (date): First day to rebuild, None for all history
+    """
+    borrowed_day = func.date(BorrowRecord.borrowed_at)
+    paid_day = func.date(Fine.paid_at)
+
+    def loans(*columns):
+        query = select(borrowed_day, *columns).select_from(BorrowRecord)
+        if since:
+            query = query.where(BorrowRecord.borrowed_at >= since)
+        return query
+
+    sources = {
+        BookDailyBorrows: loans(BorrowRecord.book_id, func.count()).group_by(borrowed_day, BorrowRecord.book_id),
+        CategoryDailyBorrows: loans(func.coalesce(Book.category_id, UNCATEGORIZED), func.count()).join(
+            Book, BorrowRecord.book_id == Book.id
+        ).group_by(borrowed_day, func.coalesce(Book.category_id, UNCATEGORIZED)),
+        BorrowerDailyBorrows: loans(
+            case((BorrowRecord.student_id.isnot(None), 'student'), else_='staff'), func.count()
+        ).group_by(borrowed_day, case((BorrowRecord.student_id.isnot(None), 'student'), else_='staff')),
+        StudentDailyBorrows: loans(BorrowRecord.student_id, func.count()).where(
+            BorrowRecord.student_id.isnot(None)
+        ).group_by(borrowed_day, BorrowRecord.student_id),
+        FineDailyCollections: select(paid_day, func.count(), func.sum(Fine.amount)).where(
+            Fine.paid == True, Fine.paid_at.isnot(None), *([Fine.paid_at >= since] if since else [])
+        ).group_by(paid_day),
+    }
+
+    for model, source in sources.items():
+        table = model.__table__
+        if since:
+            db.session.execute(delete(table).where(table.c.day >= since))
+        else:
+            db.session.execute(delete(table))
+        db.session.execute(insert(table).from_select([column.name for column in table.columns], source))
+
+    invalidate_chart_cache(db.session)
+
+def init_rollups(app):
+    """
+    Build the rollups on startup if they are empty but loans exist
+
+    Args:
+        app: Flask application, called inside its app context
+    """
+    try:
+        if not db.session.query(BookDailyBorrows.day).first() and db.session.query(BorrowRecord.id).first():
+            rebuild_rollups()
+            db.session.commit()
+    except Exception as e:
+        db.session.rollback()
+        app.logger.warning(f"Circulation rollups not built: {e}")
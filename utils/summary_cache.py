@@ -0,0 +1,109 @@
+import json
+from datetime import datetime
+from sqlalchemy import update
+from sqlalchemy.exc import IntegrityError
+from models import SummaryCache, db
+from utils.database import begin_write_transaction
+
+def get_summary(key):
+    """
+    Read a cached summary with a single query
+
+    Returns:
+        (value, generation) tuple. value is None on a miss (never built,
+        invalidated or expired); pass generation to store_summary().
+    """
+    row = db.session.query(SummaryCache.value, SummaryCache.generation, SummaryCache.expires_at).filter(
+        SummaryCache.key == key
+    ).first()
+    if row is None:
+        return None, None
+    if row.value is None or (row.expires_at and row.expires_at <= datetime.utcnow()):
+        return None, row.generation
+    return json.loads(row.value), row.generation
+
+def store_summary(key, generation, value, expires_at=None):
+    """
+    Save a freshly computed summary and commit
+
+    The row is only written if nothing invalidated it since get_summary()
+    returned generation, so a summary computed from data that changed
+    meanwhile is never stored.
+    """
+    payload = json.dumps(value, default=str)
+    try:
+        # A fresh transaction, so a read transaction is never upgraded to a write
+        begin_write_transaction()
+        if generation is None:
+            db.session.add(SummaryCache(key=key, value=payload, generation=0, expires_at=expires_at))
+        else:
+            db.session.execute(
+                update(SummaryCache)
+                .where(SummaryCache.key == key, SummaryCache.generation == generation)
+                .values(value=payload, expires_at=expires_at)
+            )
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stored it first
+        db.session.rollback()
+
+def invalidate_summaries(session, keys):
+    """Drop cached summaries inside the caller's transaction"""
+    session.execute(
+        update(SummaryCache)
+        .where(SummaryCache.key.in_(keys))
+        .values(value=None, generation=SummaryCache.generation + 1)
+    )
+
+def get_summaries(keys):
+    """
+    Read several cached summaries with a single query
+
+    Returns:
+        dict of key -> (value, generation) for the keys that have a row;
+        value is None when the row was invalidated or has expired.
+    """
+    now = datetime.utcnow()
+    rows = db.session.query(SummaryCache.key, SummaryCache.value, SummaryCache.generation, SummaryCache.expires_at).filter(
+        SummaryCache.key.in_(list(keys))
+    ).all()
+    return {
+        row.key: (
+            None if row.value is None or (row.expires_at and row.expires_at <= now) else json.loads(row.value),
+            row.generation
+        )
+        for row in rows
+    }
+
+def store_summaries(entries, expires_at=None):
+    """
+    Save several freshly computed summaries in one transaction and commit
+
+    Args:
+        entries (dict): key -> (generation, value), generation as returned
+            by get_summaries() (None for keys that had no row)
+    """
+    try:
+        begin_write_transaction()
+        for key, (generation, value) in entries.items():
+            payload = json.dumps(value, default=str)
+            if generation is None:
+                db.session.add(SummaryCache(key=key, value=payload, generation=0, expires_at=expires_at))
+            else:
+                db.session.execute(
+                    update(SummaryCache)
+                    .where(SummaryCache.key == key, SummaryCache.generation == generation)
+                    .values(value=payload, expires_at=expires_at)
+                )
+        db.session.commit()
+    except IntegrityError:
+        # Another worker stored some of them first
+        db.session.rollback()
+
+def invalidate_summary_prefix(session, prefix):
+    """Drop every cached summary whose key starts with prefix, inside the caller's transaction"""
+    session.execute(
+        update(SummaryCache)
+        .where(SummaryCache.key.startswith(prefix, autoescape=True))
+        .values(value=None, generation=SummaryCache.generation + 1)
+    )
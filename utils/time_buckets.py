@@ -0,0 +1,122 @@
+from datetime import date, datetime, timedelta
+from sqlalchemy import func
+from models import db
+from utils.summary_cache import get_summaries, store_summaries, invalidate_summary_prefix
+
+GRANULARITIES = ('day', 'week', 'month')
+
+# Summary cache keys of closed month buckets start with this
+CHART_CACHE_PREFIX = 'chart:'
+
+def bucket_label(column, granularity):
+    """
+    SQL expression labelling a date column with the bucket it falls in
+
+    Labels are the same text on every database: 'YYYY-MM-DD' for days,
+    the Monday starting the week ('YYYY-MM-DD') for weeks and 'YYYY-MM'
+    for months. SQLite uses strftime, other databases date_trunc.
+    """
+    if granularity not in GRANULARITIES:
+        raise ValueError(f"Unknown granularity: {granularity}")
+
+    if db.session.get_bind().dialect.name == 'sqlite':
+        if granularity == 'day':
+            return func.strftime('%Y-%m-%d', column)
+        if granularity == 'week':
+            # Forward to Sunday, then back to that week's Monday
+            return func.strftime('%Y-%m-%d', column, 'weekday 0', '-6 days')
+        return func.strftime('%Y-%m', column)
+
+    return func.to_char(func.date_trunc(granularity, column), 'YYYY-MM' if granularity == 'month' else 'YYYY-MM-DD')
+
+def bucket_start(day, granularity):
+    """First day of the bucket containing day"""
+    if granularity == 'week':
+        return day - timedelta(days=day.weekday())
+    if granularity == 'month':
+        return day.replace(day=1)
+    return day
+
+def _next_bucket(start, granularity):
+    if granularity == 'month':
+        return (start.replace(day=28) + timedelta(days=4)).replace(day=1)
+    return start + timedelta(days=7 if granularity == 'week' else 1)
+
+def _label(start, granularity):
+    return start.strftime('%Y-%m' if granularity == 'month' else '%Y-%m-%d')
+
+def bucket_range(start, end, granularity):
+    """
+    Labels of every bucket overlapping start..end, oldest first
+
+    Returns:
+        (labels, first_day, last_day) where first_day..last_day is the range
+        widened to whole buckets
+    """
+    labels = []
+    current = bucket_start(start, granularity)
+    first_day = current
+    while current <= end:
+        labels.append(_label(current, granularity))
+        current = _next_bucket(current, granularity)
+    return labels, first_day, current - timedelta(days=1)
+
+def _bucket_totals(model, columns, granularity, first_day, last_day):
+    """{label: [sum of each column]} for one rollup over whole buckets"""
+    bucket = bucket_label(model.day, granularity)
+    rows = db.session.query(bucket, *[func.sum(column) for column in columns]).filter(
+        model.day >= first_day, model.day <= last_day
+    ).group_by(bucket).all()
+    return {row[0]: list(row[1:]) for row in rows}
+
+def bucketed_series(name, model, columns, start, end, granularity='month'):
+    """
+    Totals of rollup columns per day, week or month, with empty buckets as zero
+
+    Buckets are whole days, weeks or months, so the range is widened to
+    bucket boundaries. Months that have ended never change again (new
+    borrows and payments are always counted today), so with month
+    granularity those buckets are kept in the summary cache and only the
+    missing and current months are queried.
+
+    Args:
+        name (str): Cache key part identifying the series, e.g. 'borrows'
+        model: Daily rollup model with a day column
+        columns (list): Columns of model to sum
+        start (date): First day of the range
+        end (date): Last day of the range
+        granularity (str): 'day', 'week' or 'month'
+
+    Returns:
+        List of (label, [totals]) tuples, oldest first
+    """
+    labels, first_day, last_day = bucket_range(start, end, granularity)
+    empty = [0] * len(columns)
+
+    if granularity != 'month':
+        totals = _bucket_totals(model, columns, granularity, first_day, last_day)
+        return [(label, totals.get(label, empty)) for label in labels]
+
+    current_month = _label(datetime.utcnow().date(), 'month')
+    keys = {label: f"{CHART_CACHE_PREFIX}{name}:{label}" for label in labels if label < current_month}
+    cached = get_summaries(keys.values())
+    totals = {label: cached[key][0] for label, key in keys.items() if key in cached and cached[key][0] is not None}
+
+    missing = [label for label in labels if label not in totals]
+    if missing:
+        query_first = date.fromisoformat(missing[0] + '-01')
+        query_last = _next_bucket(date.fromisoformat(missing[-1] + '-01'), 'month') - timedelta(days=1)
+        queried = _bucket_totals(model, columns, granularity, query_first, query_last)
+        closed = {}
+        for label in missing:
+            totals[label] = queried.get(label, empty)
+            if label in keys:
+                closed[keys[label]] = (cached.get(keys[label], (None, None))[1], totals[label])
+        if closed:
+            store_summaries(closed)
+
+    return [(label, totals[label]) for label in labels]
+
+def invalidate_chart_cache(session):
+    """Drop cached month buckets, e.g. after the rollups were rebuilt"""
+    invalidate_summary_prefix(session, CHART_CACHE_PREFIX)
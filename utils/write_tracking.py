@@ -0,0 +1,63 @@
+from sqlalchemy import event
+from sqlalchemy.orm import Session
+
+# Callbacks run just before a commit that wrote to one of their tables:
+# list of (tables, callback(session, touched_tables))
+_commit_hooks = []
+
+def on_commit_touching(tables, callback):
+    """
+    Run callback inside any transaction that writes to one of the tables
+
+    The callback runs in before_commit, after the final flush, so anything
+    it writes is committed atomically with the change that triggered it.
+
+    Args:
+        tables (iterable): Table names, e.g. {'borrow_record', 'fine'}
+        callback (callable): Called with (session, touched_tables)
+    """
+    hook = (frozenset(tables), callback)
+    if hook not in _commit_hooks:
+        _commit_hooks.append(hook)
+
+def _touched(session):
+    return session.info.setdefault('touched_tables', set())
+
+def _track_flush(session, flush_context, instances):
+    # Objects written through the unit of work (add / attribute change / delete)
+    touched = _touched(session)
+    for obj in list(session.new) + list(session.dirty) + list(session.deleted):
+        table = getattr(obj, '__table__', None)
+        if table is not None:
+            touched.add(table.name)
+
+def _track_statement(orm_execute_state):
+    # Bulk and conditional INSERT / UPDATE / DELETE run with session.execute()
+    if orm_execute_state.is_insert or orm_execute_state.is_update or orm_execute_state.is_delete:
+        table = getattr(orm_execute_state.statement, 'table', None)
+        if table is not None and getattr(table, 'name', None):
+            _touched(orm_execute_state.session).add(table.name)
+
+def _run_commit_hooks(session):
+    # Flush first so that objects still pending at commit time are tracked
+    session.flush()
+    touched = session.info.get('touched_tables')
+    if not touched:
+        return
+    for tables, callback in _commit_hooks:
+        if tables & touched:
+            callback(session, touched & tables)
+    session.flush()
+
+def _reset(session, *args):
+    session.info.pop('touched_tables', None)
+
+def init_write_tracking():
+    """Register the session events that record which tables a transaction wrote"""
+    if event.contains(Session, 'before_commit', _run_commit_hooks):
+        return
+    event.listen(Session, 'before_flush', _track_flush)
+    event.listen(Session, 'do_orm_execute', _track_statement)
+    event.listen(Session, 'before_commit', _run_commit_hooks)
+    event.listen(Session, 'after_commit', _reset)
+    event.listen(Session, 'after_rollback', _reset)